@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# README中的两个census tract级数据集 (可在main中通过参数指定其他路径)
+POPULATION_CSV = '2023_Population_and_Poverty_by_Split_Tract.csv'
+EDUCATION_CSV = 'Bachelors_Degree_or_Higher_Census_Tract.csv'
+
+# 人口数据中按CT20汇总的计数列 (分割区域直接相加); 密度和贫困率由汇总后的计数重新计算
+POPULATION_SUMS = {'POP23_TOTAL': 'population', 'POV23_TOTAL': 'poverty_population', 'AREA_SQMil': 'area_sq_miles'}
+
+# 追加到统计表的列
+ENRICHMENT_COLUMNS = ['population', 'poverty_population', 'area_sq_miles', 'population_density',
+                      'poverty_percent', 'bachelors_percent', 'rate_per_1000', 'crimes_per_sq_mile',
+                      'poverty_adjusted_rate_per_1000']
+
+def normalize_tract_ids(values):
+    """
+    Canonical 6-digit CT20 strings from the tract keys used by the source tables.
+
+    Accepts CT20 codes (possibly read as integers, e.g. 101110), tract
+    labels ('1011.10', '1011.1', '1012') and 11-digit GEOIDs
+    ('06037101110', or 6037101110 when read as an integer).
+    Unrecognised keys become ''.
+    """
+    text = pd.Series(np.asarray(values, dtype=object)).astype(str).str.strip()
+    # 整数列含空值时会被读成浮点数
+    text = text.where(~text.str.fullmatch(r'\d{5,11}\.0'), text.str[:-2])
+    labels = text.str.fullmatch(r'\d{1,4}(\.\d{1,2})?')
+    whole = text.str.split('.', n=1).str[0]
+    fraction = text.str.split('.', n=1).str[1].fillna('')
+    result = np.where(labels, whole.str.zfill(4) + fraction.str.ljust(2, '0'), '')
+    result = np.where(text.str.fullmatch(r'\d{5,6}'), text.str.zfill(6), result)
+    result = np.where(text.str.fullmatch(r'\d{10,11}'), text.str[-6:], result)
+    return result.astype(str)
+
+class TractEnrichment:
+    """
+    Tract-level census attributes aligned to a canonical tract index.
+
+    Each table is keyed to the tract index once (Index.get_indexer on the
+    normalized CT20); every attribute is then a float64 array in tract
+    order, NaN where a tract has no data. Split-tract rows of the population
+    table are summed per CT20 with np.bincount, and density and poverty
+    percentage are recomputed from the summed counts instead of averaging
+    the per-split ratios. Statistics tables are enriched with one indexer
+    lookup and array arithmetic, without string-keyed merges.
+
+    Parameters:
+    -----------
+    tract_ids : array-like of str
+        Canonical census tract IDs (CT20), defines the tract index
+    """
+
+    def __init__(self, tract_ids):
+        self.tract_ids = np.asarray(tract_ids, dtype=str)
+        self._tract_index = pd.Index(self.tract_ids)
+        self.layers = {}
+
+    def _positions(self, keys):
+        """源表中每一行对应的tract下标, 未知tract为-1"""
+        return self._tract_index.get_indexer(normalize_tract_ids(keys))
+
+    def _sum_by_tract(self, positions, values):
+        """按tract下标求和, 没有数据的tract为NaN"""
+        keep = (positions >= 0) & ~np.isnan(values)
+        n = len(self.tract_ids)
+        sums = np.bincount(positions[keep], weights=values[keep], minlength=n)
+        counts = np.bincount(positions[keep], minlength=n)
+        return np.where(counts > 0, sums, np.nan), counts
+
+    def add_population(self, population_df):
+        """
+        Add the population/poverty layer (README Population dataset).
+
+        Parameters:
+        -----------
+        population_df : pandas.DataFrame
+            Split-tract rows with CT20, POP23_TOTAL, POV23_TOTAL and AREA_SQMil
+
+        Returns:
+        --------
+        int
+            Number of tracts with population data
+        """
+        positions = self._positions(population_df['CT20'])
+        for column, name in POPULATION_SUMS.items():
+            values = pd.to_numeric(population_df[column], errors='coerce').to_numpy(np.float64)
+            self.layers[name], counts = self._sum_by_tract(positions, values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            population = self.layers['population']
+            self.layers['population_density'] = np.where(self.layers['area_sq_miles'] > 0,
+                                                         population / self.layers['area_sq_miles'], np.nan)
+            self.layers['poverty_percent'] = np.where(population > 0,
+                                                      self.layers['poverty_population'] / population * 100, np.nan)
+        unmatched = int((positions < 0).sum())
+        if unmatched:
+            print(f"人口数据中有 {unmatched} 行不属于当前census tract, 已忽略")
+        return int((counts > 0).sum())
+
+    def add_education(self, education_df):
+        """
+        Add the education layer (README Education dataset).
+
+        Parameters:
+        -----------
+        education_df : pandas.DataFrame
+            Rows with tract and bachelors (percent of population 25+)
+
+        Returns:
+        --------
+        int
+            Number of tracts with education data
+        """
+        positions = self._positions(education_df['tract'])
+        values = pd.to_numeric(education_df['bachelors'], errors='coerce').to_numpy(np.float64)
+        sums, counts = self._sum_by_tract(positions, values)
+        # 同一tract出现多行时取平均
+        self.layers['bachelors_percent'] = sums / np.maximum(counts, 1)
+        return int((counts > 0).sum())
+
+    @classmethod
+    def from_files(cls, tract_ids, population_path=POPULATION_CSV, education_path=EDUCATION_CSV):
+        """
+        Load whichever of the population and education CSVs exist.
+
+        Returns:
+        --------
+        TractEnrichment or None
+            None when neither file is found
+        """
+        enrichment = cls(tract_ids)
+        if population_path and os.path.exists(population_path):
+            population_df = pd.read_csv(population_path, usecols=['CT20'] + list(POPULATION_SUMS),
+                                        dtype={'CT20': str})
+            print(f"人口数据: {enrichment.add_population(population_df)} 个census tract")
+        if education_path and os.path.exists(education_path):
+            education_df = pd.read_csv(education_path, usecols=['tract', 'bachelors'], dtype={'tract': str})
+            print(f"教育数据: {enrichment.add_education(education_df)} 个census tract")
+        return enrichment if enrichment.layers else None
+
+    def column(self, name):
+        """一个属性在tract顺序下的数组, 未加载的图层为全NaN"""
+        return self.layers.get(name, np.full(len(self.tract_ids), np.nan))
+
+    def enrich(self, stats_df):
+        """
+        Append census attributes and derived rates to a statistics table.
+
+        Derived columns:
+        rate_per_1000 = total_crimes / population * 1000;
+        crimes_per_sq_mile = total_crimes / area_sq_miles;
+        poverty_adjusted_rate_per_1000 = rate_per_1000 divided by the
+        tract's poverty percentage relative to the citywide percentage
+        (population-weighted over the tracts in the table), so tracts are
+        compared at equal poverty levels.
+
+        Parameters:
+        -----------
+        stats_df : pandas.DataFrame
+            Table with census_tract_id and total_crimes (CrimeStatistics.to_frame schema)
+
+        Returns:
+        --------
+        pandas.DataFrame
+            Copy of stats_df with ENRICHMENT_COLUMNS appended
+        """
+        positions = self._positions(stats_df['census_tract_id'])
+        found = positions >= 0
+        take = np.maximum(positions, 0)
+
+        def aligned(name):
+            return np.where(found, self.column(name)[take], np.nan)
+
+        enriched = stats_df.copy()
+        for name in ENRICHMENT_COLUMNS[:6]:
+            enriched[name] = aligned(name)
+
+        total = enriched['total_crimes'].to_numpy(np.float64)
+        population = enriched['population'].to_numpy()
+        poverty = enriched['poverty_population'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(population > 0, total / population * 1000, np.nan)
+            area = enriched['area_sq_miles'].to_numpy()
+            enriched['rate_per_1000'] = rate
+            enriched['crimes_per_sq_mile'] = np.where(area > 0, total / area, np.nan)
+            known = (population > 0) & ~np.isnan(poverty)
+            citywide = poverty[known].sum() / population[known].sum() if known.any() else np.nan
+            relative = enriched['poverty_percent'].to_numpy() / 100 / citywide
+            enriched['poverty_adjusted_rate_per_1000'] = np.where(relative > 0, rate / relative, np.nan)
+        return enriched
@@ -0,0 +1,266 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from CensusTractLoader import load_tracts
+from CoordinatetoCensusTract import TractLocator, SNAP_CRS
+
+# 网格单元取值: >=0 为tract行号, 以下为特殊标记
+OUTSIDE_CELL = -1
+BOUNDARY_CELL = -2
+
+# 网格所在的投影坐标系: 与吸附相同的UTM 11N, cell_size单位为米
+# (shapefile原始的Web Mercator单位在洛杉矶纬度只相当于约0.83米)
+GRID_CRS = SNAP_CRS
+
+def _grid_locator(shapefile_path='LA_City_2020_Census_Tracts_.shp', tracts=None):
+    """建网格用的TractLocator, tract多边形投影到GRID_CRS"""
+    if tracts is None:
+        return TractLocator(load_tracts(shapefile_path, crs=GRID_CRS))
+    return TractLocator(tracts if tracts.crs == GRID_CRS else tracts.to_crs(GRID_CRS))
+
+def tracts_signature(tracts):
+    """
+    Identifies the polygons a grid was built from.
+
+    SHA1 of the tract IDs plus vertex count, total area and total perimeter;
+    the sums are compared with a relative tolerance so the same tracts read
+    through another CRS round trip (e.g. the cached WGS84 copy) still match.
+    """
+    geometries = tracts.geometry.to_numpy()
+    return {
+        'tract_ids': hashlib.sha1('\n'.join(np.asarray(tracts['CT20'], dtype=str)).encode()).hexdigest(),
+        'vertex_count': int(shapely.get_num_coordinates(geometries).sum()),
+        'area': float(shapely.area(geometries).sum()),
+        'length': float(shapely.length(geometries).sum()),
+    }
+
+def _same_tracts(saved, current):
+    """两个tracts_signature是否对应同一组多边形"""
+    if saved is None:
+        return False
+    return (saved['tract_ids'] == current['tract_ids'] and saved['vertex_count'] == current['vertex_count']
+            and math.isclose(saved['area'], current['area'], rel_tol=1e-9)
+            and math.isclose(saved['length'], current['length'], rel_tol=1e-9))
+
+class TractGrid:
+    """
+    Rasterized census tract lookup grid.
+
+    Each cell over the tract bounding box stores the row position of the
+    single tract that fully contains it, OUTSIDE_CELL when it touches no
+    tract, or BOUNDARY_CELL when it straddles a tract border. Points in
+    single-tract cells resolve with one array index; only points in boundary
+    cells fall back to the exact polygon test of the TractLocator.
+
+    Parameters:
+    -----------
+    grid : numpy.ndarray
+        int16 cell values, shape (rows, cols), row 0 at the bottom (min y)
+    origin : tuple of float
+        (min x, min y) of the grid in the tract CRS
+    cell_size : float
+        Cell edge length in GRID_CRS units (metres)
+    locator : TractLocator
+        Locator used for boundary cells and tract attributes
+    """
+
+    def __init__(self, grid, origin, cell_size, locator):
+        self.grid = grid
+        self.origin = origin
+        self.cell_size = cell_size
+        self.locator = locator
+        self.ct20 = locator.ct20
+        self.labels = locator.labels
+
+    @classmethod
+    def build(cls, locator, cell_size=100.0):
+        """Rasterize the locator's tract polygons into a lookup grid"""
+        min_x, min_y, max_x, max_y = shapely.total_bounds(locator.geometries)
+        cols = int(np.ceil((max_x - min_x) / cell_size))
+        rows = int(np.ceil((max_y - min_y) / cell_size))
+
+        # 所有网格单元的矩形, 行优先
+        xs = min_x + np.arange(cols) * cell_size
+        ys = min_y + np.arange(rows) * cell_size
+        cell_x, cell_y = np.meshgrid(xs, ys)
+        cell_x, cell_y = cell_x.ravel(), cell_y.ravel()
+        boxes = shapely.box(cell_x, cell_y, cell_x + cell_size, cell_y + cell_size)
+
+        # 与几个tract相交
+        cell_idx, _ = locator.tree.query(boxes, predicate='intersects')
+        touching = np.bincount(cell_idx, minlength=len(boxes))
+
+        # 完全落在某个tract内部
+        cell_idx, tract_idx = locator.tree.query(boxes, predicate='within')
+
+        grid = np.full(len(boxes), BOUNDARY_CELL, dtype=np.int16)
+        grid[touching == 0] = OUTSIDE_CELL
+        inside = touching[cell_idx] == 1
+        grid[cell_idx[inside]] = tract_idx[inside]
+        return cls(grid.reshape(rows, cols), (float(min_x), float(min_y)), float(cell_size), locator)
+
+    def save(self, grid_path):
+        """Save the grid as a .npy file plus a .json sidecar with its georeference"""
+        np.save(grid_path, self.grid)
+        meta = {
+            'origin': list(self.origin),
+            'cell_size': self.cell_size,
+            'shape': list(self.grid.shape),
+            'crs': self.locator.tracts.crs.to_string(),
+            'tract_count': len(self.locator.tracts),
+            'tracts': tracts_signature(self.locator.tracts),
+        }
+        with open(grid_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    @staticmethod
+    def stale_reason(grid_path, locator, cell_size=None):
+        """Why a saved grid does not match the locator's tracts (or cell_size), None when it does"""
+        with open(grid_path + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if cell_size is not None and meta['cell_size'] != float(cell_size):
+            return f"cell size {meta['cell_size']} != {float(cell_size)}"
+        if meta.get('crs') != locator.tracts.crs.to_string():
+            return f"CRS {meta.get('crs')} != {locator.tracts.crs.to_string()}"
+        if not _same_tracts(meta.get('tracts'), tracts_signature(locator.tracts)):
+            return "tract polygons changed"
+        return None
+
+    @classmethod
+    def load(cls, grid_path, locator):
+        """Memory-map a saved grid, raising ValueError if it was built from other tracts"""
+        reason = cls.stale_reason(grid_path, locator)
+        if reason is not None:
+            raise ValueError(f"{grid_path} does not match the tracts: {reason}")
+        with open(grid_path + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        grid = np.load(grid_path, mmap_mode='r')
+        return cls(grid, tuple(meta['origin']), meta['cell_size'], locator)
+
+    def locate_indices(self, latitudes, longitudes):
+        """
+        Vectorized point-in-tract lookup, same contract as TractLocator.locate_indices.
+
+        Returns:
+        --------
+        numpy.ndarray
+            int32 tract row positions, -1 where no tract contains the point
+        """
+        x, y = self.locator.transformer.transform(
+            np.asarray(longitudes, dtype=np.float64),
+            np.asarray(latitudes, dtype=np.float64),
+        )
+        return self.locate_projected(x, y)
+
+    def locate_projected(self, x, y):
+        """Same as locate_indices, for coordinates already in the tract CRS"""
+        rows, cols = self.grid.shape
+        col = np.floor((x - self.origin[0]) / self.cell_size)
+        row = np.floor((y - self.origin[1]) / self.cell_size)
+        # NaN坐标比较结果为False, 同样视为网格外
+        in_grid = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+
+        indices = np.full(len(x), OUTSIDE_CELL, dtype=np.int32)
+        indices[in_grid] = self.grid[row[in_grid].astype(np.intp), col[in_grid].astype(np.intp)]
+
+        # 边界单元回退到精确的多边形判断
+        boundary = np.flatnonzero(indices == BOUNDARY_CELL)
+        if len(boundary):
+            indices[boundary] = self.locator.locate_projected(x[boundary], y[boundary])
+        return indices
+
+    def prepare_snapping(self):
+        """Build the locator's metric snapping index (see TractLocator.prepare_snapping)"""
+        return self.locator.prepare_snapping()
+
+    def snap_indices(self, latitudes, longitudes, max_distance):
+        """Nearest tract within max_distance metres, same contract as TractLocator.snap_indices"""
+        return self.locator.snap_indices(latitudes, longitudes, max_distance)
+
+    def attributes(self, indices):
+        """Maps tract row positions (-1 for misses) to aligned (CT20, LABEL) arrays"""
+        return self.locator.attributes(indices)
+
+def load_tract_grid(grid_path='LA_City_2020_Census_Tracts_grid.npy', shapefile_path='LA_City_2020_Census_Tracts_.shp', cell_size=100.0, tracts=None):
+    """
+    Load a saved tract grid, (re)building and saving it first if it is missing or stale.
+
+    The grid is rebuilt when its sidecar records another cell size, CRS or
+    tract signature (tracts_signature), e.g. after the shapefile was edited.
+    The grid is built in GRID_CRS (UTM 11N), so cell_size is in metres.
+
+    Parameters:
+    -----------
+    tracts : geopandas.GeoDataFrame, optional
+        Tract polygons to index (e.g. the tracts given to process_crime_data),
+        projected to GRID_CRS. Defaults to the shapefile.
+    """
+    locator = _grid_locator(shapefile_path, tracts)
+    if os.path.exists(grid_path) and os.path.exists(grid_path + '.json'):
+        reason = TractGrid.stale_reason(grid_path, locator, cell_size)
+        if reason is None:
+            return TractGrid.load(grid_path, locator)
+        print(f"tract查找网格已过期 ({reason}), 重新生成")
+
+    print(f"生成tract查找网格 (单元大小 {cell_size})...")
+    grid = TractGrid.build(locator, cell_size=cell_size)
+    grid.save(grid_path)
+    boundary_share = (grid.grid == BOUNDARY_CELL).mean() * 100
+    print(f"网格已保存至 {grid_path}: {grid.grid.shape[0]}x{grid.grid.shape[1]}, 边界单元占 {boundary_share:.1f}%")
+    return TractGrid.load(grid_path, locator)
+
+def benchmark(point_count=200000, cell_size=100.0, shapefile_path='LA_City_2020_Census_Tracts_.shp', seed=0):
+    """Compare the lookup grid against the gpd.sjoin path and the plain TractLocator"""
+    locator = _grid_locator(shapefile_path)
+
+    start = time.perf_counter()
+    grid = TractGrid.build(locator, cell_size=cell_size)
+    build_time = time.perf_counter() - start
+    grid_path = f"LA_City_2020_Census_Tracts_grid_{int(cell_size)}.npy"
+    grid.save(grid_path)
+    grid = TractGrid.load(grid_path, locator)
+
+    # 在tract范围内随机取点 (WGS84)
+    tracts_wgs84 = locator.tracts.to_crs("EPSG:4326")
+    min_lon, min_lat, max_lon, max_lat = tracts_wgs84.total_bounds
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(min_lat, max_lat, point_count)
+    lons = rng.uniform(min_lon, max_lon, point_count)
+
+    # process_crime_data原来的路径: 逐点构造Point + gpd.sjoin
+    start = time.perf_counter()
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lons, lats), crs="EPSG:4326")
+    joined = gpd.sjoin(points, tracts_wgs84, how="left", predicate="within")
+    joined = joined[~joined.index.duplicated()]
+    sjoin_time = time.perf_counter() - start
+    sjoin_idx = joined['index_right'].fillna(-1).to_numpy(dtype=np.int32)
+
+    start = time.perf_counter()
+    locator_idx = locator.locate_indices(lats, lons)
+    locator_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    grid_idx = grid.locate_indices(lats, lons)
+    grid_time = time.perf_counter() - start
+
+    print(f"网格: {grid.grid.shape[0]}x{grid.grid.shape[1]}, 单元大小 {cell_size}, 构建耗时 {build_time:.2f}秒")
+    print(f"边界单元占比: {(np.asarray(grid.grid) == BOUNDARY_CELL).mean() * 100:.1f}%")
+    for name, elapsed in [('gpd.sjoin', sjoin_time), ('TractLocator', locator_time), ('TractGrid', grid_time)]:
+        print(f"{name:>12}: {elapsed:.3f}秒 ({point_count / elapsed:,.0f} 点/秒)")
+    print(f"与sjoin结果一致: {(grid_idx == sjoin_idx).mean() * 100:.3f}%")
+    print(f"与TractLocator结果一致: {(grid_idx == locator_idx).mean() * 100:.3f}%")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and benchmark the census tract lookup grid")
+    parser.add_argument('--cell-size', type=float, default=100.0, help="cell size in metres (GRID_CRS)")
+    parser.add_argument('--points', type=int, default=200000, help="number of random points for the benchmark")
+    args = parser.parse_args()
+    benchmark(point_count=args.points, cell_size=args.cell_size)
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import time
+
+import geopandas as gpd
+import shapely
+from pyproj import CRS
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    # 没有安装pyarrow时不使用缓存
+    pq = None
+
+# shapefile的组成文件, 任一变化都会使缓存失效
+SHAPEFILE_PARTS = ['.shp', '.dbf', '.shx', '.prj', '.cpg']
+
+def shapefile_hash(shapefile_path):
+    """SHA1 over the shapefile's component files, used as the cache key"""
+    base, _ = os.path.splitext(shapefile_path)
+    digest = hashlib.sha1()
+    for ext in SHAPEFILE_PARTS:
+        part = base + ext
+        if not os.path.exists(part):
+            continue
+        digest.update(ext.encode())
+        with open(part, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def _cache_path(shapefile_path, crs, cache_dir):
+    """缓存文件名: 原文件名 + 内容哈希 + 坐标系"""
+    stem = os.path.splitext(os.path.basename(shapefile_path))[0]
+    crs_tag = 'native' if crs is None else str(crs).replace(':', '_')
+    return os.path.join(cache_dir, f"{stem}.{shapefile_hash(shapefile_path)[:16]}.{crs_tag}.parquet")
+
+def _prepare_tracts(shapefile_path, crs):
+    """读取shapefile, 修复无效几何, 转换坐标系并计算外包矩形"""
+    # 设置环境变量来恢复/创建缺失的.shx文件
+    os.environ['SHAPE_RESTORE_SHX'] = 'YES'
+    tracts = gpd.read_file(shapefile_path)
+
+    invalid = ~tracts.geometry.is_valid
+    if invalid.any():
+        tracts.loc[invalid, 'geometry'] = shapely.make_valid(tracts.geometry[invalid].to_numpy())
+
+    if crs is not None and tracts.crs and tracts.crs != crs:
+        tracts = tracts.to_crs(crs)
+
+    bounds = shapely.bounds(tracts.geometry.to_numpy())
+    for i, name in enumerate(['bbox_minx', 'bbox_miny', 'bbox_maxx', 'bbox_maxy']):
+        tracts[name] = bounds[:, i]
+    return tracts
+
+def _read_cache(cache_path):
+    """读取GeoParquet缓存
+
+    直接用pyarrow读表并解码WKB; 坐标系优先使用PROJJSON中的EPSG编号,
+    比让pyproj完整解析PROJJSON快一个数量级
+    """
+    table = pq.read_table(cache_path)
+    geo = json.loads(table.schema.metadata[b'geo'])
+    crs = geo['columns']['geometry'].get('crs')
+    if crs is not None:
+        crs_id = crs.get('id', {})
+        if 'authority' in crs_id and 'code' in crs_id:
+            crs = f"{crs_id['authority']}:{crs_id['code']}"
+        else:
+            crs = CRS.from_json_dict(crs)
+    geometry = shapely.from_wkb(table.column('geometry').to_numpy())
+    attributes = table.drop(['geometry']).to_pandas()
+    tracts = gpd.GeoDataFrame(attributes, geometry=geometry, crs=crs)
+    return tracts[table.column_names]
+
+def load_tracts(shapefile_path='LA_City_2020_Census_Tracts_.shp', crs="EPSG:4326", cache_dir='.tract_cache'):
+    """
+    Load census tract polygons through a GeoParquet cache.
+
+    The first call reads the shapefile, repairs invalid geometries, reprojects
+    and adds bounding box columns, then writes the result as GeoParquet
+    (WKB geometry) keyed by the shapefile's hash. Later calls, in any process,
+    read the cache instead of re-parsing the DBF/SHP and reprojecting.
+
+    Parameters:
+    -----------
+    shapefile_path : str
+        Path to the census tract shapefile
+    crs : str or None
+        Target CRS, None to keep the shapefile's own CRS
+    cache_dir : str
+        Directory for cache files
+
+    Returns:
+    --------
+    geopandas.GeoDataFrame
+        Tract polygons with the shapefile attributes (CT20, LABEL, ...) and
+        bbox_minx/bbox_miny/bbox_maxx/bbox_maxy columns
+    """
+    if pq is None:
+        return _prepare_tracts(shapefile_path, crs)
+
+    cache_path = _cache_path(shapefile_path, crs, cache_dir)
+    if os.path.exists(cache_path):
+        return _read_cache(cache_path)
+
+    tracts = _prepare_tracts(shapefile_path, crs)
+    os.makedirs(cache_dir, exist_ok=True)
+    # 先写临时文件再改名, 避免并发进程读到写了一半的缓存
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    tracts.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return tracts
+
+if __name__ == "__main__":
+    for target_crs in [None, "EPSG:4326"]:
+        start = time.perf_counter()
+        _prepare_tracts('LA_City_2020_Census_Tracts_.shp', target_crs)
+        shapefile_time = time.perf_counter() - start
+        load_tracts(crs=target_crs)
+        start = time.perf_counter()
+        tracts = load_tracts(crs=target_crs)
+        cache_time = time.perf_counter() - start
+        print(f"CRS {target_crs or 'native'}: shapefile {shapefile_time * 1000:.1f}ms, "
+              f"cache {cache_time * 1000:.1f}ms ({len(tracts)} tracts)")
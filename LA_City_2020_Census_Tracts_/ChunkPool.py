@@ -0,0 +1,54 @@
+import collections
+import itertools
+
+def read_line_blocks(crime_csv_path, chunk_size):
+    """
+    Split a CSV file into raw text blocks of chunk_size lines.
+
+    Like the row counts used for progress bars, every record is assumed to
+    occupy one line. Workers parse the blocks themselves (see
+    CrimeSourceReader.read_source_text), so the parent only moves text.
+
+    Yields:
+    -------
+    tuple of str
+        (header line, block of up to chunk_size lines)
+    """
+    with open(crime_csv_path, 'r') as f:
+        header = f.readline()
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            yield header, ''.join(lines)
+
+def ordered_map(pool, func, tasks, workers):
+    """
+    Run func(*args) on a process pool for every args of tasks, in order.
+
+    At most workers * 2 tasks are in flight, so a lazy tasks iterator (e.g.
+    read_line_blocks) is never read far ahead of the results and the file is
+    not loaded into memory at once. Results are yielded in submission order.
+
+    Parameters:
+    -----------
+    pool : multiprocessing.pool.Pool
+    func : callable
+        Module-level function (it is pickled by name)
+    tasks : iterable of tuple
+        Positional arguments of each call
+    workers : int
+        Number of processes of pool
+
+    Yields:
+    -------
+    object
+        func's return values
+    """
+    pending = collections.deque()
+    for args in tasks:
+        pending.append(pool.apply_async(func, args))
+        if len(pending) >= workers * 2:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
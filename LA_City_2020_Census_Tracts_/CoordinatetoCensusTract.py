@@ -1,7 +1,196 @@
 import geopandas as gpd
-from shapely.geometry import Point
-import pandas as pd
+import numpy as np
 import os
+import shapely
+from pyproj import Transformer
+from CensusTractLoader import load_tracts
+
+# locate_many 对未匹配点返回的占位值
+MISSING_TRACT = ''
+
+# 最近tract吸附时计算距离使用的投影坐标系 (UTM 11N, 单位米)
+SNAP_CRS = "EPSG:32611"
+
+class TractLocator:
+    """
+    In-memory census tract locator.
+
+    Loads the tract polygons once, keeps a prepared STRtree spatial index and
+    a cached WGS84 -> tract CRS transformer, so each lookup only costs a
+    coordinate transform and an index query.
+
+    Parameters:
+    -----------
+    tracts : geopandas.GeoDataFrame
+        Census tract polygons (any CRS)
+    """
+
+    def __init__(self, tracts):
+        self.tracts = tracts.reset_index(drop=True)
+        self.geometries = self.tracts.geometry.to_numpy()
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.transformer = Transformer.from_crs("EPSG:4326", self.tracts.crs, always_xy=True)
+        # 定长字符串数组, 批量查询时按下标取值
+        self.ct20 = np.asarray(self.tracts['CT20'], dtype=str)
+        self.labels = np.asarray(self.tracts['LABEL'], dtype=str)
+        # 最近tract吸附用的米制索引, 第一次使用时创建
+        self._snap_tree = None
+        self._snap_transformer = None
+
+    @classmethod
+    def from_shapefile(cls, shapefile_path='LA_City_2020_Census_Tracts_.shp'):
+        """Build a locator from a census tract shapefile (in its own CRS)"""
+        return cls(load_tracts(shapefile_path, crs=None))
+
+    def locate(self, latitude, longitude):
+        """
+        Returns the positional index of the tract containing the coordinates.
+
+        Parameters:
+        -----------
+        latitude : float
+            Latitude of the location (WGS84)
+        longitude : float
+            Longitude of the location (WGS84)
+
+        Returns:
+        --------
+        int or None
+            Row position in ``self.tracts``, None if no tract contains the point
+        """
+        x, y = self.transformer.transform(longitude, latitude)
+        matches = self.tree.query(shapely.points(x, y), predicate='within')
+        if len(matches) == 0:
+            return None
+        # 与sjoin一致: 多个匹配时取第一个tract
+        return int(matches.min())
+
+    def locate_indices(self, latitudes, longitudes):
+        """
+        Vectorized point-in-tract lookup.
+
+        Parameters:
+        -----------
+        latitudes : numpy.ndarray
+            float64 latitudes (WGS84)
+        longitudes : numpy.ndarray
+            float64 longitudes (WGS84)
+
+        Returns:
+        --------
+        numpy.ndarray
+            int32 row positions in ``self.tracts``, -1 where no tract contains the point
+        """
+        x, y = self.transformer.transform(
+            np.asarray(longitudes, dtype=np.float64),
+            np.asarray(latitudes, dtype=np.float64),
+        )
+        return self.locate_projected(x, y)
+
+    def locate_projected(self, x, y):
+        """Same as locate_indices, for coordinates already in the tract CRS"""
+        indices = np.full(len(x), -1, dtype=np.int32)
+        if len(x) == 0:
+            return indices
+        points = shapely.points(x, y)
+        # 先按外包矩形筛选候选, 再对候选对做精确判断 (contains_xy不含边界, 与within一致)
+        point_idx, tract_idx = self.tree.query(points)
+        inside = shapely.contains_xy(self.geometries[tract_idx], x[point_idx], y[point_idx])
+        point_idx, tract_idx = point_idx[inside], tract_idx[inside]
+        if len(point_idx):
+            # 与sjoin一致: 多个匹配时取第一个tract
+            order = np.lexsort((tract_idx, point_idx))
+            point_idx, tract_idx = point_idx[order], tract_idx[order]
+            first = np.unique(point_idx, return_index=True)[1]
+            indices[point_idx[first]] = tract_idx[first]
+        return indices
+
+    def prepare_snapping(self):
+        """Build the metric STRtree used by snap_indices (done lazily on first use)"""
+        if self._snap_tree is None:
+            self._snap_tree = shapely.STRtree(self.tracts.geometry.to_crs(SNAP_CRS).to_numpy())
+            self._snap_transformer = Transformer.from_crs("EPSG:4326", SNAP_CRS, always_xy=True)
+        return self._snap_tree
+
+    def snap_indices(self, latitudes, longitudes, max_distance):
+        """
+        Nearest tract within max_distance metres, for points outside every polygon.
+
+        One bulk STRtree.query_nearest call in SNAP_CRS; ties go to the
+        lowest tract position, like locate_indices.
+
+        Parameters:
+        -----------
+        latitudes : numpy.ndarray
+            float64 latitudes (WGS84)
+        longitudes : numpy.ndarray
+            float64 longitudes (WGS84)
+        max_distance : float
+            Largest snap distance in metres
+
+        Returns:
+        --------
+        tuple of numpy.ndarray
+            (int32 tract row positions, -1 where no tract is within max_distance;
+            float64 distances in metres, NaN where not snapped)
+        """
+        indices = np.full(len(latitudes), -1, dtype=np.int32)
+        distances = np.full(len(latitudes), np.nan)
+        if len(indices) == 0:
+            return indices, distances
+        tree = self.prepare_snapping()
+        x, y = self._snap_transformer.transform(
+            np.asarray(longitudes, dtype=np.float64),
+            np.asarray(latitudes, dtype=np.float64),
+        )
+        (point_idx, tract_idx), found = tree.query_nearest(shapely.points(x, y), max_distance=max_distance,
+                                                          return_distance=True, all_matches=True)
+        if len(point_idx):
+            order = np.lexsort((tract_idx, point_idx))
+            point_idx, tract_idx, found = point_idx[order], tract_idx[order], found[order]
+            first = np.unique(point_idx, return_index=True)[1]
+            indices[point_idx[first]] = tract_idx[first]
+            distances[point_idx[first]] = found[first]
+        return indices, distances
+
+    def locate_many(self, latitudes, longitudes):
+        """
+        Vectorized lookup returning tract attributes.
+
+        Returns:
+        --------
+        tuple of numpy.ndarray
+            (CT20, LABEL) string arrays aligned with the input, MISSING_TRACT for misses
+        """
+        return self.attributes(self.locate_indices(latitudes, longitudes))
+
+    def attributes(self, indices):
+        """Maps tract row positions (-1 for misses) to aligned (CT20, LABEL) arrays"""
+        hit = indices >= 0
+        ct20 = np.where(hit, self.ct20[indices], MISSING_TRACT)
+        labels = np.where(hit, self.labels[indices], MISSING_TRACT)
+        return ct20, labels
+
+_locators = {}
+
+def get_tract_locator(shapefile_path='LA_City_2020_Census_Tracts_.shp'):
+    """Returns the shared TractLocator for a shapefile, creating it on first use"""
+    key = os.path.abspath(shapefile_path)
+    if key not in _locators:
+        _locators[key] = TractLocator.from_shapefile(shapefile_path)
+    return _locators[key]
+
+def locate_many(latitudes, longitudes, shapefile_path='LA_City_2020_Census_Tracts_.shp'):
+    """
+    Vectorized version of get_census_tract for NumPy coordinate arrays.
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (CT20, LABEL) string arrays aligned with the input, MISSING_TRACT for misses
+    """
+    return get_tract_locator(shapefile_path).locate_many(latitudes, longitudes)
 
 def get_census_tract(latitude, longitude, shapefile_path='LA_City_2020_Census_Tracts_.shp'):
     """
@@ -21,27 +210,11 @@ def get_census_tract(latitude, longitude, shapefile_path='LA_City_2020_Census_Tr
     pandas.Series or None
         Census tract data if coordinates are within a tract, None otherwise
     """
-    # 设置环境变量来恢复/创建缺失的.shx文件
-    os.environ['SHAPE_RESTORE_SHX'] = 'YES'
-    
-    # Load census tract shapefile
-    tracts = gpd.read_file(shapefile_path)
-    
-    # Create a point from the coordinates (WGS84)
-    point = Point(longitude, latitude)
-    point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:4326")
-    
-    # 将点转换为与shapefile相同的坐标系
-    point_gdf = point_gdf.to_crs(tracts.crs)
-    
-    # Perform spatial join to find which tract contains the point
-    joined = gpd.sjoin(point_gdf, tracts, how="left", predicate="within")
-    
-    # Return the tract data if a match is found
-    if not joined.empty and pd.notna(joined.index_right[0]):
-        return tracts.loc[joined.index_right[0]]
-    else:
+    locator = get_tract_locator(shapefile_path)
+    index = locator.locate(latitude, longitude)
+    if index is None:
         return None
+    return locator.tracts.iloc[index]
 
 if __name__ == "__main__":
     # 打印整个数据帧查看所有可用列
@@ -1,95 +1,390 @@
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
 import os
+import json
+import hashlib
+import shutil
+import argparse
+import collections
+import multiprocessing
 import time
 from tqdm import tqdm
-import matplotlib.pyplot as plt
+from matplotlib import colormaps
+from matplotlib.colors import BoundaryNorm
+from matplotlib.patches import Patch
 import numpy as np
+from CoordinatetoCensusTract import TractLocator
+from CensusTractLoader import load_tracts
+from CensusTractGrid import load_tract_grid
+from CrimeStatistics import CrimeStatistics, SOURCE_DATE_FORMAT
+from CrimeSourceReader import iter_source_chunks, read_source_text
+from ChunkPool import read_line_blocks, ordered_map
+from CensusEnrichment import TractEnrichment, POPULATION_CSV, EDUCATION_CSV
+from DuckDBStatistics import grouped_counts, DEFAULT_MEMORY_LIMIT
+from CrimeValidation import DuplicateFilter, tract_bounds, validate_records, REASON_COLUMN
+from CrimeCube import CrimeCubeBuilder
+from TractRenderer import TractRenderer
+from StageProfiler import StageProfiler, NULL_PROFILER
 
 def load_census_tracts(shapefile_path='LA_City_2020_Census_Tracts_.shp'):
-    """加载census tract shapefile数据"""
+    """加载census tract shapefile数据 (转换为WGS84, 通过CensusTractLoader缓存)"""
     print("加载census tract数据...")
-    os.environ['SHAPE_RESTORE_SHX'] = 'YES'
-    tracts = gpd.read_file(shapefile_path)
-    
-    # 确保坐标系统正确
-    if tracts.crs and tracts.crs != "EPSG:4326":
-        print(f"将census tract数据从{tracts.crs}转换为WGS84(EPSG:4326)...")
-        tracts = tracts.to_crs("EPSG:4326")
+    tracts = load_tracts(shapefile_path, crs="EPSG:4326")
     
     print(f"成功加载{len(tracts)}个census tract区域")
     return tracts
 
-def process_crime_data(crime_csv_path, tracts_gdf, output_csv="crime_data_with_census_tracts.csv", chunk_size=50000):
-    """处理犯罪数据并关联census tract信息"""
+# 输出文件的列顺序
+OUTPUT_COLUMNS = ['crime_id', 'date', 'time_occ', 'area_name', 'crime_type',
+                  'latitude', 'longitude', 'census_tract_id', 'census_tract_label']
+
+# 开启最近tract吸附时追加的列: 多边形内为0, 吸附的点为到最近tract的距离(米, 恰在边界上的点为0), 其余为空
+SNAP_COLUMN = 'snap_distance_m'
+
+def _output_columns(snap_distance=None):
+    """输出文件的列, 开启吸附时追加SNAP_COLUMN"""
+    return OUTPUT_COLUMNS + [SNAP_COLUMN] if snap_distance is not None else OUTPUT_COLUMNS
+
+# 校验未通过的记录文件的列: 原因编码和源数据字段
+REJECT_COLUMNS = [REASON_COLUMN] + OUTPUT_COLUMNS[:7]
+
+# 源数据列名映射
+COLUMN_MAP = {
+    'LAT': 'latitude',
+    'LON': 'longitude',
+    'DR_NO': 'crime_id',
+    'DATE OCC': 'date',
+    'TIME OCC': 'time_occ',
+    'AREA NAME': 'area_name',
+    'Crm Cd Desc': 'crime_type'
+}
+
+# 开启校验时按原始文本读取、由validate_records解析的列 (被拒绝的记录保留原始值)
+VALIDATED_COLUMNS = ['DATE OCC', 'TIME OCC']
+
+def _raw_columns(bounds):
+    """读取源数据时不转换的列: 只有开启校验时才交给validate_records解析"""
+    return VALIDATED_COLUMNS if bounds is not None else ()
+
+# census tract编号和标签按字符串读取, 避免含空值的列被推断为浮点数
+TRACT_ID_DTYPES = {'census_tract_id': str, 'census_tract_label': str}
+
+class CsvChunkWriter:
+    """逐块追加写入CSV, append为True时续写已有文件且不再写标题"""
+    
+    def __init__(self, path, append=False, columns=OUTPUT_COLUMNS):
+        self.path = path
+        self.columns = columns
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+        if not append:
+            self.file.write(",".join(columns) + "\n")
+    
+    def write(self, chunk):
+        # 并行模式下工作进程已生成CSV文本
+        if isinstance(chunk, str):
+            self.file.write(chunk)
+        else:
+            chunk.to_csv(self.file, header=False, index=False, columns=self.columns)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.file.close()
+
+class ParquetChunkWriter:
+    """流式写入Parquet: 固定schema, 分类列使用字典编码, 每个数据块一个row group"""
+    
+    def __init__(self, path, compression='zstd', columns=OUTPUT_COLUMNS):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.path = path
+        self.columns = columns
+        fields = [
+            ('crime_id', pa.int64()),
+            ('date', pa.timestamp('s')),
+            ('time_occ', pa.int16()),
+            ('area_name', pa.dictionary(pa.int16(), pa.string())),
+            ('crime_type', pa.dictionary(pa.int16(), pa.string())),
+            ('latitude', pa.float32()),
+            ('longitude', pa.float32()),
+            ('census_tract_id', pa.string()),
+            ('census_tract_label', pa.string()),
+            (SNAP_COLUMN, pa.float32()),
+        ]
+        self.schema = pa.schema([field for field in fields if field[0] in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+    
+    def write(self, chunk):
+        table = self.pa.Table.from_pandas(chunk[self.columns], schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.writer.close()
+
+class NullChunkWriter:
+    """只累计统计、不写出关联结果时使用"""
+    
+    def write(self, chunk):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+
+# 并行模式下由fork继承(或initializer创建)的空间索引, 不随每个任务序列化
+_worker_locator = None
+
+def _build_locator(tracts_gdf, grid_path=None):
+    """创建tract空间索引, grid_path不为空时使用预计算的查找网格"""
+    if grid_path:
+        return load_tract_grid(grid_path, tracts=tracts_gdf)
+    return TractLocator(tracts_gdf)
+
+def _init_worker(tracts_gdf, grid_path):
+    """进程池初始化: fork时直接复用父进程的索引, 否则在子进程中重建一次"""
+    global _worker_locator
+    if _worker_locator is None:
+        _worker_locator = _build_locator(tracts_gdf, grid_path)
+
+def _coordinates(values):
+    """查询用的float64坐标; float32列还原为5位小数 (源数据最多4位小数, float32误差小于5e-6度)"""
+    values = values.to_numpy()
+    if values.dtype == np.float32:
+        return np.round(values.astype(np.float64), 5)
+    return values.astype(np.float64)
+
+def _geocode_chunk(chunk, locator, snap_distance=None):
+    """清洗一个数据块并关联census tract, snap_distance不为空时把多边形外的点吸附到该距离(米)内最近的tract
+
+    返回(数据块, 吸附的点数); 吸附数按未被多边形包含的点统计, 恰在边界上的点吸附距离为0也计入
+    """
+    # 重命名列
+    chunk = chunk.rename(columns=COLUMN_MAP)
+    
+    # 移除坐标为0或缺失的记录
+    chunk = chunk.dropna(subset=['latitude', 'longitude'])
+    chunk = chunk[(chunk['latitude'] != 0) & (chunk['longitude'] != 0)]
+    
+    # 批量空间查询 - 查找每个点所在的census tract
+    latitudes, longitudes = _coordinates(chunk['latitude']), _coordinates(chunk['longitude'])
+    tract_idx = locator.locate_indices(latitudes, longitudes)
+    snapped = 0
+    
+    if snap_distance is not None:
+        # 未匹配的点一次性做最近邻查询
+        distances = np.where(tract_idx >= 0, 0.0, np.nan)
+        missed = np.flatnonzero(tract_idx < 0)
+        tract_idx[missed], distances[missed] = locator.snap_indices(latitudes[missed], longitudes[missed],
+                                                                    snap_distance)
+        chunk[SNAP_COLUMN] = distances
+        snapped = int((tract_idx[missed] >= 0).sum())
+    
+    # 合并结果回原始数据 (未匹配的保留为空)
+    hit = tract_idx >= 0
+    chunk['census_tract_id'] = np.where(hit, locator.ct20[tract_idx], None)
+    chunk['census_tract_label'] = np.where(hit, locator.labels[tract_idx], None)
+    return chunk, snapped
+
+def _validate_chunk(chunk, bounds, duplicates=None, dedup=None):
+    """关联之前的校验, 返回(通过的记录, 被拒绝的记录, 修正的坐标对调数); bounds为None时不校验"""
+    chunk = chunk.rename(columns=COLUMN_MAP)
+    if bounds is None:
+        return chunk, None, 0
+    return validate_records(chunk, bounds, duplicates, dedup=dedup)
+
+def _duplicate_rows(header, block, bounds, dedup):
+    """父进程: 按文件顺序校验一段原始CSV文本的关键列, 返回被判为重复DR_NO的行号
+
+    只有通过其他检查的记录ID才计入dedup, 与单进程的判定一致
+    """
+    chunk = read_source_text(header + block, ['DR_NO', 'LAT', 'LON'] + VALIDATED_COLUMNS, VALIDATED_COLUMNS)
+    _, rejected, _ = _validate_chunk(chunk, bounds, dedup=dedup)
+    return rejected.index[rejected[REASON_COLUMN] == 'duplicate_id'].to_numpy()
+
+def _chunk_counts(chunk, snapped=0, swapped=0):
+    """一个数据块的有效行数、匹配行数、吸附行数和修正的坐标对调数"""
+    return {
+        'total': len(chunk),
+        'found': int(chunk['census_tract_id'].notna().sum()),
+        'snapped': snapped,
+        'swapped': swapped,
+    }
+
+def _process_block(header, block, output, accumulators, snap_distance=None, bounds=None, duplicate_rows=None):
+    """工作进程: 解析一段原始CSV文本, 校验并关联census tract, 返回结果、计数、被拒绝的记录和该块的统计
+
+    output为"text"时返回CSV文本, "frame"时返回DataFrame, None时不返回数据(只需要统计)
+    accumulators为需要逐块累计的类(CrimeStatistics、CrimeCubeBuilder), 每个类返回一份该块的部分结果
+    duplicate_rows为父进程判定的重复DR_NO在该块中的行号
+    """
+    chunk = read_source_text(header + block, list(COLUMN_MAP), _raw_columns(bounds))
+    rows_read = len(chunk)
+    duplicates = None
+    if duplicate_rows is not None:
+        duplicates = np.zeros(rows_read, dtype=bool)
+        duplicates[duplicate_rows] = True
+    chunk, rejected, swapped = _validate_chunk(chunk, bounds, duplicates)
+    chunk, snapped = _geocode_chunk(chunk, _worker_locator, snap_distance)
+    counts = _chunk_counts(chunk, snapped, swapped)
+    partial = []
+    for accumulator in accumulators:
+        partial.append(accumulator.from_locator(_worker_locator))
+        partial[-1].add_frame(chunk)
+    if output == "text":
+        chunk = chunk.to_csv(header=False, index=False, columns=_output_columns(snap_distance))
+    elif output is None:
+        chunk = None
+    return chunk, rows_read, counts, rejected, partial
+
+def _iter_chunks_serial(crime_csv_path, tracts_gdf, grid_path, chunk_size, profiler=NULL_PROFILER, snap_distance=None,
+                        bounds=None, dedup=None):
+    """单进程逐块处理, 产出(数据块, 读取行数, 计数, 被拒绝的记录, None)"""
+    # 建立一次空间索引, 供所有分块复用
+    locator = _build_locator(tracts_gdf, grid_path)
+    reader = iter_source_chunks(crime_csv_path, list(COLUMN_MAP), chunk_size, _raw_columns(bounds))
+    for i, raw in enumerate(profiler.iterate('read_csv', reader, rows=len)):
+        with profiler.chunk('validate', i, len(raw)):
+            chunk, rejected, swapped = _validate_chunk(raw, bounds, dedup=dedup)
+        with profiler.chunk('geocode', i, len(chunk)):
+            chunk, snapped = _geocode_chunk(chunk, locator, snap_distance)
+        yield chunk, len(raw), _chunk_counts(chunk, snapped, swapped), rejected, None
+
+def _iter_chunks_parallel(crime_csv_path, tracts_gdf, grid_path, chunk_size, workers, output="text", accumulators=(), snap_distance=None,
+                          bounds=None, dedup=None):
+    """用进程池并行处理数据块, 按原始顺序产出(CSV文本或DataFrame, 读取行数, 计数, 被拒绝的记录, 分块统计)
+
+    dedup不为空时由父进程按文件顺序解析校验所需的列判定重复记录, 工作进程在关联前剔除
+    """
+    global _worker_locator
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods:
+        # 先在父进程建好索引, 子进程通过fork共享, 无需序列化
+        _worker_locator = _build_locator(tracts_gdf, grid_path)
+        if snap_distance is not None:
+            # 米制索引同样在fork前建好
+            _worker_locator.prepare_snapping()
+        ctx = multiprocessing.get_context('fork')
+    else:
+        ctx = multiprocessing.get_context('spawn')
+    
+    try:
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(tracts_gdf, grid_path)) as pool:
+            # 重复记录由父进程按文件顺序判定, 任务按需生成, 在途任务数由ordered_map限制
+            def tasks():
+                for header, block in read_line_blocks(crime_csv_path, chunk_size):
+                    duplicate_rows = None
+                    if dedup is not None:
+                        duplicate_rows = _duplicate_rows(header, block, bounds, dedup)
+                    yield header, block, output, accumulators, snap_distance, bounds, duplicate_rows
+
+            yield from ordered_map(pool, _process_block, tasks(), workers)
+    finally:
+        _worker_locator = None
+
+def process_crime_data(crime_csv_path, tracts_gdf, output_csv="crime_data_with_census_tracts.csv", chunk_size=50000, grid_path=None, workers=1, output_format="csv", stats=None, cube=None, profiler=NULL_PROFILER, snap_distance=None,
+                       validate=False, reject_csv="crime_data_rejected.csv"):
+    """处理犯罪数据并关联census tract信息
+
+    grid_path不为空时使用预计算的tract查找网格(见CensusTractGrid), 只有落在边界单元的点才做精确多边形判断
+    workers大于1时用进程池并行处理数据块, 输出顺序与单进程一致
+    output_format为"parquet"时以流式方式写入带类型、压缩的Parquet文件, 每个数据块一个row group
+    stats为CrimeStatistics时在处理过程中逐块累计统计, 之后无需重新读取输出文件;
+    此时output_csv可以为None, 只累计统计而不写出关联结果, 内存占用只与分块大小有关
+    cube为CrimeCubeBuilder时同样逐块累计 日期 × tract × 类型 的计数
+    profiler为StageProfiler时记录每个数据块读取/关联、写出和累计统计的耗时
+    源数据由CrimeSourceReader按固定schema读取 (float32坐标、分类列、日期只解析一次), 输出中的日期为YYYY-MM-DD
+    snap_distance不为空时, 不在任何多边形内的点分配给该距离(米, EPSG:32611)内最近的tract,
+    输出追加snap_distance_m列记录吸附距离 (多边形内为0, 未吸附为空)
+    validate为True时在关联之前做向量化校验(见CrimeValidation): 跨数据块按DR_NO去重、坐标缺失、
+    日期和时间无效、超出tract范围(按吸附距离放宽)的记录连同原因编码写入reject_csv (为None时只计数),
+    经纬度对调的点修正后继续关联; 日期和时间由校验从原始文本解析, 被拒绝的记录保留源数据中的原始值
+    """
+    if output_format not in ("csv", "parquet"):
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    accumulators = [acc for acc in (stats, cube) if acc is not None]
+    if output_csv is None and not accumulators:
+        raise ValueError("output_csv为None时必须提供stats或cube")
+    if output_format == "parquet" and output_csv and output_csv.endswith(".csv"):
+        output_csv = output_csv[:-len(".csv")] + ".parquet"
+    
     # 获取CSV文件总行数(用于进度条)
     print("计算文件总行数...")
     row_count = sum(1 for _ in open(crime_csv_path, 'r')) - 1  # 减去标题行
     print(f"文件共有{row_count}行数据")
     
-    # 设置列名映射以便处理
-    column_map = {
-        'LAT': 'latitude',
-        'LON': 'longitude',
-        'DR_NO': 'crime_id',
-        'DATE OCC': 'date',
-        'AREA NAME': 'area_name',
-        'Crm Cd Desc': 'crime_type'
-    }
-    
-    # 设定要使用的列
-    usecols = list(column_map.keys())
-    
     # 分块处理
     print("开始分块处理犯罪数据...")
     chunks_processed = 0
     total_crimes = 0
     found_tract = 0
     no_tract = 0
+    snapped_tract = 0
+    swapped_points = 0
+    rejected_reasons = collections.Counter()
+    
+    bounds, dedup = None, None
+    if validate:
+        bounds, dedup = tract_bounds(tracts_gdf, snap_distance or 0.0), DuplicateFilter()
     
-    # 创建结果文件并写入标题
-    with open(output_csv, 'w', encoding='utf-8') as f:
-        f.write("crime_id,date,area_name,crime_type,latitude,longitude,census_tract_id,census_tract_label\n")
+    if workers > 1:
+        print(f"使用{workers}个进程并行处理...")
+        results = _iter_chunks_parallel(crime_csv_path, tracts_gdf, grid_path, chunk_size, workers,
+                                        output=None if output_csv is None else ("text" if output_format == "csv" else "frame"),
+                                        accumulators=tuple(type(acc) for acc in accumulators),
+                                        snap_distance=snap_distance, bounds=bounds, dedup=dedup)
+        # 并行模式下只能观察到等待工作进程结果的时间
+        results = profiler.iterate('parallel_geocode', results, rows=lambda result: result[1])
+    else:
+        results = _iter_chunks_serial(crime_csv_path, tracts_gdf, grid_path, chunk_size, profiler, snap_distance,
+                                      bounds, dedup)
+    
+    # 创建结果文件 (CSV写入标题)
+    if output_csv is None:
+        writer = NullChunkWriter()
+    elif output_format == "parquet":
+        writer = ParquetChunkWriter(output_csv, columns=_output_columns(snap_distance))
+    else:
+        writer = CsvChunkWriter(output_csv, columns=_output_columns(snap_distance))
+    reject_writer = CsvChunkWriter(reject_csv, columns=REJECT_COLUMNS) if validate and reject_csv else NullChunkWriter()
     
     # 创建总进度条
-    with tqdm(total=row_count, desc="处理进度") as pbar:
-        # 分块读取CSV
-        for chunk in pd.read_csv(crime_csv_path, chunksize=chunk_size, usecols=usecols, low_memory=False):
-            chunk_size = len(chunk)
-            
-            # 重命名列
-            chunk = chunk.rename(columns=column_map)
-            
-            # 移除坐标为0或缺失的记录
-            chunk = chunk.dropna(subset=['latitude', 'longitude'])
-            chunk = chunk[(chunk['latitude'] != 0) & (chunk['longitude'] != 0)]
-            
-            # 创建GeoDataFrame
-            geometry = [Point(lon, lat) for lon, lat in zip(chunk['longitude'], chunk['latitude'])]
-            crime_gdf = gpd.GeoDataFrame(chunk, geometry=geometry, crs="EPSG:4326")
-            
-            # 空间连接 - 查找每个点所在的census tract
-            joined = gpd.sjoin(crime_gdf, tracts_gdf, how="left", predicate="within")
+    with tqdm(total=row_count, desc="处理进度") as pbar, writer, reject_writer:
+        for chunk, rows_read, counts, rejected, partial in results:
+            # 计数
+            chunk_total = counts['total']
+            found_tract += counts['found']
+            snapped_tract += counts['snapped']
+            swapped_points += counts['swapped']
+            no_tract += (chunk_total - counts['found'])
+            total_crimes += chunk_total
             
-            # 合并结果回原始数据
-            chunk['census_tract_id'] = joined['CT20']
-            chunk['census_tract_label'] = joined['LABEL']
+            # 校验未通过的记录写入单独的文件
+            if rejected is not None and len(rejected):
+                rejected_reasons.update(rejected[REASON_COLUMN].value_counts().to_dict())
+                reject_writer.write(rejected)
             
-            # 计数
-            chunk_found = chunk['census_tract_id'].notna().sum()
-            found_tract += chunk_found
-            no_tract += (len(chunk) - chunk_found)
-            total_crimes += len(chunk)
+            # 附加到输出文件
+            with profiler.chunk('write', chunks_processed, chunk_total):
+                writer.write(chunk)
             
-            # 附加到CSV
-            chunk.to_csv(output_csv, mode='a', header=False, index=False, 
-                        columns=['crime_id', 'date', 'area_name', 'crime_type', 
-                                'latitude', 'longitude', 'census_tract_id', 'census_tract_label'])
+            # 累计统计 (并行模式下工作进程已完成该块的计数)
+            with profiler.chunk('aggregate', chunks_processed, chunk_total):
+                for i, acc in enumerate(accumulators):
+                    if partial is not None:
+                        acc.merge(partial[i])
+                    else:
+                        acc.add_frame(chunk)
             
             # 更新进度条
             chunks_processed += 1
-            pbar.update(chunk_size)
+            pbar.update(rows_read)
             
             # 定期状态更新
             if chunks_processed % 10 == 0:
@@ -98,110 +393,376 @@ def process_crime_data(crime_csv_path, tracts_gdf, output_csv="crime_data_with_c
     print(f"\n完成! 处理了 {total_crimes} 条犯罪记录")
     print(f"找到census tract: {found_tract} ({found_tract/total_crimes*100:.1f}%)")
     print(f"未找到census tract: {no_tract} ({no_tract/total_crimes*100:.1f}%)")
+    if snap_distance is not None:
+        print(f"其中由吸附得到 ({snap_distance:g}米内最近census tract): {snapped_tract} ({snapped_tract/total_crimes*100:.1f}%)")
+    if validate:
+        print(f"校验: 修正经纬度对调 {swapped_points} 条, 拒绝 {sum(rejected_reasons.values())} 条"
+              + (f" (已写入 {reject_csv})" if reject_csv else ""))
+        for reason, count in rejected_reasons.most_common():
+            print(f"  {reason}: {count}")
     
     return output_csv
 
-def generate_statistics(crime_tract_csv, output_stats_csv="crime_by_census_tract.csv"):
-    """生成census tract犯罪统计"""
+def iter_crime_tracts(path, columns=None, chunk_size=500000):
+    """分块读取process_crime_data的输出(CSV或Parquet), census tract编号统一为字符串"""
+    if path.endswith(".parquet"):
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(path, format="parquet")
+        if columns is not None:
+            columns = [c for c in columns if c in dataset.schema.names]
+        for batch in dataset.to_batches(columns=columns, batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        if columns is not None:
+            header = pd.read_csv(path, nrows=0).columns
+            columns = [c for c in columns if c in header]
+        yield from pd.read_csv(path, usecols=columns, dtype=TRACT_ID_DTYPES, chunksize=chunk_size)
+
+def read_crime_tracts(path, columns=None):
+    """读取process_crime_data的输出(CSV或Parquet), census tract编号统一为字符串"""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns, dtype=TRACT_ID_DTYPES)
+
+def save_statistics(stats, output_stats_csv="crime_by_census_tract.csv", enrichment=None):
+    """保存统计结果 (按扩展名选择CSV或Parquet)
+
+    enrichment为TractEnrichment时追加人口、贫困、教育数据及每1000人犯罪率等派生列
+    """
+    if enrichment is not None:
+        stats = enrichment.enrich(stats)
+    
+    if output_stats_csv.endswith(".parquet"):
+        stats.to_parquet(output_stats_csv, index=False)
+    else:
+        stats.to_csv(output_stats_csv, index=False)
+    print(f"统计数据已保存至 {output_stats_csv}")
+
+WEEKDAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+def save_time_histograms(stats, output_prefix="crime_by_census_tract", output_format="csv"):
+    """保存每个census tract按小时和星期几的犯罪数量分布"""
+    has_crimes = stats.totals() > 0
+    for by, names in [('hour', lambda h: f"hour_{h:02d}"), ('weekday', lambda d: WEEKDAY_NAMES[d])]:
+        histogram = stats.histogram(by)[has_crimes]
+        histogram.columns = [names(c) for c in histogram.columns]
+        histogram = histogram.reset_index()
+        path = f"{output_prefix}_by_{by}.{output_format}"
+        if output_format == "parquet":
+            histogram.to_parquet(path, index=False)
+        else:
+            histogram.to_csv(path, index=False)
+        print(f"{by}分布已保存至 {path}")
+
+def generate_statistics(crime_tract_csv, output_stats_csv="crime_by_census_tract.csv", top_k=10, shapefile_path='LA_City_2020_Census_Tracts_.shp', enrichment=None,
+                        backend="numpy", memory_limit=DEFAULT_MEMORY_LIMIT, temp_directory=None):
+    """生成census tract犯罪统计 (输入输出均支持CSV或Parquet, 按扩展名区分)
+
+    单次遍历累计census tract × crime_type计数, top_k为None时输出所有犯罪类型
+    enrichment为TractEnrichment时追加人口、贫困、教育数据及派生的犯罪率
+    backend为"duckdb"时由DuckDB在memory_limit内完成分组计数, 超出时溢写到temp_directory(见DuckDBStatistics),
+    再把分组结果并入同一个统计引擎, 输出的表结构与默认backend完全一致
+    """
+    if backend not in ("numpy", "duckdb"):
+        raise ValueError(f"不支持的统计backend: {backend}")
     print("开始生成census tract统计数据...")
+    tracts = load_census_tracts(shapefile_path)
+    stats = CrimeStatistics(tracts['CT20'], tracts['LABEL'])
     
-    # 读取带有census tract信息的犯罪数据
-    df = pd.read_csv(crime_tract_csv)
+    if backend == "duckdb":
+        print(f"使用DuckDB分组计数 (内存上限 {memory_limit})...")
+        stats.add_groups(grouped_counts(crime_tract_csv, memory_limit, temp_directory))
+    else:
+        # 分块读取带有census tract信息的犯罪数据 (只读取需要的列)
+        columns = ['census_tract_id', 'crime_type', 'date', 'time_occ']
+        for chunk in iter_crime_tracts(crime_tract_csv, columns=columns):
+            stats.add_frame(chunk)
     
-    # 删除没有census tract的记录
-    df = df.dropna(subset=['census_tract_id'])
+    stats_df = stats.to_frame(top_k=top_k)
+    save_statistics(stats_df, output_stats_csv, enrichment)
+    return stats_df
+
+# 计算源文件指纹时读取的字节数: 源数据只追加, 开头部分不变
+FINGERPRINT_BYTES = 1 << 20
+
+def _source_fingerprint(crime_csv_path, length=FINGERPRINT_BYTES):
+    """源文件开头length字节的SHA1, 用于判断源文件是否被整体替换"""
+    with open(crime_csv_path, 'rb') as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+def _load_ingest_state(state_path, crime_csv_path, output_path):
+    """读取增量状态文件; 源文件指纹不一致或输出缺失时返回None(需要全量重建)"""
+    if not os.path.exists(state_path) or not os.path.exists(output_path):
+        return None
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if os.path.getsize(crime_csv_path) < state['fingerprint_bytes']:
+        print("源文件比上次处理时更小, 执行全量重建")
+        return None
+    if _source_fingerprint(crime_csv_path, state['fingerprint_bytes']) != state['source_fingerprint']:
+        print("源文件指纹已变化, 执行全量重建")
+        return None
+    return state
+
+def _new_rows_mask(chunk, state):
+    """判断哪些记录尚未处理过
+
+    已处理记录满足 Date Rptd <= 水位线日期 且 DR_NO <= 最大DR_NO, 因此以下记录一定是新的:
+    报告日期晚于水位线, 报告日期等于水位线但DR_NO不在当天已处理列表中, 或DR_NO大于已处理的最大值
+    """
+    if state is None:
+        return np.ones(len(chunk), dtype=bool)
+    dr_no = chunk['DR_NO'].to_numpy()
+    reported = chunk['date_reported'].to_numpy()
+    max_date = np.datetime64(state['max_date_rptd'])
+    same_day = (reported == max_date) & ~np.isin(dr_no, state['last_day_ids'])
+    return (reported > max_date) | same_day | (dr_no > state['max_dr_no'])
+
+def ingest_incremental(crime_csv_path, tracts_gdf, output_path="crime_data_with_census_tracts.csv",
+                       output_stats_csv="crime_by_census_tract.csv", state_path="crime_ingest_state.json",
+                       stats_path="crime_statistics.npz", chunk_size=50000, grid_path=None,
+                       output_format="csv", cube_counts_path="crime_cube_counts.npz", cube_path="crime_cube.npy",
+                       enrichment=None):
+    """增量处理犯罪数据: 只关联上次运行之后新增的记录
+
+    状态文件记录最大DR_NO、最大Date Rptd(及当天已处理的DR_NO)和源文件开头的指纹;
+    新记录追加到已有的关联结果, 并累加进保存的CrimeStatistics计数后重新生成统计表.
+    Parquet格式下关联结果是一个目录, 每次运行追加一个part文件.
+    cube_counts_path不为None时同样累加保存的CrimeCubeBuilder计数, 并重新生成cube_path处的累计立方体.
+    enrichment为TractEnrichment时统计表追加人口、贫困、教育数据及派生的犯罪率.
+    没有新记录时只重新生成统计表, 关联结果、累计计数、立方体和状态文件都不变.
+    """
+    state = _load_ingest_state(state_path, crime_csv_path, output_path)
+    if state is not None:
+        # 累计计数缺失时只能从头重建, 否则统计表只剩新增记录
+        missing = [path for path in (stats_path, cube_counts_path) if path is not None and not os.path.exists(path)]
+        if missing:
+            print(f"累计计数文件缺失 ({', '.join(missing)}), 执行全量重建")
+            state = None
+    if state is None:
+        print("未找到可用的增量状态, 从头处理全部记录...")
+        if os.path.isdir(output_path):
+            shutil.rmtree(output_path)
+        elif os.path.exists(output_path):
+            os.remove(output_path)
+        run = 0
+    else:
+        print(f"上次处理到 DR_NO {state['max_dr_no']}, Date Rptd {state['max_date_rptd']}")
+        run = state['run'] + 1
     
-    # 按census tract统计犯罪总数
-    stats = df.groupby(['census_tract_id', 'census_tract_label']).size().reset_index(name='total_crimes')
+    if output_format == "parquet":
+        os.makedirs(output_path, exist_ok=True)
+        part_path = os.path.join(output_path, f"part-{run:05d}.parquet")
+        writer = ParquetChunkWriter(part_path)
+    else:
+        writer = CsvChunkWriter(output_path, append=state is not None)
     
-    # 按crime_type统计
-    crime_types = df.groupby(['census_tract_id', 'crime_type']).size().reset_index(name='count')
+    locator = _build_locator(tracts_gdf, grid_path)
+    if state is not None:
+        stats = CrimeStatistics.load(stats_path)
+    else:
+        stats = CrimeStatistics(tracts_gdf['CT20'], tracts_gdf['LABEL'])
+    cube = None
+    if cube_counts_path is not None:
+        if state is not None:
+            cube = CrimeCubeBuilder.load(cube_counts_path)
+        else:
+            cube = CrimeCubeBuilder(tracts_gdf['CT20'])
+    usecols = list(COLUMN_MAP) + ['Date Rptd']
+    max_dr_no = state['max_dr_no'] if state else -1
+    max_date = np.datetime64(state['max_date_rptd']) if state else np.datetime64('NaT')
+    last_day_ids = set(state['last_day_ids']) if state else set()
+    skipped = 0
+    total_new = 0
     
-    # 获取前10种最常见的犯罪类型
-    top_crimes = crime_types.groupby('crime_type')['count'].sum().nlargest(10).index.tolist()
+    with writer, tqdm(desc="增量处理") as pbar:
+        for chunk in iter_source_chunks(crime_csv_path, usecols, chunk_size):
+            rows_read = len(chunk)
+            chunk['date_reported'] = pd.to_datetime(chunk.pop('Date Rptd'), format=SOURCE_DATE_FORMAT, errors='coerce').dt.normalize()
+            new = _new_rows_mask(chunk, state)
+            skipped += int((~new).sum())
+            chunk = chunk[new]
+            if len(chunk) == 0:
+                pbar.update(rows_read)
+                continue
+            
+            # 更新水位线
+            max_dr_no = max(max_dr_no, int(chunk['DR_NO'].max()))
+            chunk_max_date = chunk['date_reported'].max()
+            if pd.notna(chunk_max_date):
+                chunk_max_date = np.datetime64(chunk_max_date)
+                if np.isnat(max_date) or chunk_max_date > max_date:
+                    max_date = chunk_max_date
+                    last_day_ids = set()
+                if chunk_max_date == max_date:
+                    last_day_ids.update(chunk.loc[chunk['date_reported'] == max_date, 'DR_NO'].tolist())
+            
+            # 关联census tract并追加到已有结果
+            chunk, _ = _geocode_chunk(chunk, locator)
+            writer.write(chunk)
+            stats.add_frame(chunk)
+            if cube is not None:
+                cube.add_frame(chunk)
+            total_new += len(chunk)
+            pbar.update(rows_read)
     
-    # 为每种常见犯罪类型创建统计列
-    for crime_type in top_crimes:
-        crime_type_data = crime_types[crime_types['crime_type'] == crime_type]
-        # 重命名列名，移除特殊字符
-        type_col_name = f"crime_{crime_type.lower().replace(' ', '_').replace('-', '_').replace('/', '_')[:20]}"
-        # 合并到主统计表
-        stats = pd.merge(
-            stats, 
-            crime_type_data[['census_tract_id', 'count']].rename(columns={'count': type_col_name}),
-            on='census_tract_id', 
-            how='left'
-        )
+    print(f"新增 {total_new} 条记录, 跳过已处理 {skipped} 条")
     
-    # 填充缺失值为0
-    stats = stats.fillna(0)
+    stats_df = stats.to_frame()
+    if state is not None and total_new == 0:
+        # 没有新记录: 不留下空的part文件, 累计计数、立方体和状态保持不变
+        if output_format == "parquet":
+            os.remove(part_path)
+        save_statistics(stats_df, output_stats_csv, enrichment)
+        return stats_df
     
-    # 计算每1000人犯罪率(如果有人口数据)
-    # 这部分需要人口数据，先注释掉
-    # stats['crime_rate_per_1000'] = (stats['total_crimes'] / stats['population']) * 1000
+    # 保存累计计数并重新生成统计表
+    stats.save(stats_path)
+    save_statistics(stats_df, output_stats_csv, enrichment)
+    if cube is not None:
+        cube.save(cube_counts_path)
+        cube.build(cube_path)
     
-    # 保存统计结果
-    stats.to_csv(output_stats_csv, index=False)
-    print(f"统计数据已保存至 {output_stats_csv}")
+    # 保存新的状态
+    new_state = {
+        'source': os.path.abspath(crime_csv_path),
+        'fingerprint_bytes': min(FINGERPRINT_BYTES, os.path.getsize(crime_csv_path)),
+        'max_dr_no': max_dr_no,
+        'max_date_rptd': str(max_date.astype('datetime64[D]')) if not np.isnat(max_date) else None,
+        'last_day_ids': sorted(int(i) for i in last_day_ids),
+        'run': run,
+        'rows': (state['rows'] if state else 0) + total_new,
+    }
+    new_state['source_fingerprint'] = _source_fingerprint(crime_csv_path, new_state['fingerprint_bytes'])
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump(new_state, f, indent=2)
+    print(f"增量状态已保存至 {state_path}")
     
-    return stats
+    return stats_df
 
-def visualize_crime_data(stats_df, tracts_gdf, output_path="crime_heatmap.png"):
-    """生成犯罪热力图"""
+def visualize_crime_data(stats_df, tracts_gdf, output_path="crime_heatmap.png", renderer=None):
+    """生成犯罪热力图 (5级分位数分类)"""
     print("生成犯罪热力图...")
     
-    # 合并统计数据和地理数据
-    tracts_gdf = tracts_gdf.copy()
-    merged_gdf = tracts_gdf.merge(stats_df, left_on='CT20', right_on='census_tract_id', how='left')
-    
-    # 创建图形
-    fig, ax = plt.subplots(1, 1, figsize=(15, 10))
-    
-    # 绘制热力图
-    merged_gdf.plot(
-        column='total_crimes',
-        cmap='OrRd',
-        scheme='quantiles',
-        k=5,
-        legend=True,
-        legend_kwds={'title': '犯罪数量', 'loc': 'lower right'},
-        ax=ax,
-        missing_kwds={'color': 'lightgrey'}
-    )
-    
-    # 设置标题
-    ax.set_title('洛杉矶各Census Tract犯罪热力图', fontsize=15)
-    
-    # 去除坐标轴
-    ax.set_axis_off()
-    
-    # 保存图片
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    if renderer is None:
+        renderer = TractRenderer(tracts_gdf)
+    values = renderer.align(stats_df, 'total_crimes')
+    
+    # 分位数分级, 与GeoPandas的scheme='quantiles', k=5一致
+    present = values[~np.isnan(values)]
+    bins = np.unique(np.quantile(present, np.linspace(0, 1, 6))) if len(present) else np.array([0.0, 1.0])
+    if len(bins) < 2:
+        bins = np.array([bins[0], bins[0] + 1])
+    cmap = colormaps['OrRd'].resampled(len(bins) - 1)
+    norm = BoundaryNorm(bins, cmap.N)
+    legend_handles = [
+        Patch(facecolor=cmap(i), edgecolor='black', label=f"{bins[i]:,.0f} - {bins[i + 1]:,.0f}")
+        for i in range(len(bins) - 1)
+    ]
+    
+    fig = renderer.render(values, output_path, cmap=cmap, norm=norm,
+                          title='洛杉矶各Census Tract犯罪热力图',
+                          legend_handles=legend_handles, legend_title='犯罪数量')
     print(f"热力图已保存至 {output_path}")
     
     return fig
 
-def main():
+def incremental_conflicts(workers=1, stats_only=False, snap_distance=None, validate=False):
+    """与增量模式不能同时使用的选项 (增量处理为单进程、写出关联结果、只做精确多边形匹配且不校验)"""
+    conflicts = {'--workers': workers > 1, '--stats-only': stats_only,
+                 '--snap-distance': snap_distance is not None, '--validate': validate}
+    return [option for option, used in conflicts.items() if used]
+
+def main(workers=1, output_format="csv", incremental=False, stats_only=False, profile=False, profile_stage=None,
+         population_csv=POPULATION_CSV, education_csv=EDUCATION_CSV, snap_distance=None,
+         validate=False):
     """主函数"""
+    if incremental:
+        unsupported = incremental_conflicts(workers, stats_only, snap_distance, validate)
+        if unsupported:
+            raise ValueError(f"增量模式不支持: {', '.join(unsupported)}")
     start_time = time.time()
+    profiler = StageProfiler(profile_stage=profile_stage, report_prefix="run_report_crime_census_tract") if profile else NULL_PROFILER
     
     # 步骤1: 加载census tract数据
-    tracts_gdf = load_census_tracts()
+    with profiler.stage('load_tracts'):
+        tracts_gdf = load_census_tracts()
     
-    # 步骤2: 处理犯罪数据并分配census tract
-    crime_tract_csv = process_crime_data(
-        crime_csv_path='Crime_Data_from_2020_to_Present.csv',
-        tracts_gdf=tracts_gdf
-    )
+    # 人口/贫困和教育数据 (文件存在时), 按tract下标对齐后用于派生犯罪率
+    with profiler.stage('load_enrichment'):
+        enrichment = TractEnrichment.from_files(tracts_gdf['CT20'], population_csv, education_csv)
     
-    # 步骤3: 生成统计数据
-    stats_df = generate_statistics(crime_tract_csv)
+    if incremental:
+        # 步骤2+3: 只处理新增记录并就地更新统计数据
+        with profiler.stage('ingest_incremental'):
+            stats_df = ingest_incremental(
+                crime_csv_path='Crime_Data_from_2020_to_Present.csv',
+                tracts_gdf=tracts_gdf,
+                output_path=f"crime_data_with_census_tracts.{output_format}",
+                output_stats_csv=f"crime_by_census_tract.{output_format}",
+                output_format=output_format,
+                enrichment=enrichment
+            )
+    else:
+        # 步骤2: 处理犯罪数据并分配census tract, 同时逐块累计统计
+        # (stats_only时不写出关联结果)
+        stats = CrimeStatistics(tracts_gdf['CT20'], tracts_gdf['LABEL'])
+        cube = CrimeCubeBuilder(tracts_gdf['CT20'])
+        with profiler.stage('process_crime_data') as stage:
+            process_crime_data(
+                crime_csv_path='Crime_Data_from_2020_to_Present.csv',
+                tracts_gdf=tracts_gdf,
+                output_csv=None if stats_only else "crime_data_with_census_tracts.csv",
+                workers=workers,
+                output_format=output_format,
+                stats=stats,
+                cube=cube,
+                profiler=profiler,
+                snap_distance=snap_distance,
+                validate=validate
+            )
+            stage['rows'] = int(stats.counts.sum())
+        
+        # 步骤3: 生成统计数据 (无需重新读取关联结果)
+        with profiler.stage('statistics'):
+            stats.save("crime_statistics.npz")
+            stats_df = stats.to_frame()
+            save_statistics(stats_df, f"crime_by_census_tract.{output_format}", enrichment)
+            save_time_histograms(stats, output_format=output_format)
+        
+        # 日期 × tract × 类型 的累计立方体, 供按时间窗口查询
+        with profiler.stage('crime_cube'):
+            cube.save("crime_cube_counts.npz")
+            cube.build("crime_cube.npy")
     
     # 步骤4: 生成可视化
-    visualize_crime_data(stats_df, tracts_gdf)
+    with profiler.stage('visualize'):
+        visualize_crime_data(stats_df, tracts_gdf)
     
     elapsed_time = time.time() - start_time
     print(f"处理完成! 耗时: {elapsed_time:.2f}秒 ({elapsed_time/60:.2f}分钟)")
+    profiler.write_report()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="关联犯罪数据与census tract并生成统计")
+    parser.add_argument('--workers', type=int, default=1, help="并行处理数据块的进程数")
+    parser.add_argument('--output-format', choices=['csv', 'parquet'], default='csv', help="关联结果和统计数据的输出格式")
+    parser.add_argument('--incremental', action='store_true', help="只处理上次运行后新增的记录")
+    parser.add_argument('--stats-only', action='store_true', help="只流式累计统计, 不写出逐条关联结果")
+    parser.add_argument('--profile', action='store_true', help="记录各阶段及每个数据块的耗时和内存, 写出运行报告")
+    parser.add_argument('--profile-stage', default=None, help="对该阶段运行cProfile并保存.prof文件 (需同时指定--profile)")
+    parser.add_argument('--population', default=POPULATION_CSV, help="按分割区域的人口与贫困数据CSV (存在时追加犯罪率等列)")
+    parser.add_argument('--education', default=EDUCATION_CSV, help="按census tract的学士及以上学历比例CSV")
+    parser.add_argument('--snap-distance', type=float, default=None,
+                        help="把不在任何多边形内的点分配给该距离(米)内最近的census tract")
+    parser.add_argument('--validate', action='store_true',
+                        help="关联前校验记录 (DR_NO去重、坐标/日期/时间/范围检查), 未通过的写入crime_data_rejected.csv")
+    args = parser.parse_args()
+    if args.incremental:
+        unsupported = incremental_conflicts(args.workers, args.stats_only, args.snap_distance, args.validate)
+        if unsupported:
+            parser.error(f"--incremental不能与{', '.join(unsupported)}同时使用")
+    main(workers=args.workers, output_format=args.output_format, incremental=args.incremental,
+         stats_only=args.stats_only, profile=args.profile, profile_stage=args.profile_stage,
+         population_csv=args.population, education_csv=args.education, snap_distance=args.snap_distance,
+         validate=args.validate)
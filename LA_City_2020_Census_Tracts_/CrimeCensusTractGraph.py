@@ -3,125 +3,63 @@ import geopandas as gpd
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import os
+import argparse
 import numpy as np
+from matplotlib import colormaps
 from matplotlib.patches import Patch
 from matplotlib.lines import Line2D
+from CensusTractLoader import load_tracts
+from TractRenderer import TractRenderer, render_many
+from StageProfiler import StageProfiler, NULL_PROFILER
 
 def load_data():
     """Load data files"""
     print("Loading data...")
     
-    # Set environment variable to handle potentially missing .shx file
-    os.environ['SHAPE_RESTORE_SHX'] = 'YES'
-    
-    # Load census tract shapefile
-    tracts_gdf = gpd.read_file('LA_City_2020_Census_Tracts_.shp')
+    # Load census tract shapefile (cached as GeoParquet after the first run)
+    tracts_gdf = load_tracts('LA_City_2020_Census_Tracts_.shp', crs=None)
     print(f"Loaded {len(tracts_gdf)} census tract areas")
     
-    # Load crime statistics data
-    stats_df = pd.read_csv('crime_by_census_tract.csv')
+    # Load crime statistics data (Parquet output keeps census_tract_id typed as string;
+    # for CSV read the ID columns as strings so they match CT20/LABEL)
+    parquet_path, csv_path = 'crime_by_census_tract.parquet', 'crime_by_census_tract.csv'
+    if os.path.exists(parquet_path) and (not os.path.exists(csv_path)
+                                         or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)):
+        stats_df = pd.read_parquet(parquet_path)
+    else:
+        stats_df = pd.read_csv(csv_path,
+                               dtype={'census_tract_id': str, 'census_tract_label': str})
     print(f"Loaded crime statistics for {len(stats_df)} census tracts")
     
-    # Print column names to diagnose matching issues
-    print("Census tract shapefile columns:", tracts_gdf.columns.tolist())
-    print("Crime statistics columns:", stats_df.columns.tolist())
-    
-    # Print sample data from both datasets
-    print("\nSample tract data (first row):")
-    print(tracts_gdf.iloc[0])
-    print("\nSample crime stats data (first row):")
-    print(stats_df.iloc[0])
-    
-    # 尝试不同的ID匹配方式
-    # 1. 尝试使用LABEL列代替CT20列进行匹配
-    if 'LABEL' in tracts_gdf.columns and 'census_tract_label' in stats_df.columns:
-        print("Trying to match using LABEL column instead")
-        tracts_gdf['LABEL'] = tracts_gdf['LABEL'].astype(str)
-        stats_df['census_tract_label'] = stats_df['census_tract_label'].astype(str)
-        
-        # 打印样本数据帮助调试
-        print("First 5 LABEL values:", tracts_gdf['LABEL'].head().tolist())
-        print("First 5 census_tract_label values:", stats_df['census_tract_label'].head().tolist())
-    
-    # 2. 确保CT20和census_tract_id数据类型一致
-    if 'CT20' in tracts_gdf.columns:
-        tracts_gdf['CT20'] = tracts_gdf['CT20'].astype(str)
-    if 'census_tract_id' in stats_df.columns:
-        stats_df['census_tract_id'] = stats_df['census_tract_id'].astype(str)
-    
-    # 3. 尝试格式化census_tract_id (移除可能的小数点)
-    if 'census_tract_id' in stats_df.columns:
-        # 转换浮点数为整数字符串 (例如 "123.0" -> "123")
-        try:
-            stats_df['census_tract_id'] = stats_df['census_tract_id'].apply(
-                lambda x: str(int(float(x))) if pd.notnull(x) and '.' in str(x) else str(x)
-            )
-        except:
-            print("Warning: Failed to format census_tract_id column")
-    
     return tracts_gdf, stats_df
 
-def create_choropleth(tracts_gdf, stats_df, output_path="crime_heatmap.png"):
-    """Create crime distribution heatmap"""
-    print("Generating crime heatmap...")
-    
-    # 数据类型转换 - 确保匹配
-    tracts_gdf = tracts_gdf.copy()
-    stats_df = stats_df.copy()
-    
-    # 转换为字符串进行匹配
-    tracts_gdf['CT20'] = tracts_gdf['CT20'].astype(str)
-    stats_df['census_tract_id'] = stats_df['census_tract_id'].astype(str)
-    
+def choropleth_job(renderer, stats_df, output_path="crime_heatmap.png"):
+    """Build the render arguments for the crime heatmap"""
     # 打印匹配前的数据样本用于调试
-    print("Shapefile CT20数据样本:", tracts_gdf['CT20'].head().tolist())
-    print("统计数据census_tract_id样本:", stats_df['census_tract_id'].head().tolist())
+    print("Shapefile CT20数据样本:", renderer.tract_ids[:5].tolist())
+    print("统计数据census_tract_id样本:", stats_df['census_tract_id'].astype(str).head().tolist())
     
-    # 合并统计数据和地理数据
-    merged_gdf = tracts_gdf.merge(stats_df, left_on='CT20', right_on='census_tract_id', how='left')
+    # 按tract顺序对齐统计数据
+    values = renderer.align(stats_df, 'total_crimes')
+    matched = int(np.count_nonzero(~np.isnan(values)))
     
     # 检查匹配结果
-    print(f"成功匹配记录数: {merged_gdf['total_crimes'].notna().sum()} / {len(tracts_gdf)}")
-    
-    # 如果仍然没有匹配，需要实际检查数据内容
-    if merged_gdf['total_crimes'].notna().sum() == 0:
-        print("\nWARNING: Still no matches found. Investigating data:")
-        print("CT20 values (first 10):", tracts_gdf['CT20'].head(10).tolist())
-        print("census_tract_id values (first 10):", stats_df['census_tract_id'].head(10).tolist())
-        
-        if 'LABEL' in tracts_gdf.columns:
-            print("LABEL values (first 10):", tracts_gdf['LABEL'].head(10).tolist())
-        if 'census_tract_label' in stats_df.columns:
-            print("census_tract_label values (first 10):", stats_df['census_tract_label'].head(10).tolist())
-    
-    # 如果尝试匹配都失败，生成基本地图
-    if merged_gdf['total_crimes'].notna().sum() == 0:
-        print("WARNING: No crime data matched with census tracts. Creating a basic map.")
-        fig, ax = plt.subplots(1, 1, figsize=(15, 10))
-        
-        # Draw basic map
-        tracts_gdf.plot(
-            edgecolor='black',
-            linewidth=0.3,
-            ax=ax,
-            color='lightgrey'
-        )
-        
-        ax.set_title('Los Angeles Census Tracts (No Crime Data Matched)', fontsize=16)
-        ax.set_axis_off()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        print(f"Basic map saved to {output_path}")
-        return fig
-    
-    # Create figure
-    fig, ax = plt.subplots(1, 1, figsize=(15, 10))
-    
-    # Use custom color map
-    cmap = plt.cm.OrRd
+    print(f"成功匹配记录数: {matched} / {len(values)}")
+    
+    # 如果匹配失败，生成基本地图
+    if matched == 0:
+        print("\nWARNING: No crime data matched with census tracts. Creating a basic map.")
+        print("CT20 values (first 10):", renderer.tract_ids[:10].tolist())
+        print("census_tract_id values (first 10):", stats_df['census_tract_id'].astype(str).head(10).tolist())
+        return {
+            'values': values,
+            'output_path': output_path,
+            'title': 'Los Angeles Census Tracts (No Crime Data Matched)',
+        }
     
     # Data range - log transform for better distribution display
-    vmin = merged_gdf['total_crimes'].min() or 1
-    vmax = merged_gdf['total_crimes'].max() or 100
+    vmin = np.nanmin(values) or 1
+    vmax = np.nanmax(values) or 100
     print(f"Data range: min={vmin}, max={vmax}")
     
     # Use linear norm if min or max is invalid for log scale
@@ -130,33 +68,21 @@ def create_choropleth(tracts_gdf, stats_df, output_path="crime_heatmap.png"):
     else:
         norm = colors.LogNorm(vmin=vmin, vmax=vmax)
     
-    # Draw heatmap
-    merged_gdf.plot(
-        column='total_crimes',
-        cmap=cmap,
-        norm=norm,
-        edgecolor='black',
-        linewidth=0.3,
-        ax=ax,
-        missing_kwds={'color': 'lightgrey'}
-    )
-    
-    # Add color bar
-    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    cbar = fig.colorbar(sm, ax=ax, shrink=0.7)
-    cbar.set_label('Crime Count', fontsize=12)
-    
-    # Set title
-    ax.set_title('Crime Heatmap by Census Tract in Los Angeles', fontsize=16)
-    
-    # Remove axes
-    ax.set_axis_off()
-    
-    # Save image
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    return {
+        'values': values,
+        'output_path': output_path,
+        'cmap': 'OrRd',
+        'norm': norm,
+        'colorbar_label': 'Crime Count',
+        'title': 'Crime Heatmap by Census Tract in Los Angeles',
+    }
+
+def create_choropleth(tracts_gdf, stats_df, output_path="crime_heatmap.png", renderer=None):
+    """Create crime distribution heatmap"""
+    print("Generating crime heatmap...")
+    renderer = renderer or TractRenderer(tracts_gdf)
+    fig = renderer.render(**choropleth_job(renderer, stats_df, output_path))
     print(f"Heatmap saved to {output_path}")
-    
     return fig
 
 def create_crime_type_charts(stats_df, output_path="crime_types_chart.png"):
@@ -224,51 +150,29 @@ def create_crime_type_charts(stats_df, output_path="crime_types_chart.png"):
     
     plt.tight_layout()
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close(fig)
     print(f"Crime type charts saved to {output_path}")
     
     return fig
 
-def create_crime_hotspots_map(tracts_gdf, stats_df, output_path="crime_hotspots.png"):
-    """Create crime hotspots map"""
-    print("Generating crime hotspots map...")
-    
-    # Merge data
-    merged_gdf = tracts_gdf.merge(
-        stats_df, 
-        left_on='CT20', 
-        right_on='census_tract_id', 
-        how='left'
-    )
+def hotspots_job(renderer, stats_df, output_path="crime_hotspots.png"):
+    """Build the render arguments for the crime hotspots map"""
+    total_crimes = renderer.align(stats_df, 'total_crimes')
     
     # Calculate quantiles
-    q = merged_gdf['total_crimes'].quantile([0.25, 0.5, 0.75, 0.9, 0.95, 0.99])
+    q = pd.Series(total_crimes).quantile([0.25, 0.5, 0.75, 0.9, 0.95, 0.99])
     
     # Create hotspot classification
-    merged_gdf['hotspot_level'] = 0  # No data
-    merged_gdf.loc[merged_gdf['total_crimes'].notna(), 'hotspot_level'] = 1  # Has data but below Q1
-    merged_gdf.loc[merged_gdf['total_crimes'] > q[0.25], 'hotspot_level'] = 2  # Q1-Q2
-    merged_gdf.loc[merged_gdf['total_crimes'] > q[0.5], 'hotspot_level'] = 3   # Q2-Q3
-    merged_gdf.loc[merged_gdf['total_crimes'] > q[0.75], 'hotspot_level'] = 4  # Q3-90%
-    merged_gdf.loc[merged_gdf['total_crimes'] > q[0.9], 'hotspot_level'] = 5   # 90%-95%
-    merged_gdf.loc[merged_gdf['total_crimes'] > q[0.95], 'hotspot_level'] = 6  # 95%-99%
-    merged_gdf.loc[merged_gdf['total_crimes'] > q[0.99], 'hotspot_level'] = 7  # Top 1%
-    
-    # Create figure
-    fig, ax = plt.subplots(1, 1, figsize=(15, 10))
-    
-    # Create hotspot color scale
-    cmap = plt.cm.get_cmap('YlOrRd', 7)
-    
-    # Draw hotspots map
-    merged_gdf.plot(
-        column='hotspot_level',
-        cmap=cmap,
-        edgecolor='black',
-        linewidth=0.3,
-        ax=ax,
-        categorical=True,
-        missing_kwds={'color': 'lightgrey'}
-    )
+    hotspot_level = np.zeros(len(total_crimes))  # No data
+    hotspot_level[~np.isnan(total_crimes)] = 1  # Has data but below Q1
+    for level, quantile in enumerate(q.index, start=2):
+        hotspot_level[total_crimes > q[quantile]] = level  # Q1-Q2 ... Top 1%
+    # 无数据的tract用missing_color绘制
+    hotspot_level[hotspot_level == 0] = np.nan
+    
+    # Create hotspot color scale, level i uses colour i-1
+    cmap = colormaps['YlOrRd'].resampled(7)
+    norm = colors.BoundaryNorm(np.arange(0.5, 8.5), cmap.N)
     
     # Custom legend
     legend_labels = {
@@ -293,41 +197,57 @@ def create_crime_hotspots_map(tracts_gdf, stats_df, output_path="crime_hotspots.
                   label=f"{legend_labels[i]} ({int(q[list(q.index)[min(i-1, len(q)-1)]]) if i > 1 else 0}+ crimes)")
         )
     
-    # Add legend
-    ax.legend(
-        handles=legend_elements,
-        title="Crime Hotspot Level",
-        loc="lower right",
-        fontsize=10
-    )
-    
-    # Set title
-    ax.set_title('Los Angeles Crime Hotspots Map', fontsize=16)
-    
-    # Remove axes
-    ax.set_axis_off()
-    
-    # Save image
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    return {
+        'values': hotspot_level,
+        'output_path': output_path,
+        'cmap': cmap,
+        'norm': norm,
+        'legend_handles': legend_elements,
+        'legend_title': 'Crime Hotspot Level',
+        'title': 'Los Angeles Crime Hotspots Map',
+    }
+
+def create_crime_hotspots_map(tracts_gdf, stats_df, output_path="crime_hotspots.png", renderer=None):
+    """Create crime hotspots map"""
+    print("Generating crime hotspots map...")
+    renderer = renderer or TractRenderer(tracts_gdf)
+    fig = renderer.render(**hotspots_job(renderer, stats_df, output_path))
     print(f"Hotspots map saved to {output_path}")
-    
     return fig
 
-def main():
+def main(workers=1, profile=False, profile_stage=None):
     """Main function"""
+    profiler = StageProfiler(profile_stage=profile_stage, report_prefix="run_report_graph") if profile else NULL_PROFILER
+    
     # Load data
-    tracts_gdf, stats_df = load_data()
+    with profiler.stage('load_data'):
+        tracts_gdf, stats_df = load_data()
     
-    # Create heatmap
-    create_choropleth(tracts_gdf, stats_df)
+    # Tract paths are built once and shared by every map
+    with profiler.stage('build_renderer', rows=len(tracts_gdf)):
+        renderer = TractRenderer(tracts_gdf)
     
     # Create crime type charts
-    create_crime_type_charts(stats_df)
-    
-    # Create hotspots map
-    create_crime_hotspots_map(tracts_gdf, stats_df)
+    with profiler.stage('crime_type_charts'):
+        create_crime_type_charts(stats_df)
+    
+    # Create heatmap and hotspots map (in parallel when workers > 1)
+    print("Generating crime heatmap and hotspots map...")
+    with profiler.stage('render_maps'):
+        jobs = [
+            choropleth_job(renderer, stats_df),
+            hotspots_job(renderer, stats_df),
+        ]
+        for path in render_many(renderer, jobs, workers=workers):
+            print(f"Map saved to {path}")
     
     print("All visualization charts generated successfully!")
+    profiler.write_report()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate crime maps and charts by census tract")
+    parser.add_argument('--workers', type=int, default=1, help="number of processes used to render the maps")
+    parser.add_argument('--profile', action='store_true', help="record time and memory per stage and write a run report")
+    parser.add_argument('--profile-stage', default=None, help="run cProfile for this stage and dump a .prof file (with --profile)")
+    args = parser.parse_args()
+    main(workers=args.workers, profile=args.profile, profile_stage=args.profile_stage)
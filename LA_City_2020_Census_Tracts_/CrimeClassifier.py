@@ -0,0 +1,243 @@
+import argparse
+import contextlib
+import itertools
+import multiprocessing
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, roc_auc_score
+from tqdm import tqdm
+
+from ChunkPool import read_line_blocks, ordered_map
+from CrimeCensusTract import CsvChunkWriter, iter_crime_tracts
+from CrimeFeatures import CrimeFeatureBuilder, FEATURE_NAMES, SOURCE_COLUMNS, build_features, load_features
+from CrimeSourceReader import iter_source_chunks, read_source_text
+from CrimeStatistics import CrimeStatistics
+from StageProfiler import StageProfiler
+
+# predict追加到关联记录后的列
+PREDICTION_COLUMNS = ['predicted_part', 'part_1_probability']
+
+@contextlib.contextmanager
+def _stage(profiler, name, rows=None):
+    """记录一个阶段并打印耗时、吞吐量和该阶段内的峰值内存; 行数在结束时才知道时设置yield的dict的'rows'"""
+    with profiler.stage(name, rows) as info:
+        yield info
+    record = profiler.records[-1]
+    throughput = f", {record['rows_per_s']:,.0f} 行/秒" if record['rows_per_s'] else ""
+    children = record['stage_peak_children_rss_mb']
+    children = f" / 子进程 {children:.0f}MB" if children else ""
+    print(f"[{name}] 耗时 {record['wall_s']:.2f}秒{throughput}, 峰值内存 主进程 {record['stage_peak_rss_mb']:.0f}MB{children}")
+
+def _load_builder(geocoded_path, stats_path, profiler):
+    """载入特征构建器(census tract与tract聚合特征)"""
+    with _stage(profiler, "载入census tract") as info:
+        builder = CrimeFeatureBuilder.from_outputs(geocoded_path, CrimeStatistics.load(stats_path))
+        info['rows'] = len(builder.crime_ids)
+    return builder
+
+def train(crime_csv_path, geocoded_path='crime_data_with_census_tracts.csv', stats_path='crime_statistics.npz',
+          model_path='part_classifier.joblib', holdout=0.2, chunk_size=200000, n_estimators=200,
+          max_train_rows=None, seed=0, features_prefix='crime_features', workers=1):
+    """
+    Train the Part 1 vs Part 2 Random Forest on a time-based split.
+
+    The features come from the memory-mapped matrix of
+    CrimeFeatures.build_features ({features_prefix}.X.npy etc.), which is
+    built first when it does not exist yet; rebuild it after the source,
+    the geocoded records or the statistics change. Only the rows of the
+    split are copied into memory. The latest `holdout` share of the
+    records, ranked by occurrence date, is held out for evaluation; the
+    forest is fitted on all cores. Each stage prints its time, throughput
+    and peak memory (see StageProfiler).
+
+    Parameters:
+    -----------
+    crime_csv_path : str
+        Source crime CSV
+    holdout : float
+        Share of the records, the most recent by occurrence date, used as the
+        test set (records on the cutoff day all go to the test set)
+    max_train_rows : int, optional
+        Randomly subsample the training rows to this many
+    features_prefix : str
+        Prefix of the build_features output
+    workers : int
+        Processes used when the feature matrix has to be built
+
+    Returns:
+    --------
+    dict
+        Holdout metrics
+    """
+    profiler = StageProfiler()
+    if not os.path.exists(f"{features_prefix}.json"):
+        with _stage(profiler, "生成特征") as info:
+            info['rows'] = build_features(crime_csv_path, geocoded_path, stats_path, features_prefix,
+                                          chunk_size=chunk_size, workers=workers)
+    X, y, day, _ = load_features(features_prefix)
+
+    # 只保留有标签和日期的记录, 按发生日期切分训练集和测试集
+    usable = (y > 0) & (day >= 0)
+    if not usable.any():
+        raise ValueError(f"{features_prefix} 中没有同时具有Part 1-2标签和发生日期的记录, 无法切分训练集和测试集")
+    cutoff = int(np.quantile(day[usable], 1 - holdout))
+    train_rows = np.flatnonzero(usable & (day < cutoff))
+    test_rows = np.flatnonzero(usable & (day >= cutoff))
+    if len(train_rows) == 0:
+        raise ValueError(f"发生日期早于 {np.datetime64(cutoff, 'D')} 的记录为空, 请减小holdout")
+    if max_train_rows is not None and len(train_rows) > max_train_rows:
+        train_rows = np.sort(np.random.default_rng(seed).choice(train_rows, max_train_rows, replace=False))
+    X_train, y_train = X[train_rows], y[train_rows]
+    X_test, y_test = X[test_rows], y[test_rows]
+    print(f"训练集 {len(X_train)} 行 (发生日期早于 {np.datetime64(cutoff, 'D')}), 测试集 {len(X_test)} 行")
+
+    with _stage(profiler, "训练", len(X_train)):
+        model = RandomForestClassifier(n_estimators=n_estimators, min_samples_leaf=5, n_jobs=-1, random_state=seed)
+        model.fit(X_train, y_train)
+
+    with _stage(profiler, "评估", len(X_test)):
+        metrics = {'train_rows': len(X_train), 'test_rows': len(X_test), 'cutoff': str(np.datetime64(cutoff, 'D'))}
+        if len(X_test):
+            proba = model.predict_proba(X_test)
+            metrics['accuracy'] = float(accuracy_score(y_test, model.classes_[proba.argmax(axis=1)]))
+            if len(model.classes_) == 2 and len(np.unique(y_test)) == 2:
+                metrics['roc_auc'] = float(roc_auc_score(y_test == 1, proba[:, list(model.classes_).index(1)]))
+    print(f"测试集指标: {metrics}")
+
+    # 预测时每个工作进程单线程评分
+    model.set_params(n_jobs=1)
+    joblib.dump({'model': model, 'feature_names': FEATURE_NAMES, 'metrics': metrics}, model_path)
+    print(f"模型已保存至 {model_path}")
+    return metrics
+
+# 并行评分时由fork继承的模型和特征构建器
+_worker_model = None
+_worker_builder = None
+
+def _score_frame(chunk, model, builder):
+    """对一个数据块评分, 返回(DR_NO, 预测的Part 1-2, Part 1概率); DR_NO缺失的记录无法关联, 不返回"""
+    chunk = chunk[chunk['DR_NO'].notna()]
+    X, _, _ = builder.transform(chunk)
+    proba = model.predict_proba(X)
+    part_1 = list(model.classes_).index(1) if 1 in model.classes_ else None
+    return (
+        chunk['DR_NO'].to_numpy(dtype=np.int64),
+        model.classes_[proba.argmax(axis=1)].astype(np.int8),
+        (proba[:, part_1] if part_1 is not None else np.zeros(len(X))).astype(np.float32),
+    )
+
+def _score_block(header, block):
+    """工作进程: 解析一段原始CSV文本并评分"""
+    chunk = read_source_text(header + block, SOURCE_COLUMNS)
+    return _score_frame(chunk, _worker_model, _worker_builder)
+
+def _join_predictions(geocoded_path, output_csv, ids, parts, probabilities, chunk_size=500000):
+    """按crime_id把预测结果追加到关联结果的每条记录后, 没有预测的记录两列为空; 返回写出的行数"""
+    order = np.argsort(ids, kind='stable')
+    ids, parts, probabilities = ids[order], parts[order], probabilities[order]
+    chunks = iter_crime_tracts(geocoded_path, chunk_size=chunk_size)
+    first = next(chunks, None)
+    if first is None:
+        return 0
+    rows = 0
+    with CsvChunkWriter(output_csv, columns=list(first.columns) + PREDICTION_COLUMNS) as writer:
+        for chunk in itertools.chain([first], chunks):
+            crime_id = pd.to_numeric(chunk['crime_id'], errors='coerce').to_numpy(dtype=np.float64)
+            known = np.flatnonzero(~np.isnan(crime_id))
+            pos = np.zeros(len(chunk), dtype=np.int64)
+            found = np.zeros(len(chunk), dtype=bool)
+            if len(ids):
+                pos[known] = np.minimum(np.searchsorted(ids, crime_id[known].astype(np.int64)), len(ids) - 1)
+                found[known] = ids[pos[known]] == crime_id[known].astype(np.int64)
+            predicted = pd.array(parts[pos] if len(ids) else np.zeros(len(chunk), dtype=np.int8), dtype='Int8')
+            predicted[~found] = pd.NA
+            chunk['predicted_part'] = predicted
+            chunk['part_1_probability'] = np.where(found, probabilities[pos] if len(ids) else np.nan, np.nan).astype(np.float32)
+            writer.write(chunk)
+            rows += len(chunk)
+    return rows
+
+def predict(crime_csv_path, geocoded_path='crime_data_with_census_tracts.csv', stats_path='crime_statistics.npz',
+            model_path='part_classifier.joblib', output_csv='crime_data_with_part_predictions.csv', chunk_size=100000,
+            workers=1):
+    """
+    Score every record of the source CSV with a saved model and join the
+    predictions onto the geocoded records.
+
+    Chunks are scored on a fork process pool (at most workers * 2 in flight);
+    only the DR_NO, predicted part and Part 1 probability of each record are
+    kept (13 bytes per record). The geocoded records are then streamed and
+    written to output_csv with PREDICTION_COLUMNS appended, matched on
+    crime_id; records without a prediction get empty values.
+
+    Returns:
+    --------
+    int
+        Number of geocoded records written
+    """
+    global _worker_model, _worker_builder
+    profiler = StageProfiler()
+    with _stage(profiler, "载入模型"):
+        saved = joblib.load(model_path)
+        if saved['feature_names'] != FEATURE_NAMES:
+            raise ValueError(f"{model_path} 使用的特征与当前CrimeFeatures不一致, 请重新训练")
+        model = saved['model']
+        model.set_params(n_jobs=1)
+
+    builder = _load_builder(geocoded_path, stats_path, profiler)
+
+    scored = []
+    with _stage(profiler, "评分") as info, tqdm(desc="评分") as pbar:
+        def collect(result):
+            scored.append(result)
+            pbar.update(len(result[0]))
+            profiler.sample()
+
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            _worker_model, _worker_builder = model, builder
+            try:
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    for result in ordered_map(pool, _score_block, read_line_blocks(crime_csv_path, chunk_size), workers):
+                        collect(result)
+            finally:
+                _worker_model, _worker_builder = None, None
+        else:
+            for chunk in iter_source_chunks(crime_csv_path, SOURCE_COLUMNS, chunk_size):
+                collect(_score_frame(chunk, model, builder))
+        ids, parts, probabilities = (np.concatenate(column) for column in zip(*scored)) if scored else \
+            (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.float32))
+        info['rows'] = len(ids)
+
+    with _stage(profiler, "关联预测结果") as info:
+        info['rows'] = _join_predictions(geocoded_path, output_csv, ids, parts, probabilities)
+    print(f"预测结果已追加到关联记录并保存至 {output_csv}")
+    return info['rows']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or apply the Part 1 vs Part 2 crime classifier")
+    parser.add_argument('command', choices=['train', 'predict'])
+    parser.add_argument('--source', default='Crime_Data_from_2020_to_Present.csv')
+    parser.add_argument('--geocoded', default='crime_data_with_census_tracts.csv', help="process_crime_data output")
+    parser.add_argument('--stats', default='crime_statistics.npz')
+    parser.add_argument('--model', default='part_classifier.joblib')
+    parser.add_argument('--output', default='crime_data_with_part_predictions.csv',
+                        help="geocoded records with the predictions, written by predict")
+    parser.add_argument('--features', default='crime_features', help="build_features output prefix used by train")
+    parser.add_argument('--holdout', type=float, default=0.2, help="share of records, latest by occurrence date, held out by train")
+    parser.add_argument('--n-estimators', type=int, default=200)
+    parser.add_argument('--max-train-rows', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=max(1, multiprocessing.cpu_count() - 1),
+                        help="processes used by predict, and by train when it builds the feature matrix")
+    args = parser.parse_args()
+    if args.command == 'train':
+        train(args.source, args.geocoded, args.stats, args.model, holdout=args.holdout, chunk_size=args.chunk_size,
+              n_estimators=args.n_estimators, max_train_rows=args.max_train_rows, features_prefix=args.features,
+              workers=args.workers)
+    else:
+        predict(args.source, args.geocoded, args.stats, args.model, args.output, chunk_size=args.chunk_size,
+                workers=args.workers)
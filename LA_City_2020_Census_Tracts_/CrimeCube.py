@@ -0,0 +1,289 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from CrimeStatistics import MAX_CRIME_TYPES, UNKNOWN_TYPE, KeyCounts, parse_dates
+
+# 日期编号的起点, 与CrimeStatistics的BASE_YEAR一致
+BASE_DATE = np.datetime64('2000-01-01', 'D')
+OTHER_TYPE = 'OTHER'
+
+class CrimeCubeBuilder(KeyCounts):
+    """
+    Sparse day × tract × crime type counts, accumulated during ingest.
+
+    Works like CrimeStatistics: each chunk is folded in as (composite key,
+    count) pairs, partial builders from worker processes can be merged, and
+    the counts are saved as a compressed .npz so incremental runs can keep
+    adding to them. build() turns the counts into the dense cumulative cube
+    that CrimeCube queries. Records without a parsable occurrence date are
+    only counted in `undated`.
+
+    Parameters:
+    -----------
+    tract_ids : array-like of str
+        Canonical census tract IDs (CT20), defines the tract index
+    """
+
+    def __init__(self, tract_ids):
+        super().__init__(tract_ids)
+        self.undated = 0
+
+    @classmethod
+    def from_locator(cls, locator):
+        """Builder indexed by the tracts of a TractLocator"""
+        return cls(locator.ct20)
+
+    def _split_keys(self, keys):
+        """拆出组合键中的日期编号、tract和类型"""
+        crime_type = keys % MAX_CRIME_TYPES
+        day_tract = keys // MAX_CRIME_TYPES
+        return day_tract // len(self.tract_ids), day_tract % len(self.tract_ids), crime_type
+
+    def add(self, tract_idx, crime_types, dates):
+        """
+        Fold one chunk of records into the counts.
+
+        Parameters:
+        -----------
+        tract_idx : numpy.ndarray
+            Tract positions in the canonical index, -1 for records without a tract (ignored)
+        crime_types : array-like
+            Crime type descriptions, NaN for unknown
+        dates : array-like
+            Occurrence dates (strings in SOURCE_DATE_FORMAT or datetimes)
+        """
+        tract_idx = np.asarray(tract_idx)
+        keep = tract_idx >= 0
+        if not keep.any():
+            return
+        day = parse_dates(np.asarray(dates)[keep]).to_numpy().astype('datetime64[D]')
+        dated = ~np.isnat(day) & (day >= BASE_DATE)
+        self.undated += int((~dated).sum())
+        day = (day[dated] - BASE_DATE).astype(np.int64)
+        tract = tract_idx[keep][dated].astype(np.int64)
+        crime_type = self._encode_types(np.asarray(crime_types, dtype=object)[keep][dated])
+        self._accumulate((day * len(self.tract_ids) + tract) * MAX_CRIME_TYPES + crime_type)
+
+    def add_frame(self, df):
+        """Fold a geocoded chunk (process_crime_data output columns) into the counts"""
+        return self.add(self._tract_index.get_indexer(df['census_tract_id']), df['crime_type'], df['date'])
+
+    def merge(self, other):
+        """Fold another builder's counts (e.g. built by a worker process) into this one"""
+        self.undated += other.undated
+        if len(other.keys) == 0:
+            return
+        if not np.array_equal(self.tract_ids, other.tract_ids):
+            raise ValueError("只能合并同一组tract上的计数")
+        mapping = np.full(MAX_CRIME_TYPES, UNKNOWN_TYPE, dtype=np.int64)
+        mapping[:len(other.crime_types)] = self._encode_types(other.crime_types)
+        day, tract, crime_type = other._split_keys(other.keys)
+        self._accumulate((day * len(self.tract_ids) + tract) * MAX_CRIME_TYPES + mapping[crime_type], other.counts)
+
+    def save(self, path):
+        """Save the sparse counts to a compressed .npz file"""
+        np.savez_compressed(
+            path,
+            keys=self.keys,
+            counts=self.counts,
+            tract_ids=self.tract_ids,
+            crime_types=np.asarray(self.crime_types, dtype=str),
+            undated=self.undated,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load counts saved with save()"""
+        with np.load(path) as data:
+            builder = cls(data['tract_ids'])
+            builder.keys = data['keys']
+            builder.counts = data['counts']
+            builder.crime_types = data['crime_types'].tolist()
+            builder.undated = int(data['undated'])
+        builder._type_codes = {name: i for i, name in enumerate(builder.crime_types)}
+        return builder
+
+    def build(self, cube_path, max_types=20, bin_days=1):
+        """
+        Write the cumulative cube as a .npy file plus a .json sidecar.
+
+        cube[b, t, k] is the number of crimes of type k in tract t that
+        occurred before time bin b, so any window sum is cube[end] - cube[start].
+        The time axis starts at the first observed day (start_date in the
+        sidecar), not at BASE_DATE. The cube stays dense so it can be
+        memory-mapped, and is compressed by storing the prefix sums in the
+        narrowest unsigned dtype (uint8/uint16/uint32) that holds the final
+        totals; the sparse counts saved by save() are the zlib-compressed form.
+
+        Parameters:
+        -----------
+        cube_path : str
+            Output .npy path (memory-mapped by CrimeCube)
+        max_types : int
+            The most frequent types get their own slot, the rest (and unknown
+            types) share an OTHER slot
+        bin_days : int
+            Days per time bin (1 = daily, 7 = weekly)
+
+        Returns:
+        --------
+        CrimeCube
+        """
+        day, tract, crime_type = self._split_keys(self.keys)
+        type_totals = np.bincount(crime_type, weights=self.counts, minlength=MAX_CRIME_TYPES)[:len(self.crime_types)]
+        # 数量降序, 并列时按类型名称升序
+        order = np.lexsort((np.asarray(self.crime_types, dtype=object).argsort().argsort(), -type_totals))
+        kept = order[type_totals[order] > 0][:max_types]
+        slot = np.full(MAX_CRIME_TYPES, len(kept), dtype=np.int64)
+        slot[kept] = np.arange(len(kept))
+        cube_types = [self.crime_types[i] for i in kept] + [OTHER_TYPE]
+
+        first_day = int(day.min()) if len(day) else 0
+        bins = (int(day.max()) - first_day) // bin_days + 1 if len(day) else 0
+        shape = (bins + 1, len(self.tract_ids), len(cube_types))
+
+        # 前缀和的最大值是每个tract × 类型的总数, 按它选择最窄的整数类型
+        cell = tract * shape[2] + slot[crime_type]
+        largest = int(np.bincount(cell, weights=self.counts, minlength=shape[1] * shape[2]).max()) if len(cell) else 0
+        dtype = np.promote_types(np.min_scalar_type(largest), np.uint8)
+
+        cube = np.lib.format.open_memmap(cube_path, mode='w+', dtype=dtype, shape=shape)
+        cube[:] = 0
+        # 先把每个时间段的计数写到下一行, 再沿时间轴原地累加
+        flat = ((day - first_day) // bin_days + 1) * (shape[1] * shape[2]) + cell
+        np.add.at(cube.reshape(-1), flat, self.counts.astype(dtype))
+        np.cumsum(cube, axis=0, out=cube)
+        cube.flush()
+        del cube
+
+        meta = {
+            'start_date': str(BASE_DATE + first_day),
+            'bin_days': bin_days,
+            'shape': list(shape),
+            'tract_ids': self.tract_ids.tolist(),
+            'crime_types': cube_types,
+            'undated': self.undated,
+        }
+        with open(cube_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return CrimeCube.load(cube_path)
+
+class CrimeCube:
+    """
+    Memory-mapped cumulative tract × time × crime type cube.
+
+    Every query is answered from two (or, for series, a few) time slices of
+    the prefix sums, so its cost depends on the number of tracts and types
+    asked for, not on the number of crime records or days in the window.
+
+    Parameters:
+    -----------
+    cube : numpy.ndarray
+        Unsigned integer prefix sums, shape (bins + 1, tracts, types)
+    start_date : numpy.datetime64
+        First day of time bin 0
+    bin_days : int
+        Days per time bin
+    tract_ids : array-like of str
+        CT20 of each tract slot
+    crime_types : list of str
+        Crime type of each type slot (the last one is OTHER)
+    """
+
+    def __init__(self, cube, start_date, bin_days, tract_ids, crime_types):
+        self.cube = cube
+        self.start_date = np.datetime64(start_date, 'D')
+        self.bin_days = bin_days
+        self.tract_ids = np.asarray(tract_ids, dtype=str)
+        self._tract_index = pd.Index(self.tract_ids)
+        self.crime_types = list(crime_types)
+        self._type_index = pd.Index(self.crime_types)
+
+    @classmethod
+    def load(cls, cube_path):
+        """Memory-map a cube written by CrimeCubeBuilder.build"""
+        with open(cube_path + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        cube = np.load(cube_path, mmap_mode='r')
+        return cls(cube, meta['start_date'], meta['bin_days'], meta['tract_ids'], meta['crime_types'])
+
+    @property
+    def end_date(self):
+        """Day after the last time bin"""
+        return self.start_date + (self.cube.shape[0] - 1) * self.bin_days
+
+    def _bin(self, date, default):
+        """日期 -> 前缀和的行号 (按时间段向下取整, 截断到立方体范围内)"""
+        if date is None:
+            return default
+        offset = (np.datetime64(pd.Timestamp(date).date(), 'D') - self.start_date).astype(np.int64)
+        return int(np.clip(offset // self.bin_days, 0, self.cube.shape[0] - 1))
+
+    def _positions(self, index, values, what):
+        """名称 -> 位置, None表示全部"""
+        if values is None:
+            return slice(None)
+        values = [str(v) for v in np.atleast_1d(values)]
+        positions = index.get_indexer(values)
+        if (positions < 0).any():
+            missing = [v for v, p in zip(values, positions) if p < 0]
+            raise KeyError(f"未知的{what}: {missing[:5]}")
+        return positions
+
+    def _window(self, start, end, tracts, types):
+        """时间窗口[start, end)内的tract × 类型计数"""
+        lo = self._bin(start, 0)
+        hi = self._bin(end, self.cube.shape[0] - 1)
+        tract_pos = self._positions(self._tract_index, tracts, 'tract')
+        type_pos = self._positions(self._type_index, types, '犯罪类型')
+        upper = self.cube[hi][tract_pos][:, type_pos].astype(np.int64)
+        lower = self.cube[lo][tract_pos][:, type_pos].astype(np.int64)
+        return upper - lower
+
+    def count(self, start=None, end=None, tracts=None, types=None):
+        """
+        Number of crimes in [start, end) over a set of tracts and crime types.
+
+        Parameters:
+        -----------
+        start, end : date-like, optional
+            Window bounds (end exclusive), rounded down to time bins; None for the whole range
+        tracts : str or list of str, optional
+            CT20 values, None for all tracts
+        types : str or list of str, optional
+            Crime types from crime_types (including OTHER), None for all types
+        """
+        return int(self._window(start, end, tracts, types).sum())
+
+    def by_tract(self, start=None, end=None, tracts=None, types=None):
+        """Window counts per tract (pandas.Series indexed by census_tract_id)"""
+        counts = self._window(start, end, tracts, types).sum(axis=1)
+        ids = self.tract_ids if tracts is None else self.tract_ids[self._positions(self._tract_index, tracts, 'tract')]
+        return pd.Series(counts, index=pd.Index(ids, name='census_tract_id'), name='crimes')
+
+    def by_type(self, start=None, end=None, tracts=None, types=None):
+        """Window counts per crime type (pandas.Series indexed by crime_type)"""
+        counts = self._window(start, end, tracts, types).sum(axis=0)
+        names = self.crime_types if types is None else [self.crime_types[i] for i in
+                                                         self._positions(self._type_index, types, '犯罪类型')]
+        return pd.Series(counts, index=pd.Index(names, name='crime_type'), name='crimes')
+
+    def series(self, start=None, end=None, tracts=None, types=None, step=1):
+        """
+        Counts per period of `step` time bins, summed over the tract and type sets.
+
+        Returns:
+        --------
+        pandas.Series
+            Indexed by the first day of each period
+        """
+        lo = self._bin(start, 0)
+        hi = self._bin(end, self.cube.shape[0] - 1)
+        edges = np.append(np.arange(lo, hi, step), hi)
+        tract_pos = self._positions(self._tract_index, tracts, 'tract')
+        type_pos = self._positions(self._type_index, types, '犯罪类型')
+        totals = np.array([self.cube[edge][tract_pos][:, type_pos].sum(dtype=np.int64) for edge in edges])
+        dates = self.start_date + edges[:-1] * self.bin_days
+        return pd.Series(np.diff(totals), index=pd.DatetimeIndex(dates, name='date'), name='crimes')
@@ -0,0 +1,296 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+from ChunkPool import ordered_map
+from CensusTractLoader import load_tracts
+from CrimeCensusTract import iter_crime_tracts
+from CrimeStatistics import parse_dates
+
+try:
+    import rasterio
+    from rasterio.transform import from_origin
+except ImportError:
+    # 没有安装rasterio时只写出.npy网格
+    rasterio = None
+
+# 密度网格使用的投影坐标系 (UTM 11N, 单位米), 带宽在各方向上一致
+DENSITY_CRS = "EPSG:32611"
+
+# 分组方式: 分组名称 -> 需要读取的列
+GROUP_COLUMNS = {'none': [], 'type': ['crime_type'], 'year': ['date'], 'month': ['date']}
+
+class DensityGrid:
+    """
+    Regular grid over the census tracts for point histograms and KDE surfaces.
+
+    Cells are cell_size metres in DENSITY_CRS; row 0 is the southern edge
+    (min y), like CensusTractGrid.
+
+    Parameters:
+    -----------
+    origin : tuple of float
+        (min x, min y) in DENSITY_CRS
+    cell_size : float
+        Cell edge length in metres
+    shape : tuple of int
+        (rows, cols)
+    """
+
+    def __init__(self, origin, cell_size, shape):
+        self.origin = tuple(float(v) for v in origin)
+        self.cell_size = float(cell_size)
+        self.shape = tuple(int(v) for v in shape)
+        self.transformer = Transformer.from_crs("EPSG:4326", DENSITY_CRS, always_xy=True)
+
+    @classmethod
+    def from_tracts(cls, shapefile_path='LA_City_2020_Census_Tracts_.shp', cell_size=100.0, margin=2000.0):
+        """覆盖全部tract的网格, 四周留出margin米"""
+        min_x, min_y, max_x, max_y = load_tracts(shapefile_path, crs=DENSITY_CRS).total_bounds
+        min_x, min_y = min_x - margin, min_y - margin
+        cols = int(np.ceil((max_x + margin - min_x) / cell_size))
+        rows = int(np.ceil((max_y + margin - min_y) / cell_size))
+        return cls((min_x, min_y), cell_size, (rows, cols))
+
+    @property
+    def cells(self):
+        """网格单元总数"""
+        return self.shape[0] * self.shape[1]
+
+    def cell_indices(self, latitudes, longitudes):
+        """
+        Flat cell index of each point, -1 outside the grid or for missing coordinates.
+        """
+        x, y = self.transformer.transform(np.asarray(longitudes, dtype=np.float64),
+                                          np.asarray(latitudes, dtype=np.float64))
+        col = np.floor((x - self.origin[0]) / self.cell_size)
+        row = np.floor((y - self.origin[1]) / self.cell_size)
+        # NaN坐标比较结果为False, 同样视为网格外
+        inside = (col >= 0) & (col < self.shape[1]) & (row >= 0) & (row < self.shape[0])
+        index = np.full(len(x), -1, dtype=np.int64)
+        index[inside] = row[inside].astype(np.int64) * self.shape[1] + col[inside].astype(np.int64)
+        return index
+
+    def meta(self):
+        """写入.json的网格地理参考"""
+        return {'crs': DENSITY_CRS, 'origin': list(self.origin), 'cell_size': self.cell_size,
+                'shape': list(self.shape)}
+
+def _group_keys(chunk, by):
+    """每条记录所属的分组"""
+    if by == 'none':
+        return np.full(len(chunk), 'all', dtype=object)
+    if by == 'type':
+        return chunk['crime_type'].astype(str).to_numpy(dtype=object)
+    dates = parse_dates(chunk['date'].to_numpy())
+    labels = dates.strftime('%Y' if by == 'year' else '%Y-%m')
+    return np.asarray(labels, dtype=object)
+
+def point_histograms(geocoded_path, grid, by='none', chunk_size=1000000):
+    """
+    Bin geocoded crime points into per-group 2D histograms in one pass.
+
+    Each chunk is projected and binned with np.bincount over cells for the
+    'all' histogram and with np.add.at into one (groups, cells) uint32
+    array for the groups, which grows only when a new group appears, so a
+    chunk never allocates a dense groups x cells temporary.
+
+    Parameters:
+    -----------
+    geocoded_path : str
+        Output of process_crime_data (CSV or Parquet)
+    by : str
+        'none', 'type' (crime type), 'year' or 'month'
+
+    Returns:
+    --------
+    dict
+        Group name -> uint32 histogram of grid.shape; 'all' holds every point,
+        including points without a group (e.g. an empty date)
+    """
+    if by not in GROUP_COLUMNS:
+        raise ValueError(f"不支持的分组方式: {by}")
+    columns = ['latitude', 'longitude'] + GROUP_COLUMNS[by]
+    totals = np.zeros(grid.cells, dtype=np.uint32)
+    # 分组名 -> counts中的行号
+    groups = {}
+    counts = np.zeros((0, grid.cells), dtype=np.uint32)
+    points = 0
+    for chunk in iter_crime_tracts(geocoded_path, columns=columns, chunk_size=chunk_size):
+        cell = grid.cell_indices(chunk['latitude'].to_numpy(), chunk['longitude'].to_numpy())
+        keep = cell >= 0
+        points += int(keep.sum())
+        totals += np.bincount(cell[keep], minlength=grid.cells).astype(np.uint32)
+        if by == 'none':
+            continue
+        codes, uniques = pd.factorize(_group_keys(chunk, by)[keep])
+        # 日期缺失的记录没有分组 (factorize记为-1), 只计入'all'
+        grouped = codes >= 0
+        rows = np.array([groups.setdefault(name, len(groups)) for name in uniques], dtype=np.intp)
+        if len(groups) > len(counts):
+            # 出现新分组时按倍数扩容, 避免每个新分组都复制一次
+            grown = np.zeros((max(len(groups), 2 * len(counts)), grid.cells), dtype=np.uint32)
+            grown[:len(counts)] = counts
+            counts = grown
+        np.add.at(counts, (rows[codes[grouped]], cell[keep][grouped]), 1)
+    print(f"{points} 个点落入 {grid.shape[0]}x{grid.shape[1]} 网格, {len(groups)} 个分组")
+    histograms = {'all': totals.reshape(grid.shape)}
+    for name in sorted(groups):
+        histograms[name] = counts[groups[name]].reshape(grid.shape)
+    return histograms
+
+def gaussian_smooth(histogram, sigma_cells):
+    """
+    Gaussian KDE of a 2D histogram by FFT convolution.
+
+    The histogram is zero-padded by at least 4 sigma so nothing wraps
+    around, and multiplied in the frequency domain by the Gaussian's
+    analytical transfer function exp(-2 pi^2 sigma^2 f^2), so no kernel
+    array is built. The kernel integrates to 1, so the result keeps the
+    point count apart from mass smoothed past the grid edge.
+
+    Parameters:
+    -----------
+    histogram : numpy.ndarray
+        2D point counts
+    sigma_cells : float
+        Bandwidth (standard deviation) in cells
+
+    Returns:
+    --------
+    numpy.ndarray
+        float64 smoothed counts, same shape as histogram
+    """
+    pad = int(np.ceil(4 * sigma_cells))
+    rows, cols = histogram.shape
+    # 填充后的尺寸取FFT友好的偶数
+    size = (rows + 2 * pad + 1) // 2 * 2, (cols + 2 * pad + 1) // 2 * 2
+    spectrum = np.fft.rfft2(histogram.astype(np.float64), s=size)
+    fy = np.fft.fftfreq(size[0])[:, None]
+    fx = np.fft.rfftfreq(size[1])[None, :]
+    spectrum *= np.exp(-2 * np.pi ** 2 * sigma_cells ** 2 * (fx ** 2 + fy ** 2))
+    # 越过网格边界的部分落在填充区, 截掉即可 (与在网格外补零的直接卷积一致)
+    smoothed = np.fft.irfft2(spectrum, s=size)[:rows, :cols]
+    return np.maximum(smoothed, 0)
+
+# 并行计算时由fork继承的直方图
+_worker_histograms = None
+
+def _smooth_group(name, sigma_cells, scale):
+    """工作进程: 一个分组的密度面"""
+    return (gaussian_smooth(_worker_histograms[name], sigma_cells) * scale).astype(np.float32)
+
+def density_surfaces(histograms, grid, bandwidth=300.0, workers=1):
+    """
+    Smooth every group's histogram into a density surface (crimes per km^2).
+
+    Parameters:
+    -----------
+    bandwidth : float
+        Gaussian kernel standard deviation in metres
+    workers : int
+        Processes used for the per-group FFTs
+
+    Returns:
+    --------
+    dict
+        Group name -> float32 density of grid.shape
+    """
+    global _worker_histograms
+    sigma_cells = bandwidth / grid.cell_size
+    scale = 1e6 / grid.cell_size ** 2
+    names = list(histograms)
+    if workers <= 1 or len(names) == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return {name: (gaussian_smooth(histograms[name], sigma_cells) * scale).astype(np.float32) for name in names}
+
+    _worker_histograms = histograms
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            # 限制在途任务数, 避免结果在父进程中堆积
+            tasks = ((name, sigma_cells, scale) for name in names)
+            surfaces = dict(zip(names, ordered_map(pool, _smooth_group, tasks, workers)))
+    finally:
+        _worker_histograms = None
+    return surfaces
+
+def save_surfaces(surfaces, grid, output_path='crime_density.npy', bandwidth=None, geotiff=True, counts=None):
+    """
+    Save the surfaces as one float32 (groups, rows, cols) .npy with a .json sidecar.
+
+    With rasterio installed and geotiff=True, also writes a multi-band
+    GeoTIFF (one band per group, north-up) next to it.
+
+    Returns:
+    --------
+    list of str
+        Written paths
+    """
+    names = list(surfaces)
+    stack = np.stack([surfaces[name] for name in names]).astype(np.float32)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, stack)
+    os.replace(tmp_path, output_path)
+    meta = dict(grid.meta(), groups=names, bandwidth=bandwidth, units='crimes per km^2',
+                points={name: int(counts[name].sum()) for name in names} if counts else None)
+    with open(output_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    written = [output_path, output_path + '.json']
+
+    if geotiff and rasterio is not None:
+        tif_path = os.path.splitext(output_path)[0] + '.tif'
+        top = grid.origin[1] + grid.shape[0] * grid.cell_size
+        profile = {
+            'driver': 'GTiff', 'dtype': 'float32', 'count': len(names), 'height': grid.shape[0],
+            'width': grid.shape[1], 'crs': DENSITY_CRS, 'compress': 'deflate', 'predictor': 3, 'tiled': True,
+            'transform': from_origin(grid.origin[0], top, grid.cell_size, grid.cell_size),
+        }
+        with rasterio.open(tif_path, 'w', **profile) as dst:
+            # GeoTIFF第一行是北边
+            dst.write(stack[:, ::-1, :])
+            for band, name in enumerate(names, start=1):
+                dst.set_band_description(band, str(name))
+        written.append(tif_path)
+    return written
+
+def load_surfaces(output_path='crime_density.npy'):
+    """读取save_surfaces保存的密度面, 返回(分组名称 -> 网格, 元数据)"""
+    with open(output_path + '.json', 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    stack = np.load(output_path, mmap_mode='r')
+    return dict(zip(meta['groups'], stack)), meta
+
+def main(geocoded_path='crime_data_with_census_tracts.csv', output_path='crime_density.npy', by='none',
+         cell_size=100.0, bandwidth=300.0, min_points=100, workers=1, geotiff=True):
+    """按分组生成核密度面并保存"""
+    start = time.perf_counter()
+    grid = DensityGrid.from_tracts(cell_size=cell_size)
+    histograms = point_histograms(geocoded_path, grid, by=by)
+    # 点数太少的分组密度面没有意义
+    histograms = {name: h for name, h in histograms.items() if name == 'all' or h.sum() >= min_points}
+    print(f"分箱完成, 耗时 {time.perf_counter() - start:.2f}秒")
+
+    start = time.perf_counter()
+    surfaces = density_surfaces(histograms, grid, bandwidth=bandwidth, workers=workers)
+    print(f"{len(surfaces)} 个密度面 (带宽 {bandwidth:g}米), 耗时 {time.perf_counter() - start:.2f}秒")
+    for path in save_surfaces(surfaces, grid, output_path, bandwidth, geotiff, histograms):
+        print(f"已保存 {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Point-level crime kernel density surfaces (FFT Gaussian KDE)")
+    parser.add_argument('--input', default='crime_data_with_census_tracts.csv', help="process_crime_data output")
+    parser.add_argument('--output', default='crime_density.npy')
+    parser.add_argument('--by', choices=list(GROUP_COLUMNS), default='none', help="one surface per crime type / year / month")
+    parser.add_argument('--cell-size', type=float, default=100.0, help="grid cell size in metres")
+    parser.add_argument('--bandwidth', type=float, default=300.0, help="Gaussian kernel sigma in metres")
+    parser.add_argument('--min-points', type=int, default=100, help="skip groups with fewer points")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-geotiff', action='store_true')
+    args = parser.parse_args()
+    main(args.input, args.output, args.by, args.cell_size, args.bandwidth, args.min_points, args.workers,
+         not args.no_geotiff)
@@ -0,0 +1,270 @@
+import argparse
+import json
+import multiprocessing
+import time
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from ChunkPool import read_line_blocks, ordered_map
+from CrimeCensusTract import iter_crime_tracts
+from CrimeSourceReader import iter_source_chunks, read_source_text
+from CrimeStatistics import CrimeStatistics, parse_dates
+
+# 模型用到的源数据列
+SOURCE_COLUMNS = ['DR_NO', 'Date Rptd', 'DATE OCC', 'TIME OCC', 'AREA', 'Rpt Dist No',
+                  'Part 1-2', 'Crm Cd', 'Weapon Used Cd', 'Premis Cd']
+
+# 特征矩阵的列; 类别特征保存为整数编码(float32可精确表示), -1表示缺失
+FEATURE_NAMES = [
+    'year', 'month', 'day_of_week', 'day_of_year', 'hour', 'minute', 'report_delay_days',
+    'area', 'rpt_dist_no', 'crm_cd', 'weapon_used_cd', 'premis_cd', 'census_tract',
+    'tract_total_crimes', 'tract_night_share', 'tract_crime_types',
+]
+CATEGORICAL_FEATURES = ['area', 'rpt_dist_no', 'crm_cd', 'weapon_used_cd', 'premis_cd', 'census_tract']
+MISSING_CODE = -1
+
+def _int_codes(values):
+    """数值型编码列转为int16, 缺失或超出范围的记为MISSING_CODE"""
+    codes = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+    valid = np.isfinite(codes) & (codes >= 0) & (codes <= np.iinfo(np.int16).max)
+    return np.where(valid, codes, MISSING_CODE).astype(np.int16)
+
+class CrimeFeatureBuilder:
+    """
+    Turns raw crime records into rows of the Part 1-2 feature matrix.
+
+    The census tract of every record comes from the process_crime_data
+    output: its DR_NO values are sorted once and each chunk is joined with
+    np.searchsorted. Per-tract aggregates are arrays in tract order with an
+    extra trailing row for records without a tract, so they are joined by
+    indexing with the tract position (-1 selects the trailing row).
+
+    Parameters:
+    -----------
+    crime_ids : numpy.ndarray
+        Sorted DR_NO values of the geocoded records
+    tract_idx : numpy.ndarray
+        Tract position of each entry of crime_ids, -1 for no tract
+    tract_features : numpy.ndarray
+        float32 per-tract aggregates, shape (tracts + 1, 3)
+    tract_ids : array-like of str
+        CT20 of each tract position
+    """
+
+    def __init__(self, crime_ids, tract_idx, tract_features, tract_ids):
+        self.crime_ids = crime_ids
+        self.tract_idx = tract_idx
+        self.tract_features = tract_features
+        self.tract_ids = np.asarray(tract_ids, dtype=str)
+
+    @classmethod
+    def from_outputs(cls, geocoded_path, stats):
+        """Builder from the geocoded records and the saved CrimeStatistics"""
+        tract_index = pd.Index(stats.tract_ids)
+        ids = []
+        positions = []
+        for chunk in iter_crime_tracts(geocoded_path, columns=['crime_id', 'census_tract_id']):
+            crime_id = pd.to_numeric(chunk['crime_id'], errors='coerce').to_numpy(dtype=np.float64)
+            has_id = ~np.isnan(crime_id)
+            ids.append(crime_id[has_id].astype(np.int64))
+            positions.append(tract_index.get_indexer(chunk['census_tract_id'])[has_id].astype(np.int16))
+        crime_ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        tract_idx = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int16)
+        order = np.argsort(crime_ids, kind='stable')
+
+        totals = stats.totals()
+        by_hour = stats.histogram('hour').to_numpy()
+        night = by_hour[:, list(range(20, 24)) + list(range(0, 6))].sum(axis=1)
+        hour_known = by_hour.sum(axis=1)
+        tract_features = np.full((len(totals) + 1, 3), MISSING_CODE, dtype=np.float32)
+        tract_features[:-1, 0] = totals
+        tract_features[:-1, 1] = np.where(hour_known > 0, night / np.maximum(hour_known, 1), MISSING_CODE)
+        tract_features[:-1, 2] = (stats.matrix() > 0).sum(axis=1)
+        return cls(crime_ids[order], tract_idx[order], tract_features, stats.tract_ids)
+
+    def lookup_tracts(self, dr_no):
+        """Tract positions for DR_NO values, -1 where the record was not geocoded or the ID is missing"""
+        dr_no = pd.to_numeric(pd.Series(dr_no), errors='coerce').to_numpy(dtype=np.float64)
+        tract = np.full(len(dr_no), -1, dtype=np.int16)
+        has_id = ~np.isnan(dr_no)
+        if len(self.crime_ids) == 0 or not has_id.any():
+            return tract
+        ids = dr_no[has_id].astype(np.int64)
+        pos = np.minimum(np.searchsorted(self.crime_ids, ids), len(self.crime_ids) - 1)
+        tract[has_id] = np.where(self.crime_ids[pos] == ids, self.tract_idx[pos], -1)
+        return tract
+
+    def transform(self, chunk):
+        """
+        Feature rows for one chunk of source records.
+
+        Returns:
+        --------
+        tuple
+            (float32 features (n, len(FEATURE_NAMES)), int8 Part 1-2 labels (-1 if missing),
+            int32 occurrence day numbers since 1970-01-01 (-1 if unparsable))
+        """
+        n = len(chunk)
+        features = np.empty((n, len(FEATURE_NAMES)), dtype=np.float32)
+        column = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+        # 日期按固定格式解析, 每个不同取值只解析一次
+        occurred = parse_dates(chunk['DATE OCC'].to_numpy())
+        reported = parse_dates(chunk['Date Rptd'].to_numpy())
+        has_date = ~occurred.isna()
+        features[:, column['year']] = np.where(has_date, occurred.year, MISSING_CODE)
+        features[:, column['month']] = np.where(has_date, occurred.month, MISSING_CODE)
+        features[:, column['day_of_week']] = np.where(has_date, occurred.dayofweek, MISSING_CODE)
+        features[:, column['day_of_year']] = np.where(has_date, occurred.dayofyear, MISSING_CODE)
+        delay = (reported - occurred).days
+        features[:, column['report_delay_days']] = np.where(has_date & ~reported.isna(), delay, MISSING_CODE)
+
+        # TIME OCC为hhmm整数, 直接用整除和取余拆分
+        time_occ = pd.to_numeric(chunk['TIME OCC'], errors='coerce').to_numpy(dtype=np.float64)
+        valid_time = (time_occ >= 0) & (time_occ < 2400)
+        features[:, column['hour']] = np.where(valid_time, time_occ // 100, MISSING_CODE)
+        features[:, column['minute']] = np.where(valid_time, time_occ % 100, MISSING_CODE)
+
+        for name, source in [('area', 'AREA'), ('rpt_dist_no', 'Rpt Dist No'), ('crm_cd', 'Crm Cd'),
+                             ('weapon_used_cd', 'Weapon Used Cd'), ('premis_cd', 'Premis Cd')]:
+            features[:, column[name]] = _int_codes(chunk[source])
+
+        tract = self.lookup_tracts(chunk['DR_NO'])
+        features[:, column['census_tract']] = tract
+        features[:, column['tract_total_crimes']:] = self.tract_features[tract]
+
+        labels = _int_codes(chunk['Part 1-2']).astype(np.int8)
+        days = np.full(n, -1, dtype=np.int32)
+        days[has_date] = occurred[has_date].to_numpy().astype('datetime64[D]').astype(np.int64)
+        return features, labels, days
+
+# 并行模式下由fork继承的构建器和输出文件(共享映射, 子进程写入对父进程可见)
+_worker_builder = None
+_worker_outputs = None
+
+def _create_outputs(output_prefix, rows):
+    """创建特征、标签和日期的内存映射文件"""
+    shapes = {'X': (rows, len(FEATURE_NAMES)), 'y': (rows,), 'day': (rows,)}
+    dtypes = {'X': np.float32, 'y': np.int8, 'day': np.int32}
+    return {
+        name: np.lib.format.open_memmap(f"{output_prefix}.{name}.npy", mode='w+', dtype=dtypes[name], shape=shapes[name])
+        for name in shapes
+    }
+
+def _transform_block(header, block, offset):
+    """工作进程: 解析一段原始CSV文本并把特征写入内存映射文件的对应行"""
+    chunk = read_source_text(header + block, SOURCE_COLUMNS)
+    features, labels, days = _worker_builder.transform(chunk)
+    _worker_outputs['X'][offset:offset + len(chunk)] = features
+    _worker_outputs['y'][offset:offset + len(chunk)] = labels
+    _worker_outputs['day'][offset:offset + len(chunk)] = days
+    return offset, len(chunk)
+
+def _offset_blocks(crime_csv_path, chunk_size):
+    """原始CSV文本块及其第一行在输出文件中的行号 (按行数计, 解析出的记录数不会更多)"""
+    offset = 0
+    for header, block in read_line_blocks(crime_csv_path, chunk_size):
+        yield header, block, offset
+        offset += block.count('\n')
+
+def build_features(crime_csv_path, geocoded_path='crime_data_with_census_tracts.csv',
+                   stats_path='crime_statistics.npz', output_prefix='crime_features',
+                   chunk_size=100000, workers=1):
+    """
+    Build the Part 1-2 feature matrix for every record of the source CSV.
+
+    Writes {output_prefix}.X.npy (float32 features), .y.npy (int8 Part 1-2),
+    .day.npy (int32 occurrence day, for time-based splits) and a .json sidecar
+    with the feature names. Chunks are written straight into the memory-mapped
+    files, so memory use depends on chunk_size and workers, not on file size.
+    The files are sized from the line count; records that span several lines
+    leave unused rows at the end, so only the first meta['rows'] rows are
+    valid and load_features returns just those.
+
+    Parameters:
+    -----------
+    crime_csv_path : str
+        Source crime CSV (Crime_Data_from_2020_to_Present.csv)
+    geocoded_path : str
+        process_crime_data output (CSV or Parquet), supplies the census tract
+    stats_path : str
+        CrimeStatistics saved by CrimeCensusTract.main, supplies tract aggregates
+    workers : int
+        Number of processes transforming chunks
+
+    Returns:
+    --------
+    int
+        Number of rows written
+    """
+    stats = CrimeStatistics.load(stats_path)
+    builder = CrimeFeatureBuilder.from_outputs(geocoded_path, stats)
+    print(f"已载入 {len(builder.crime_ids)} 条记录的census tract")
+
+    # 与process_crime_data一样按行计数, 预先分配输出文件
+    row_count = sum(1 for _ in open(crime_csv_path, 'r')) - 1
+    outputs = _create_outputs(output_prefix, row_count)
+
+    written = 0
+    with tqdm(total=row_count, desc="生成特征") as pbar:
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            global _worker_builder, _worker_outputs
+            _worker_builder = builder
+            _worker_outputs = outputs
+            try:
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    tasks = _offset_blocks(crime_csv_path, chunk_size)
+                    for offset, rows in ordered_map(pool, _transform_block, tasks, workers):
+                        if offset != written:
+                            # 之前的块解析出的记录少于行数, 前移补齐空行; 之后的块只写入offset之后的行
+                            for array in outputs.values():
+                                array[written:written + rows] = array[offset:offset + rows]
+                        written += rows
+                        pbar.update(rows)
+            finally:
+                _worker_builder = None
+                _worker_outputs = None
+        else:
+            for chunk in iter_source_chunks(crime_csv_path, SOURCE_COLUMNS, chunk_size):
+                features, labels, days = builder.transform(chunk)
+                outputs['X'][written:written + len(chunk)] = features
+                outputs['y'][written:written + len(chunk)] = labels
+                outputs['day'][written:written + len(chunk)] = days
+                written += len(chunk)
+                pbar.update(len(chunk))
+
+    for array in outputs.values():
+        array.flush()
+    meta = {
+        'rows': written,
+        'feature_names': FEATURE_NAMES,
+        'categorical_features': CATEGORICAL_FEATURES,
+        'missing_code': MISSING_CODE,
+        'tract_ids': stats.tract_ids.tolist(),
+    }
+    with open(f"{output_prefix}.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    print(f"特征矩阵已保存至 {output_prefix}.X.npy ({written} 行 x {len(FEATURE_NAMES)} 列)")
+    return written
+
+def load_features(output_prefix='crime_features'):
+    """Memory-map a feature set written by build_features: (X, y, day, meta), the meta['rows'] written rows"""
+    with open(f"{output_prefix}.json", 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    arrays = [np.load(f"{output_prefix}.{name}.npy", mmap_mode='r')[:meta['rows']] for name in ('X', 'y', 'day')]
+    return (*arrays, meta)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Part 1-2 classifier feature matrix")
+    parser.add_argument('--source', default='Crime_Data_from_2020_to_Present.csv')
+    parser.add_argument('--geocoded', default='crime_data_with_census_tracts.csv', help="process_crime_data output")
+    parser.add_argument('--stats', default='crime_statistics.npz')
+    parser.add_argument('--output-prefix', default='crime_features')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    start_time = time.time()
+    build_features(args.source, args.geocoded, args.stats, args.output_prefix, args.chunk_size, args.workers)
+    print(f"耗时: {time.time() - start_time:.2f}秒")
@@ -0,0 +1,453 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib.colors import BoundaryNorm, ListedColormap
+from matplotlib.patches import Patch
+
+from ChunkPool import ordered_map
+from CensusTractLoader import load_tracts, shapefile_hash
+from CrimeStatistics import CrimeStatistics
+
+# 分组计算置换统计量时每批最多生成的元素数 (批内 tract数 × 置换次数 × 邻居数 × 变量数)
+BATCH_ELEMENTS = 1 << 22
+
+# Gi*显著性分级: (p值上限, 标签), 与ArcGIS热点分析的90/95/99%置信度一致
+CONFIDENCE_LEVELS = [(0.01, 99), (0.05, 95), (0.10, 90)]
+
+# Local Moran's I 象限
+QUADRANT_NAMES = {1: 'HH', 2: 'LH', 3: 'LL', 4: 'HL'}
+
+class TractWeights:
+    """
+    Binary spatial weights between census tracts in CSR form.
+
+    Row i's neighbours are indices[indptr[i]:indptr[i + 1]] (sorted, never i
+    itself). Row-standardised weights are 1 / k_i, so the arrays alone are
+    enough for spatial lags and permutation tests; matrix() gives the same
+    weights as a scipy.sparse matrix when scipy is available.
+
+    Parameters:
+    -----------
+    indptr : numpy.ndarray
+        int64 row offsets, length n + 1
+    indices : numpy.ndarray
+        int32 neighbour positions
+    tract_ids : array-like of str
+        CT20 of each row, in shapefile order
+    """
+
+    def __init__(self, indptr, indices, tract_ids):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.tract_ids = np.asarray(tract_ids, dtype=str)
+        self.cardinalities = np.diff(self.indptr)
+        self._rows = np.repeat(np.arange(len(self.tract_ids)), self.cardinalities)
+
+    @classmethod
+    def from_pairs(cls, left, right, tract_ids):
+        """由(i, j)对构建对称的CSR, 去掉自身和重复的对"""
+        n = len(tract_ids)
+        left, right = np.concatenate([left, right]), np.concatenate([right, left])
+        keep = left != right
+        keys = np.unique(left[keep].astype(np.int64) * n + right[keep])
+        rows, cols = np.divmod(keys, n)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+        return cls(indptr, cols, tract_ids)
+
+    @classmethod
+    def queen(cls, tracts, tolerance=1.0):
+        """
+        Queen contiguity: tracts sharing at least one boundary point.
+
+        Parameters:
+        -----------
+        tracts : geopandas.GeoDataFrame
+            Tract polygons in a projected CRS
+        tolerance : float
+            Polygons closer than this (CRS units) count as touching, which
+            bridges slivers left by digitisation
+        """
+        geometries = tracts.geometry.to_numpy()
+        tree = shapely.STRtree(geometries)
+        if tolerance > 0:
+            left, right = tree.query(geometries, predicate='dwithin', distance=tolerance)
+        else:
+            left, right = tree.query(geometries, predicate='intersects')
+        return cls.from_pairs(left, right, tracts['CT20'])
+
+    @classmethod
+    def distance_band(cls, tracts, threshold):
+        """
+        Distance band: tracts whose centroids are within threshold (CRS units).
+        """
+        centroids = shapely.centroid(tracts.geometry.to_numpy())
+        tree = shapely.STRtree(centroids)
+        left, right = tree.query(centroids, predicate='dwithin', distance=threshold)
+        return cls.from_pairs(left, right, tracts['CT20'])
+
+    def islands(self):
+        """没有邻居的tract下标"""
+        return np.flatnonzero(self.cardinalities == 0)
+
+    def lag(self, values, standardized=True):
+        """
+        Spatial lag of one or more variables.
+
+        Parameters:
+        -----------
+        values : numpy.ndarray
+            Shape (n,) or (n, variables), in tract order
+
+        Returns:
+        --------
+        numpy.ndarray
+            Sum (standardized=False) or mean (standardized=True) over each tract's
+            neighbours; NaN for islands when standardized
+        """
+        values = np.asarray(values, dtype=np.float64)
+        flat = values.reshape(len(self.tract_ids), -1)
+        sums = np.zeros_like(flat)
+        np.add.at(sums, self._rows, flat[self.indices])
+        if standardized:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sums = sums / self.cardinalities[:, None]
+        return sums.reshape(values.shape)
+
+    def matrix(self, standardized=False):
+        """scipy.sparse.csr_matrix形式的权重"""
+        from scipy import sparse
+        data = np.ones(len(self.indices))
+        if standardized:
+            data = data / np.repeat(self.cardinalities, self.cardinalities)
+        n = len(self.tract_ids)
+        return sparse.csr_matrix((data, self.indices, self.indptr), shape=(n, n))
+
+    def save(self, path, meta=None):
+        """保存为.npz (先写临时文件再改名)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, indptr=self.indptr, indices=self.indices, tract_ids=self.tract_ids,
+                 meta=json.dumps(meta or {}))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """读取save保存的权重"""
+        data = np.load(path)
+        return cls(data['indptr'], data['indices'], data['tract_ids'])
+
+def load_weights(shapefile_path='LA_City_2020_Census_Tracts_.shp', kind='queen', threshold=None, tolerance=1.0,
+                 cache_dir='.tract_cache'):
+    """
+    Tract weights built once per shapefile and cached as CSR arrays.
+
+    The cache file name includes the shapefile hash and the weight
+    parameters, so a changed shapefile or different parameters rebuild it.
+
+    Parameters:
+    -----------
+    kind : str
+        'queen' (contiguity) or 'distance' (centroid distance band)
+    threshold : float, optional
+        Distance band in metres (EPSG:32611), required for kind='distance'
+    tolerance : float
+        Queen contiguity snapping tolerance in shapefile CRS units
+    """
+    if kind == 'queen':
+        tag = f"queen_{tolerance:g}"
+    elif kind == 'distance':
+        if threshold is None:
+            raise ValueError("kind='distance'需要指定threshold")
+        tag = f"distance_{threshold:g}"
+    else:
+        raise ValueError(f"不支持的权重类型: {kind}")
+
+    stem = os.path.splitext(os.path.basename(shapefile_path))[0]
+    cache_path = os.path.join(cache_dir, f"{stem}.{shapefile_hash(shapefile_path)[:16]}.{tag}.weights.npz")
+    if os.path.exists(cache_path):
+        return TractWeights.load(cache_path)
+
+    start = time.perf_counter()
+    if kind == 'queen':
+        weights = TractWeights.queen(load_tracts(shapefile_path, crs=None), tolerance)
+    else:
+        # 在UTM 11N (米) 下计算质心距离
+        weights = TractWeights.distance_band(load_tracts(shapefile_path, crs="EPSG:32611"), threshold)
+    os.makedirs(cache_dir, exist_ok=True)
+    weights.save(cache_path, {'kind': kind, 'threshold': threshold, 'tolerance': tolerance})
+    print(f"空间权重已保存至 {cache_path}: {len(weights.indices)} 个邻接, 平均 {weights.cardinalities.mean():.1f} 个邻居, "
+          f"{len(weights.islands())} 个孤立tract, 耗时 {time.perf_counter() - start:.2f}秒")
+    return weights
+
+def _folded_p(greater, less, permutations):
+    """双侧伪p值: 取置换结果中更极端一侧的次数"""
+    extreme = np.minimum(greater, less)
+    return (extreme + 1) / (permutations + 1)
+
+# 并行计算时由fork继承的引擎和数据
+_worker_engine = None
+_worker_values = None
+
+def _count_block(tracts):
+    """工作进程: 一组tract的置换计数"""
+    return _worker_engine._permutation_counts(_worker_values, tracts)
+
+class HotspotEngine:
+    """
+    Getis-Ord Gi* and Local Moran's I with conditional permutation inference.
+
+    The weights are reused for every variable. Both statistics are monotone
+    in the neighbour sum of tract i, so one set of conditional permutations
+    (tract i's value fixed, k_i values drawn without replacement from the
+    other tracts) serves both. The random draws are shared by all tracts
+    and variables, as in PySAL's esda: one (permutations, max k) index
+    matrix, shifted past i for each tract. Tracts are processed in groups
+    with the same neighbour count as dense (tracts, permutations, k,
+    variables) gathers, optionally split across a fork process pool.
+
+    Parameters:
+    -----------
+    weights : TractWeights
+        Binary tract weights (no self-neighbours)
+    permutations : int
+        Number of conditional permutations
+    seed : int
+        Random seed of the permutation draws
+    workers : int
+        Processes used for the permutations
+    """
+
+    def __init__(self, weights, permutations=999, seed=0, workers=1):
+        self.weights = weights
+        self.permutations = permutations
+        self.workers = workers
+        n = len(weights.tract_ids)
+        max_k = int(weights.cardinalities.max()) if n else 0
+        rng = np.random.default_rng(seed)
+        draws = np.tile(np.arange(n - 1, dtype=np.int32), (permutations, 1))
+        self.draws = np.ascontiguousarray(rng.permuted(draws, axis=1)[:, :max_k])
+
+    def _permutation_counts(self, values, tracts):
+        """
+        置换结果中邻居和大于等于/小于等于观测值的次数
+
+        values形状(n, 变量数); 返回两个(len(tracts), 变量数)的计数数组
+        """
+        k = self.weights.cardinalities
+        observed = self.weights.lag(values, standardized=False)
+        greater = np.zeros((len(tracts), values.shape[1]), dtype=np.int32)
+        less = np.zeros_like(greater)
+        positions = np.arange(len(tracts))
+        for size in np.unique(k[tracts]):
+            if size == 0:
+                continue
+            group = positions[k[tracts] == size]
+            draws = self.draws[:, :size]
+            batch = max(1, BATCH_ELEMENTS // (self.permutations * size * values.shape[1]))
+            for start in range(0, len(group), batch):
+                chunk = group[start:start + batch]
+                own = tracts[chunk]
+                # 跳过tract自身: 下标不小于i的向后移一位
+                index = draws[None, :, :] + (draws[None, :, :] >= own[:, None, None])
+                sums = values[index].sum(axis=2)
+                target = observed[own][:, None, :]
+                # 浮点求和顺序不同, 用容差判断相等
+                tol = 1e-9 * np.maximum(np.abs(target), 1)
+                greater[chunk] = (sums >= target - tol).sum(axis=1)
+                less[chunk] = (sums <= target + tol).sum(axis=1)
+        return greater, less
+
+    def _counts(self, values):
+        """所有tract的置换计数, workers大于1时按tract分块并行"""
+        global _worker_engine, _worker_values
+        n = len(self.weights.tract_ids)
+        if self.workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return self._permutation_counts(values, np.arange(n))
+
+        blocks = np.array_split(np.arange(n), self.workers * 4)
+        greater = np.zeros((n, values.shape[1]), dtype=np.int32)
+        less = np.zeros_like(greater)
+        _worker_engine, _worker_values = self, values
+        try:
+            with multiprocessing.get_context('fork').Pool(self.workers) as pool:
+                results = ordered_map(pool, _count_block, ((block,) for block in blocks), self.workers)
+                for block, (block_greater, block_less) in zip(blocks, results):
+                    greater[block], less[block] = block_greater, block_less
+        finally:
+            _worker_engine, _worker_values = None, None
+        return greater, less
+
+    def analyze(self, values, alpha=0.05):
+        """
+        Gi* and Local Moran's I for one or more variables.
+
+        Parameters:
+        -----------
+        values : numpy.ndarray
+            Shape (n,) or (n, variables), in the weights' tract order
+        alpha : float
+            Significance level of the Local Moran's I cluster labels
+
+        Returns:
+        --------
+        dict of numpy.ndarray
+            Arrays of shape (n, variables): gi_z (analytical Gi* z-score),
+            moran_i, p_value (two-sided permutation pseudo p-value, shared by
+            both statistics), quadrant (1=HH, 2=LH, 3=LL, 4=HL, 0 for islands),
+            cluster (quadrant where p_value <= alpha, else 0) and hotspot
+            (+level for hot spots, -level for cold spots, level = 99/95/90
+            confidence, 0 when not significant)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values.reshape(len(values), -1)
+        n = len(values)
+        k = self.weights.cardinalities[:, None].astype(np.float64)
+        island = k[:, 0] == 0
+
+        mean = values.mean(axis=0)
+        deviations = values - mean
+        sum_sq = (deviations ** 2).sum(axis=0)
+        std = np.sqrt(sum_sq / n)
+        neighbour_sum = self.weights.lag(values, standardized=False)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Gi*: 二值权重, 包含自身 (w_ii = 1)
+            weight_sum = k + 1
+            numerator = values + neighbour_sum - mean * weight_sum
+            denominator = std * np.sqrt((n * weight_sum - weight_sum ** 2) / (n - 1))
+            gi_z = numerator / denominator
+
+            # Local Moran's I: 行标准化权重
+            lag = neighbour_sum / k - mean
+            moran_i = (n - 1) * deviations * lag / sum_sq
+
+        greater, less = self._counts(values)
+        p = _folded_p(greater, less, self.permutations)
+        gi_z[island] = np.nan
+        moran_i[island] = np.nan
+        p[island] = np.nan
+
+        quadrant = np.select([(deviations > 0) & (lag > 0), (deviations <= 0) & (lag > 0),
+                              (deviations <= 0) & (lag <= 0), (deviations > 0) & (lag <= 0)], [1, 2, 3, 4], 0)
+        quadrant[island] = 0
+
+        cluster = np.where(p <= alpha, quadrant, 0)
+
+        hotspot = np.zeros(values.shape, dtype=np.int8)
+        for threshold, level in reversed(CONFIDENCE_LEVELS):
+            significant = p <= threshold
+            hotspot[significant & (gi_z > 0)] = level
+            hotspot[significant & (gi_z < 0)] = -level
+        return {'gi_z': gi_z, 'moran_i': moran_i, 'p_value': p, 'quadrant': quadrant, 'cluster': cluster,
+                'hotspot': hotspot}
+
+def _windows(years):
+    """时间窗口: 全部时间, 以及每个指定年份"""
+    windows = {'all': {}}
+    for year in years or []:
+        windows[str(year)] = {'years': year}
+    return windows
+
+def hotspot_table(stats, engine, windows=None, top_k=None, alpha=0.05):
+    """
+    Hotspot statistics for total crimes and every crime type in every time window.
+
+    Parameters:
+    -----------
+    stats : CrimeStatistics
+        Accumulated counts; tract order must match the engine's weights
+    windows : dict, optional
+        Window name -> CrimeStatistics filter keywords (years, months, weekdays,
+        hours); default: all time
+    top_k : int, optional
+        Only the top-K crime types of each window (all types when None)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per window × variable × tract
+    """
+    if not np.array_equal(stats.tract_ids, engine.weights.tract_ids):
+        raise ValueError("统计数据的tract顺序与空间权重不一致")
+    windows = windows or {'all': {}}
+    frames = []
+    for window, filters in windows.items():
+        matrix = stats.matrix(**filters)
+        types = stats.top_types(top_k, **filters) if top_k is not None else np.arange(len(stats.crime_types))
+        names = ['TOTAL'] + [stats.crime_types[t] for t in types]
+        values = np.column_stack([stats.totals(**filters), matrix[:, types]])
+        start = time.perf_counter()
+        result = engine.analyze(values, alpha)
+        print(f"[{window}] {len(names)} 个变量, 耗时 {time.perf_counter() - start:.2f}秒")
+
+        n = len(stats.tract_ids)
+        frame = pd.DataFrame({
+            'window': window,
+            'crime_type': np.repeat(names, n),
+            'census_tract_id': np.tile(stats.tract_ids, len(names)),
+            'count': values.T.ravel(),
+        })
+        for column, array in result.items():
+            frame[column] = array.T.ravel()
+        for column in ['quadrant', 'cluster']:
+            frame[column] = frame[column].map(QUADRANT_NAMES).fillna('')
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def hotspot_map_job(renderer, table, output_path="crime_gi_star_hotspots.png", window='all', crime_type='TOTAL'):
+    """Build TractRenderer arguments for a Gi* hot/cold spot map of one window and variable"""
+    subset = table[(table['window'] == window) & (table['crime_type'] == crime_type)]
+    levels = [-99, -95, -90, 0, 90, 95, 99]
+    codes = renderer.align(subset.assign(code=subset['hotspot'].map(levels.index)), 'code')
+    cmap = ListedColormap(['#4575b4', '#91bfdb', '#e0f3f8', '#f7f7f7', '#fee090', '#fc8d59', '#d73027'])
+    labels = ['Cold Spot - 99% Confidence', 'Cold Spot - 95% Confidence', 'Cold Spot - 90% Confidence',
+              'Not Significant', 'Hot Spot - 90% Confidence', 'Hot Spot - 95% Confidence',
+              'Hot Spot - 99% Confidence']
+    return {
+        'values': codes,
+        'output_path': output_path,
+        'cmap': cmap,
+        'norm': BoundaryNorm(np.arange(-0.5, 7.5), cmap.N),
+        'legend_handles': [Patch(facecolor=cmap(i), edgecolor='black', label=label) for i, label in enumerate(labels)],
+        'legend_title': "Getis-Ord Gi*",
+        'title': f"Crime Hot Spots ({crime_type}, {window})",
+    }
+
+def main(stats_path='crime_statistics.npz', output_path='crime_hotspots_gi_moran.csv', kind='queen', threshold=None,
+         permutations=999, years=None, top_k=None, workers=1, map_path=None):
+    """计算所有犯罪类型和时间窗口的热点统计并保存"""
+    weights = load_weights(kind=kind, threshold=threshold)
+    stats = CrimeStatistics.load(stats_path)
+    engine = HotspotEngine(weights, permutations=permutations, workers=workers)
+    table = hotspot_table(stats, engine, _windows(years), top_k=top_k)
+    if output_path.endswith('.parquet'):
+        table.to_parquet(output_path, index=False)
+    else:
+        table.to_csv(output_path, index=False)
+    print(f"热点统计已保存至 {output_path} ({len(table)} 行)")
+
+    if map_path:
+        from TractRenderer import TractRenderer
+        renderer = TractRenderer(load_tracts(crs="EPSG:4326"))
+        renderer.render(**hotspot_map_job(renderer, table, map_path))
+        print(f"热点地图已保存至 {map_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Getis-Ord Gi* and Local Moran's I hotspot statistics per tract")
+    parser.add_argument('--stats', default='crime_statistics.npz', help="CrimeStatistics counts saved by CrimeCensusTract")
+    parser.add_argument('--output', default='crime_hotspots_gi_moran.csv')
+    parser.add_argument('--weights', choices=['queen', 'distance'], default='queen')
+    parser.add_argument('--threshold', type=float, default=None, help="distance band in metres (--weights distance)")
+    parser.add_argument('--permutations', type=int, default=999)
+    parser.add_argument('--years', type=int, nargs='*', default=None, help="also analyze each of these years separately")
+    parser.add_argument('--top-k', type=int, default=None, help="only the top-K crime types (default: all)")
+    parser.add_argument('--workers', type=int, default=1, help="processes used for the permutations")
+    parser.add_argument('--map', default=None, help="also render a Gi* map of total crimes to this path")
+    args = parser.parse_args()
+    main(args.stats, args.output, args.weights, args.threshold, args.permutations, args.years, args.top_k,
+         args.workers, args.map)
@@ -0,0 +1,175 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from CrimeStatistics import SOURCE_DATE_FORMAT, parse_dates
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    # 没有安装pyarrow时退回到带显式dtype的pandas解析
+    pa = None
+
+# 源数据列的固定类型: 名称 -> pandas dtype ('datetime'表示按SOURCE_DATE_FORMAT解析的日期)
+# 日期和整数列先按文本读取再转换, 无法解析的值记为NaT/NaN而不是中断整个读取
+SOURCE_DTYPES = {
+    'DR_NO': 'int64',
+    'Date Rptd': 'datetime',
+    'DATE OCC': 'datetime',
+    'TIME OCC': 'int16',
+    'AREA': 'int8',
+    'AREA NAME': 'category',
+    'Rpt Dist No': 'int16',
+    'Part 1-2': 'int8',
+    'Crm Cd': 'int16',
+    'Weapon Used Cd': 'int16',
+    'Premis Cd': 'int16',
+    'Crm Cd Desc': 'category',
+    'LAT': 'float32',
+    'LON': 'float32',
+}
+
+# 估算每行字节数时读取的文件开头长度
+SAMPLE_BYTES = 1 << 20
+
+def _is_text(dtype):
+    """按文本读取、读取后再转换的列: 日期和整数"""
+    return dtype == 'datetime' or dtype.startswith('int')
+
+def _arrow_type(dtype):
+    """pandas dtype对应的pyarrow读取类型"""
+    if _is_text(dtype):
+        return pa.string()
+    if dtype == 'category':
+        # CSV读取器只支持int32索引的字典列
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+def _convert_options(columns):
+    """只读取指定列, 已知列使用固定类型, 日期和整数列按文本读取"""
+    return pa_csv.ConvertOptions(
+        include_columns=columns,
+        column_types={c: _arrow_type(SOURCE_DTYPES[c]) for c in columns if c in SOURCE_DTYPES},
+    )
+
+def _to_integers(values, dtype):
+    """文本转为数值, 无法解析的记为NaN; 全部有效且在dtype范围内时转为定长整数"""
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+    info = np.iinfo(dtype)
+    if len(numbers) and np.isfinite(numbers).all() and numbers.min() >= info.min and numbers.max() <= info.max:
+        return numbers.astype(dtype)
+    return numbers
+
+def _convert_text(chunk, columns):
+    """按SOURCE_DTYPES转换按文本读取的日期和整数列"""
+    for column in columns:
+        dtype = SOURCE_DTYPES.get(column)
+        if dtype == 'datetime':
+            chunk[column] = parse_dates(chunk[column].to_numpy()).to_numpy().astype('datetime64[s]')
+        elif dtype is not None and _is_text(dtype):
+            chunk[column] = _to_integers(chunk[column], dtype)
+    return chunk
+
+def _to_frame(table, columns):
+    """Arrow表转为DataFrame, 字典列转为pandas分类列
+
+    columns中的日期按固定格式在Arrow中解析(无法解析的为空); 整数列在Arrow中转换,
+    含无法转换的值时该列改由pandas逐值转换 (见_to_integers)
+    """
+    text = []
+    for column in columns:
+        dtype = SOURCE_DTYPES.get(column)
+        if dtype is None or not _is_text(dtype):
+            continue
+        index = table.schema.get_field_index(column)
+        # 空字段视为缺失
+        values = table.column(index)
+        values = pc.if_else(pc.equal(values, ''), pa.scalar(None, pa.string()), values)
+        if dtype == 'datetime':
+            values = pc.strptime(values, format=SOURCE_DATE_FORMAT, unit='s', error_is_null=True)
+        else:
+            try:
+                # 部分编码写成670.0, 与pandas解析一样先转为浮点数; 有小数或超出范围时转换失败
+                values = values.cast(pa.float64()).cast(pa.from_numpy_dtype(np.dtype(dtype)))
+            except pa.ArrowInvalid:
+                text.append(column)
+                continue
+        table = table.set_column(index, column, values)
+    return _convert_text(table.to_pandas(split_blocks=True, self_destruct=True), text)
+
+def _read_pandas(source, columns, chunk_size=None, raw_columns=()):
+    """不使用pyarrow时的解析: 显式dtype, 日期和整数列同样先按文本读取"""
+    dtypes = {c: SOURCE_DTYPES[c] for c in columns if c in SOURCE_DTYPES}
+    dtypes = {c: (str if _is_text(d) else d) for c, d in dtypes.items()}
+    reader = pd.read_csv(source, usecols=columns, dtype=dtypes, chunksize=chunk_size, low_memory=False)
+    for chunk in (reader if chunk_size else [reader]):
+        yield _convert_text(chunk, [c for c in columns if c not in raw_columns])
+
+def _block_size(path, chunk_size):
+    """按文件开头的平均行长估算chunk_size行对应的字节数"""
+    with open(path, 'rb') as f:
+        f.readline()
+        sample = f.read(SAMPLE_BYTES)
+    lines = max(sample.count(b'\n'), 1)
+    return max(int(len(sample) / lines * chunk_size), 1 << 16)
+
+def iter_source_chunks(crime_csv_path, columns, chunk_size=50000, raw_columns=()):
+    """
+    Stream the crime source CSV as typed DataFrames.
+
+    With pyarrow the file is read by the Arrow streaming CSV reader with a
+    fixed schema (SOURCE_DTYPES): float32 coordinates, dictionary-encoded
+    (categorical) area and crime type, dates parsed once with
+    SOURCE_DATE_FORMAT, narrow integer codes. Dates and integer codes are
+    read as text and converted afterwards, so a malformed cell becomes NaT
+    or NaN (the integer column then stays float64) instead of aborting the
+    whole read. Each record batch becomes one chunk; the batch byte size is
+    derived from chunk_size and the average line length, so chunks hold
+    roughly chunk_size rows. Without pyarrow the same dtypes are applied by
+    pandas.
+
+    Parameters:
+    -----------
+    columns : list of str
+        Source columns to read
+    chunk_size : int
+        Approximate rows per chunk
+    raw_columns : list of str
+        Date or integer columns returned unconverted, as the source text
+        (e.g. for validate_records, which parses them itself)
+
+    Yields:
+    -------
+    pandas.DataFrame
+    """
+    if pa is None:
+        yield from _read_pandas(crime_csv_path, columns, chunk_size, raw_columns)
+        return
+    reader = pa_csv.open_csv(
+        crime_csv_path,
+        read_options=pa_csv.ReadOptions(block_size=_block_size(crime_csv_path, chunk_size)),
+        convert_options=_convert_options(columns),
+    )
+    for batch in reader:
+        if batch.num_rows:
+            yield _to_frame(pa.Table.from_batches([batch]), [c for c in columns if c not in raw_columns])
+
+def read_source_text(text, columns, raw_columns=()):
+    """
+    Parse a block of source CSV text (header line included) with the fixed schema.
+
+    Used by worker processes, which receive raw line blocks; the Arrow reader
+    runs single-threaded there since the pool already uses every core.
+    raw_columns are returned unconverted, as in iter_source_chunks.
+    """
+    if pa is None:
+        return next(_read_pandas(io.StringIO(text), columns, raw_columns=raw_columns))
+    table = pa_csv.read_csv(
+        io.BytesIO(text.encode('utf-8')),
+        read_options=pa_csv.ReadOptions(use_threads=False),
+        convert_options=_convert_options(columns),
+    )
+    return _to_frame(table, [c for c in columns if c not in raw_columns])
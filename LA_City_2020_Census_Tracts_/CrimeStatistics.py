@@ -0,0 +1,432 @@
+import numpy as np
+import pandas as pd
+
+# 源数据中日期列的固定格式, 例如 "03/01/2020 12:00:00 AM"
+SOURCE_DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+# 组合键各维度的基数, 最后一个取值表示"未知"
+MAX_CRIME_TYPES = 4096
+BASE_YEAR = 2000
+YEAR_SLOTS = 64
+MONTH_SLOTS = 13
+WEEKDAY_SLOTS = 8
+HOUR_SLOTS = 25
+TIME_SLOTS = YEAR_SLOTS * MONTH_SLOTS * WEEKDAY_SLOTS * HOUR_SLOTS
+UNKNOWN_TYPE = MAX_CRIME_TYPES - 1
+UNKNOWN_YEAR = YEAR_SLOTS - 1
+UNKNOWN_MONTH = MONTH_SLOTS - 1
+UNKNOWN_WEEKDAY = WEEKDAY_SLOTS - 1
+UNKNOWN_HOUR = HOUR_SLOTS - 1
+KEY_LAYOUT = np.array([MAX_CRIME_TYPES, BASE_YEAR, YEAR_SLOTS, MONTH_SLOTS, WEEKDAY_SLOTS, HOUR_SLOTS])
+
+def parse_dates(values, date_format=SOURCE_DATE_FORMAT):
+    """按固定格式解析日期; 日期取值重复度很高, 只解析去重后的值
+
+    不符合固定格式的值再按ISO 8601解析 (类型化读取后写出的关联结果中日期为YYYY-MM-DD)
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.DatetimeIndex(values)
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    uniques = pd.Index(uniques, dtype=object)
+    parsed = pd.to_datetime(uniques, format=date_format, errors='coerce')
+    retry = parsed.isna()
+    if retry.any():
+        parsed = parsed.where(~retry, pd.to_datetime(uniques, format='ISO8601', errors='coerce'))
+    result = parsed.take(codes)
+    # factorize把缺失值编码为-1, take(-1)会取到最后一个值
+    return result.where(codes >= 0, pd.NaT)
+
+def type_column_name(crime_type):
+    """统计表中犯罪类型列的列名, 移除特殊字符"""
+    return f"crime_{crime_type.lower().replace(' ', '_').replace('-', '_').replace('/', '_')[:20]}"
+
+def type_column_names(crime_types, taken=()):
+    """
+    Unique statistics column names for crime types, in order.
+
+    type_column_name truncates to 20 characters, so different types can map
+    to the same name (e.g. BURGLARY FROM VEHICLE and BURGLARY FROM VEHICLE,
+    ATTEMPTED); later types get a numeric suffix (_2, _3, ...). Names in
+    taken (existing columns) are never reused.
+    """
+    used = set(taken)
+    names = []
+    for crime_type in crime_types:
+        base = type_column_name(crime_type)
+        name, suffix = base, 2
+        while name in used:
+            name, suffix = f"{base}_{suffix}", suffix + 1
+        used.add(name)
+        names.append(name)
+    return names
+
+class KeyCounts:
+    """
+    Sparse (composite key, count) pairs over a tract index and a growing crime type vocabulary.
+
+    Shared by CrimeStatistics and CrimeCube.CrimeCubeBuilder, which differ
+    only in how they pack their keys.
+
+    Parameters:
+    -----------
+    tract_ids : array-like of str
+        Canonical census tract IDs (CT20), defines the tract index
+    """
+
+    def __init__(self, tract_ids):
+        self.tract_ids = np.asarray(tract_ids, dtype=str)
+        self._tract_index = pd.Index(self.tract_ids)
+        self.crime_types = []
+        self._type_codes = {}
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def _encode_types(self, crime_types):
+        """把犯罪类型映射为全局编码, 新出现的类型追加到词表"""
+        codes, uniques = pd.factorize(np.asarray(crime_types, dtype=object))
+        mapping = np.empty(len(uniques) + 1, dtype=np.int64)
+        for i, name in enumerate(uniques):
+            if name not in self._type_codes:
+                if len(self.crime_types) >= UNKNOWN_TYPE:
+                    raise ValueError(f"犯罪类型超过{UNKNOWN_TYPE}种")
+                self._type_codes[name] = len(self.crime_types)
+                self.crime_types.append(name)
+            mapping[i] = self._type_codes[name]
+        mapping[-1] = UNKNOWN_TYPE
+        return mapping[codes]
+
+    def _accumulate(self, keys, counts=None):
+        """把一批组合键(及计数)合并进累计结果"""
+        if counts is None:
+            keys, counts = np.unique(keys, return_counts=True)
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts, minlength=len(self.keys)).astype(np.int64)
+
+class CrimeStatistics(KeyCounts):
+    """
+    Census tract × crime type count engine.
+
+    Counts are accumulated in a single pass as (composite key, count) pairs,
+    where the key packs tract, crime type, year, month, weekday and hour. Chunks can be
+    folded in one at a time during ingest; any tract × type matrix, top-K
+    table or time slice is then derived with np.bincount without re-reading
+    the crime records.
+
+    Parameters:
+    -----------
+    tract_ids : array-like of str
+        Canonical census tract IDs (CT20), defines the tract index
+    tract_labels : array-like of str
+        Census tract labels aligned with tract_ids
+    """
+
+    def __init__(self, tract_ids, tract_labels):
+        super().__init__(tract_ids)
+        self.tract_labels = np.asarray(tract_labels, dtype=str)
+
+    @classmethod
+    def from_locator(cls, locator):
+        """Engine indexed by the tracts of a TractLocator"""
+        return cls(locator.ct20, locator.labels)
+
+    def add(self, tract_idx, crime_types, dates=None, times=None):
+        """
+        Fold one chunk of records into the counts.
+
+        Parameters:
+        -----------
+        tract_idx : numpy.ndarray
+            Tract positions in the canonical index, -1 for records without a tract (ignored)
+        crime_types : array-like
+            Crime type descriptions, NaN for unknown
+        dates : array-like, optional
+            Occurrence dates (strings in SOURCE_DATE_FORMAT or datetimes)
+        times : array-like, optional
+            TIME OCC values as 24h hhmm integers
+        """
+        tract_idx = np.asarray(tract_idx)
+        keep = tract_idx >= 0
+        n = int(keep.sum())
+        if n == 0:
+            return
+        tract = tract_idx[keep].astype(np.int64)
+        crime_type = self._encode_types(np.asarray(crime_types, dtype=object)[keep])
+
+        year = np.full(n, UNKNOWN_YEAR, dtype=np.int64)
+        month = np.full(n, UNKNOWN_MONTH, dtype=np.int64)
+        weekday = np.full(n, UNKNOWN_WEEKDAY, dtype=np.int64)
+        if dates is not None:
+            parsed = parse_dates(np.asarray(dates)[keep])
+            valid = ~parsed.isna()
+            year_offset = parsed.year.to_numpy(dtype=np.float64) - BASE_YEAR
+            valid &= (year_offset >= 0) & (year_offset < UNKNOWN_YEAR)
+            year[valid] = year_offset[valid].astype(np.int64)
+            month[valid] = parsed.month.to_numpy(dtype=np.float64)[valid].astype(np.int64) - 1
+            weekday[valid] = parsed.dayofweek.to_numpy(dtype=np.float64)[valid].astype(np.int64)
+
+        hour = np.full(n, UNKNOWN_HOUR, dtype=np.int64)
+        if times is not None:
+            time_occ = pd.to_numeric(pd.Series(np.asarray(times)[keep]), errors='coerce').to_numpy(dtype=np.float64)
+            valid = (time_occ >= 0) & (time_occ < 2400)
+            hour[valid] = (time_occ[valid] // 100).astype(np.int64)
+
+        self._accumulate(self._pack(tract, crime_type, year, month, weekday, hour))
+
+    @staticmethod
+    def _pack(tract, crime_type, year, month, weekday, hour):
+        """由各部分(year为相对BASE_YEAR的偏移, month从0开始)组成组合键"""
+        time_slot = ((year * MONTH_SLOTS + month) * WEEKDAY_SLOTS + weekday) * HOUR_SLOTS + hour
+        return (tract * MAX_CRIME_TYPES + crime_type) * TIME_SLOTS + time_slot
+
+    def add_groups(self, groups):
+        """
+        Fold pre-aggregated counts (e.g. the result of a GROUP BY query) into the counts.
+
+        Parameters:
+        -----------
+        groups : pandas.DataFrame
+            One row per group with census_tract_id, crime_type (None for unknown),
+            year (e.g. 2023), month (1-12), weekday (0=Monday), hour (0-23) and
+            count; missing or out-of-range time values count as unknown
+        """
+        tract_idx = self._tract_index.get_indexer(groups['census_tract_id'])
+        keep = tract_idx >= 0
+        if not keep.any():
+            return
+
+        def component(name, low, slots):
+            values = pd.to_numeric(groups[name]).to_numpy(dtype=np.float64)[keep] - low
+            valid = (values >= 0) & (values < slots - 1)
+            return np.where(valid, values, slots - 1).astype(np.int64)
+
+        keys = self._pack(
+            tract_idx[keep].astype(np.int64),
+            self._encode_types(groups['crime_type'].to_numpy(dtype=object)[keep]),
+            component('year', BASE_YEAR, YEAR_SLOTS),
+            component('month', 1, MONTH_SLOTS),
+            component('weekday', 0, WEEKDAY_SLOTS),
+            component('hour', 0, HOUR_SLOTS),
+        )
+        self._accumulate(keys, groups['count'].to_numpy(dtype=np.int64)[keep])
+
+    def add_frame(self, df):
+        """Fold a geocoded chunk (process_crime_data output columns) into the counts"""
+        tract_idx = self._tract_index.get_indexer(df['census_tract_id'])
+        return self.add(
+            tract_idx,
+            df['crime_type'],
+            dates=df['date'] if 'date' in df.columns else None,
+            times=df['time_occ'] if 'time_occ' in df.columns else None,
+        )
+
+    def merge(self, other):
+        """Fold another engine's counts (e.g. built by a worker process) into this one"""
+        if len(other.keys) == 0:
+            return
+        mapping = np.full(MAX_CRIME_TYPES, UNKNOWN_TYPE, dtype=np.int64)
+        mapping[:len(other.crime_types)] = self._encode_types(other.crime_types)
+        tract, crime_type, rest = self._split_keys(other.keys)
+        if not np.array_equal(self.tract_ids, other.tract_ids):
+            tract = self._tract_index.get_indexer(other.tract_ids)[tract]
+            keep = tract >= 0
+            tract, crime_type, rest, counts = tract[keep], crime_type[keep], rest[keep], other.counts[keep]
+        else:
+            counts = other.counts
+        keys = (tract * MAX_CRIME_TYPES + mapping[crime_type]) * TIME_SLOTS + rest
+        self._accumulate(keys, counts)
+
+    @staticmethod
+    def _split_keys(keys):
+        """拆出组合键中的tract、类型和时间部分"""
+        rest = keys % TIME_SLOTS
+        tract_type = keys // TIME_SLOTS
+        return tract_type // MAX_CRIME_TYPES, tract_type % MAX_CRIME_TYPES, rest
+
+    @staticmethod
+    def _split_time(rest):
+        """拆出时间部分的year(实际年份)、month(1-12)、weekday(0=周一)和hour"""
+        hour = rest % HOUR_SLOTS
+        weekday = (rest // HOUR_SLOTS) % WEEKDAY_SLOTS
+        month = (rest // (HOUR_SLOTS * WEEKDAY_SLOTS)) % MONTH_SLOTS + 1
+        year = rest // (HOUR_SLOTS * WEEKDAY_SLOTS * MONTH_SLOTS) + BASE_YEAR
+        return {'year': year, 'month': month, 'weekday': weekday, 'hour': hour}
+
+    def _select(self, years=None, months=None, weekdays=None, hours=None):
+        """按时间切片筛选, 返回(tract, type, 时间部分, count)"""
+        tract, crime_type, rest = self._split_keys(self.keys)
+        counts = self.counts
+        filters = {'year': years, 'month': months, 'weekday': weekdays, 'hour': hours}
+        if any(v is not None for v in filters.values()):
+            parts = self._split_time(rest)
+            mask = np.ones(len(counts), dtype=bool)
+            for name, values in filters.items():
+                if values is not None:
+                    mask &= np.isin(parts[name], np.atleast_1d(values))
+            tract, crime_type, rest, counts = tract[mask], crime_type[mask], rest[mask], counts[mask]
+        return tract, crime_type, rest, counts
+
+    def matrix(self, years=None, months=None, weekdays=None, hours=None):
+        """
+        Tract × crime type count matrix.
+
+        Parameters:
+        -----------
+        years, months, weekdays, hours : int or list of int, optional
+            Restrict to these occurrence years (e.g. 2023), months (1-12),
+            weekdays (0=Monday) or hours (0-23)
+
+        Returns:
+        --------
+        numpy.ndarray
+            int64 counts, shape (len(tract_ids), len(crime_types))
+        """
+        tract, crime_type, _, counts = self._select(years, months, weekdays, hours)
+        known = crime_type != UNKNOWN_TYPE
+        n_types = len(self.crime_types)
+        flat = tract[known] * n_types + crime_type[known]
+        return np.bincount(flat, weights=counts[known], minlength=len(self.tract_ids) * n_types).astype(np.int64).reshape(len(self.tract_ids), n_types)
+
+    def totals(self, years=None, months=None, weekdays=None, hours=None):
+        """Total crimes per tract (including records with an unknown crime type)"""
+        tract, _, _, counts = self._select(years, months, weekdays, hours)
+        return np.bincount(tract, weights=counts, minlength=len(self.tract_ids)).astype(np.int64)
+
+    def histogram(self, by='hour', years=None, months=None, weekdays=None, hours=None):
+        """
+        Per-tract histogram over one time component.
+
+        Parameters:
+        -----------
+        by : str
+            'hour' (0-23), 'weekday' (0=Monday), 'month' (1-12) or 'year'
+
+        Returns:
+        --------
+        pandas.DataFrame
+            Tracts as rows (CT20 index), time bins as columns; records with an unknown value are left out
+        """
+        if by == 'year':
+            years_seen = self._split_time(self._split_keys(self.keys)[2])['year']
+            bins = np.unique(years_seen[years_seen != UNKNOWN_YEAR + BASE_YEAR])
+        else:
+            bins = {'hour': np.arange(24), 'weekday': np.arange(7), 'month': np.arange(1, 13)}[by]
+        tract, _, rest, counts = self._select(years, months, weekdays, hours)
+        values = self._split_time(rest)[by]
+        column = np.searchsorted(bins, values)
+        known = (column < len(bins)) & (bins[np.minimum(column, len(bins) - 1)] == values)
+        flat = tract[known] * len(bins) + column[known]
+        counts = np.bincount(flat, weights=counts[known], minlength=len(self.tract_ids) * len(bins))
+        return pd.DataFrame(counts.astype(np.int64).reshape(len(self.tract_ids), len(bins)),
+                            index=pd.Index(self.tract_ids, name='census_tract_id'), columns=bins)
+
+    def top_types(self, k=10, years=None, months=None, weekdays=None, hours=None):
+        """Positions of the k most frequent crime types (all types when k is None)"""
+        type_totals = self.matrix(years, months, weekdays, hours).sum(axis=0)
+        # 数量降序, 并列时按类型名称升序(与groupby + nlargest一致)
+        order = np.lexsort((np.asarray(self.crime_types, dtype=object).argsort().argsort(), -type_totals))
+        order = order[type_totals[order] > 0]
+        return order if k is None else order[:k]
+
+    def to_frame(self, top_k=10, years=None, months=None, weekdays=None, hours=None):
+        """
+        Statistics table in the crime_by_census_tract.csv schema.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            census_tract_id, census_tract_label, total_crimes and one crime_* column
+            per top-K crime type (all types when top_k is None, names from
+            type_column_names), for tracts with crimes
+        """
+        totals = self.totals(years, months, weekdays, hours)
+        matrix = self.matrix(years, months, weekdays, hours)
+        has_crimes = np.flatnonzero(totals > 0)
+        # 按census tract编号排序
+        has_crimes = has_crimes[np.argsort(self.tract_ids[has_crimes], kind='stable')]
+
+        stats = pd.DataFrame({
+            'census_tract_id': self.tract_ids[has_crimes],
+            'census_tract_label': self.tract_labels[has_crimes],
+            'total_crimes': totals[has_crimes],
+        })
+        top = self.top_types(top_k, years, months, weekdays, hours)
+        names = type_column_names([self.crime_types[i] for i in top], taken=stats.columns)
+        for name, type_idx in zip(names, top):
+            stats[name] = matrix[has_crimes, type_idx]
+        return stats
+
+    def tract_profile(self, tract_id):
+        """
+        Counts of a single tract, read from its contiguous slice of the sorted keys.
+
+        Parameters:
+        -----------
+        tract_id : str
+            Census tract ID (CT20)
+
+        Returns:
+        --------
+        dict or None
+            total, per-type counts (descending), monthly series ('YYYY-MM'),
+            hour (0-23) and weekday (0=Monday) histograms; None for an unknown tract
+        """
+        position = self._tract_index.get_indexer([str(tract_id)])[0]
+        if position < 0:
+            return None
+        # 组合键以tract为最高位, 同一tract的记录在keys中连续
+        start, stop = np.searchsorted(self.keys, [position * MAX_CRIME_TYPES * TIME_SLOTS,
+                                                  (position + 1) * MAX_CRIME_TYPES * TIME_SLOTS])
+        _, crime_type, rest = self._split_keys(self.keys[start:stop])
+        counts = self.counts[start:stop]
+        parts = self._split_time(rest)
+
+        type_counts = np.bincount(crime_type, weights=counts, minlength=MAX_CRIME_TYPES).astype(np.int64)
+        by_type = {self.crime_types[i]: int(type_counts[i])
+                   for i in np.argsort(-type_counts[:len(self.crime_types)], kind='stable')
+                   if type_counts[i] > 0}
+
+        known_month = (parts['year'] != UNKNOWN_YEAR + BASE_YEAR) & (parts['month'] != UNKNOWN_MONTH + 1)
+        month_keys = parts['year'][known_month] * 12 + parts['month'][known_month] - 1
+        months, inverse = np.unique(month_keys, return_inverse=True)
+        month_counts = np.bincount(inverse, weights=counts[known_month], minlength=len(months)).astype(np.int64)
+
+        def time_histogram(values, bins):
+            known = values < bins
+            return np.bincount(values[known], weights=counts[known], minlength=bins).astype(np.int64).tolist()
+
+        return {
+            'census_tract_id': str(self.tract_ids[position]),
+            'census_tract_label': str(self.tract_labels[position]),
+            'total_crimes': int(counts.sum()),
+            'by_type': by_type,
+            'by_month': {f"{m // 12}-{m % 12 + 1:02d}": int(c) for m, c in zip(months, month_counts)},
+            'by_hour': time_histogram(parts['hour'], 24),
+            'by_weekday': time_histogram(parts['weekday'], 7),
+        }
+
+    def save(self, path):
+        """Save the accumulated counts to a .npz file"""
+        np.savez_compressed(
+            path,
+            keys=self.keys,
+            counts=self.counts,
+            tract_ids=self.tract_ids,
+            tract_labels=self.tract_labels,
+            crime_types=np.asarray(self.crime_types, dtype=str),
+            layout=KEY_LAYOUT,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load counts saved with save()"""
+        with np.load(path) as data:
+            if 'layout' not in data or not np.array_equal(data['layout'], KEY_LAYOUT):
+                raise ValueError(f"{path} 的组合键布局与当前版本不一致, 请重新生成")
+            stats = cls(data['tract_ids'], data['tract_labels'])
+            stats.keys = data['keys']
+            stats.counts = data['counts']
+            stats.crime_types = data['crime_types'].tolist()
+        stats._type_codes = {name: i for i, name in enumerate(stats.crime_types)}
+        return stats
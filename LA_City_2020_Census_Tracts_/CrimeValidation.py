@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+
+from CrimeStatistics import parse_dates
+
+# 被拒绝记录的原因编码 (按检查顺序, 每条记录只记录第一个原因)
+REJECT_REASONS = ['duplicate_id', 'missing_id', 'missing_coordinates', 'invalid_date', 'invalid_time', 'outside_bounds']
+
+# 拒绝记录文件中保存原因的列
+REASON_COLUMN = 'reject_reason'
+
+# 每纬度对应的米数 (用于把米制边距换算为经纬度)
+METERS_PER_DEGREE = 111320.0
+
+def tract_bounds(tracts_gdf, margin=0.0):
+    """
+    WGS84 bounding box of the tract polygons.
+
+    Parameters:
+    -----------
+    tracts_gdf : geopandas.GeoDataFrame
+        Census tract polygons (any CRS)
+    margin : float
+        Widen the box by this many metres on every side (e.g. the snap distance)
+
+    Returns:
+    --------
+    tuple of float
+        (min_lon, min_lat, max_lon, max_lat)
+    """
+    if tracts_gdf.crs is not None and tracts_gdf.crs.to_epsg() != 4326:
+        tracts_gdf = tracts_gdf.to_crs("EPSG:4326")
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in tracts_gdf.total_bounds)
+    # 经度方向按离赤道最远的纬度换算, 边距只会偏大
+    lat_margin = margin / METERS_PER_DEGREE
+    lon_margin = margin / (METERS_PER_DEGREE * np.cos(np.radians(max(abs(min_lat), abs(max_lat)))))
+    return min_lon - lon_margin, min_lat - lat_margin, max_lon + lon_margin, max_lat + lat_margin
+
+class DuplicateFilter:
+    """
+    Record IDs (DR_NO) of the accepted records seen across chunks.
+
+    The IDs are kept as a few sorted int64 runs (8 bytes per record, no
+    per-object overhead). Each chunk's new IDs become a run, and the last
+    two runs are merged while the older one is not larger, like carries in
+    a binary counter: there are O(log N) runs and every ID is merged
+    O(log N) times, instead of the whole array being rebuilt per chunk.
+    IDs are looked up with np.searchsorted in every run. The first accepted
+    occurrence of an ID, in file order, is kept; every later one is a
+    duplicate.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def _seen(self, ids):
+        """每个ID是否已在之前的块中出现"""
+        seen = np.zeros(len(ids), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, ids), len(run) - 1)
+            seen |= run[positions] == ids
+        return seen
+
+    def _add(self, ids):
+        """追加一组已排序、去重且未出现过的ID"""
+        if len(ids) == 0:
+            return
+        self.runs.append(ids)
+        while len(self.runs) > 1 and len(self.runs[-2]) <= len(self.runs[-1]):
+            last = self.runs.pop()
+            self.runs[-1] = np.sort(np.concatenate([self.runs[-1], last]))
+
+    def mark(self, ids, candidates=None):
+        """
+        Flag duplicates in one chunk of IDs and remember the new ones.
+
+        Parameters:
+        -----------
+        ids : array-like
+            Record IDs in file order, NaN for missing IDs (never flagged)
+        candidates : numpy.ndarray, optional
+            bool, rows that passed every other check; only these are
+            flagged and remembered, so a rejected record does not make a
+            later valid copy a duplicate (default: every row)
+
+        Returns:
+        --------
+        numpy.ndarray
+            bool, True for IDs already seen in this or an earlier chunk
+        """
+        values = pd.to_numeric(pd.Series(ids), errors='coerce').to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        if candidates is not None:
+            valid &= np.asarray(candidates, dtype=bool)
+        rows = np.flatnonzero(valid)
+        ids = values[rows].astype(np.int64)
+
+        # 块内重复: 除第一次出现外都是重复
+        repeated = np.ones(len(ids), dtype=bool)
+        repeated[np.unique(ids, return_index=True)[1]] = False
+        # 之前的块中已出现
+        seen = self._seen(ids)
+        self._add(np.unique(ids[~seen]))
+
+        duplicates = np.zeros(len(values), dtype=bool)
+        duplicates[rows] = repeated | seen
+        return duplicates
+
+def validate_records(chunk, bounds, duplicates=None, today=None, dedup=None):
+    """
+    Vectorized checks run before the spatial join.
+
+    Rows are rejected, with the first failing reason of REJECT_REASONS, when
+    the ID is missing, a coordinate is missing or 0, the occurrence date is
+    missing or in the future, TIME OCC is not a valid 24h hhmm time, or the
+    point lies outside bounds. A point outside bounds whose swapped
+    (latitude, longitude) falls inside is repaired in place instead of
+    rejected. Duplicates are checked last, among the rows that passed every
+    other check, so only accepted IDs are remembered and a record rejected
+    for another reason does not turn a later valid copy into a duplicate.
+
+    date and time_occ may be raw source text: they are parsed here with
+    errors coerced, so a malformed value is rejected as invalid_date or
+    invalid_time. Accepted rows get the parsed values (datetime64[s] dates,
+    int16 times); rejected rows keep the original text.
+
+    Parameters:
+    -----------
+    chunk : pandas.DataFrame
+        Source chunk with process_crime_data column names (crime_id, date,
+        time_occ, latitude, longitude, ...); date and time_occ parsed or text
+    bounds : tuple of float
+        (min_lon, min_lat, max_lon, max_lat), see tract_bounds
+    duplicates : numpy.ndarray, optional
+        bool duplicate flags for the chunk's rows, already computed from a
+        validate_records call with dedup (see process_crime_data)
+    today : numpy.datetime64, optional
+        Latest valid occurrence date (default: the current date)
+    dedup : DuplicateFilter, optional
+        Filter of the IDs accepted so far; the IDs accepted here are added
+
+    Returns:
+    --------
+    tuple
+        (accepted rows, rejected rows with a REASON_COLUMN column, number of swapped points repaired)
+    """
+    n = len(chunk)
+    reason = np.full(n, -1, dtype=np.int8)
+
+    def reject(mask, name):
+        reason[(reason < 0) & mask] = REJECT_REASONS.index(name)
+
+    reject(chunk['crime_id'].isna().to_numpy(), 'missing_id')
+
+    latitude = chunk['latitude'].to_numpy(dtype=np.float64)
+    longitude = chunk['longitude'].to_numpy(dtype=np.float64)
+    missing = np.isnan(latitude) | np.isnan(longitude) | (latitude == 0) | (longitude == 0)
+    reject(missing, 'missing_coordinates')
+
+    dates = parse_dates(chunk['date'].to_numpy()).to_numpy().astype('datetime64[s]')
+    today = np.datetime64('today', 'D') if today is None else np.datetime64(today, 'D')
+    reject(np.isnat(dates) | (dates.astype('datetime64[D]') > today), 'invalid_date')
+
+    times = pd.to_numeric(chunk['time_occ'], errors='coerce').to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        valid_time = (times >= 0) & (times < 2400) & (times % 100 < 60) & (times % 1 == 0)
+    reject(~valid_time, 'invalid_time')
+
+    min_lon, min_lat, max_lon, max_lat = bounds
+
+    def within(lon, lat):
+        return (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+    inside = within(longitude, latitude)
+    swapped = ~inside & ~missing & within(latitude, longitude) & (reason < 0)
+    reject(~inside & ~swapped, 'outside_bounds')
+
+    # 重复检查放在最后, 只记住通过其他检查的记录ID
+    if dedup is not None:
+        reject(dedup.mark(chunk['crime_id'].to_numpy(), candidates=reason < 0), 'duplicate_id')
+    if duplicates is not None:
+        reject(np.asarray(duplicates, dtype=bool), 'duplicate_id')
+    accepted = reason < 0
+    swapped &= accepted
+    if swapped.any():
+        chunk = chunk.copy()
+        chunk.loc[swapped, 'latitude'] = longitude[swapped].astype(chunk['latitude'].dtype)
+        chunk.loc[swapped, 'longitude'] = latitude[swapped].astype(chunk['longitude'].dtype)
+    rejected = chunk[~accepted].copy()
+    rejected.insert(0, REASON_COLUMN, np.asarray(REJECT_REASONS, dtype=object)[reason[~accepted]])
+    # 通过的记录日期和时间都有效, 换成解析后的值
+    chunk = chunk[accepted].copy()
+    chunk['date'] = dates[accepted]
+    chunk['time_occ'] = times[accepted].astype(np.int16)
+    return chunk, rejected, int(swapped.sum())
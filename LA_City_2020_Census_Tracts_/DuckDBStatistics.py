@@ -0,0 +1,108 @@
+import os
+import tempfile
+
+try:
+    import duckdb
+except ImportError:
+    # 没有安装duckdb时只能使用内存中的统计 (generate_statistics的默认backend)
+    duckdb = None
+
+# 默认内存上限, 超出后中间结果溢写到temp_directory
+DEFAULT_MEMORY_LIMIT = '1GB'
+
+# 输出文件中date列可能的格式: process_crime_data写出YYYY-MM-DD, 旧版本保留源数据格式
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y %I:%M:%S %p']
+
+# 统计必需的列; date和time_occ缺失时(旧版本的输出)与默认backend一样计为未知时间
+REQUIRED_COLUMNS = ['census_tract_id', 'crime_type']
+
+def _source(path):
+    """按扩展名读取关联结果, 返回(表函数, 参数); CSV全部按文本读取 (tract编号保留前导零, 日期由查询解析)
+
+    增量处理写出的Parquet是一个part文件目录, 按通配符读取其中所有文件
+    """
+    if path.endswith(".parquet"):
+        if os.path.isdir(path):
+            path = os.path.join(path, "*.parquet")
+        return "read_parquet(?, union_by_name = true)", path
+    return "read_csv(?, header = true, all_varchar = true)", path
+
+def _time_expressions(columns):
+    """(时间戳表达式, time_occ表达式); columns为列名到DuckDB类型的映射, 缺失的列为NULL, 文本日期按DATE_FORMATS解析"""
+    if 'date' not in columns:
+        timestamp = "NULL::TIMESTAMP"
+    elif columns['date'] != 'VARCHAR':
+        timestamp = "CAST(date AS TIMESTAMP)"
+    else:
+        timestamp = "coalesce(" + ", ".join(f"try_strptime(date, '{f}')" for f in DATE_FORMATS) + ")"
+    time_occ = "TRY_CAST(time_occ AS INTEGER)" if 'time_occ' in columns else "NULL::INTEGER"
+    return timestamp, time_occ
+
+def grouped_counts(crime_tract_path, memory_limit=DEFAULT_MEMORY_LIMIT, temp_directory=None, threads=None):
+    """
+    Count geocoded records per tract, crime type, year, month, weekday and hour with DuckDB.
+
+    The file is scanned by DuckDB's streaming CSV/Parquet readers and
+    aggregated by a hash GROUP BY that stays within memory_limit and spills
+    to temp_directory when it does not fit, so the geocoded file is never
+    loaded into pandas. The result is bounded by the number of distinct
+    groups, not by the number of records.
+
+    Parameters:
+    -----------
+    crime_tract_path : str
+        process_crime_data output (CSV or Parquet, by extension; a Parquet
+        directory of part files as written by ingest_incremental). Like the
+        default backend, missing date or time_occ columns (older outputs)
+        count as unknown time values
+    memory_limit : str
+        DuckDB memory limit, e.g. '512MB' or '4GB'
+    temp_directory : str, optional
+        Spill directory; a temporary directory is created and removed when None
+    threads : int, optional
+        DuckDB worker threads (all cores when None)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        census_tract_id, crime_type, year, month, weekday (0=Monday), hour and count;
+        CrimeStatistics.add_groups input
+    """
+    if duckdb is None:
+        raise ImportError("backend='duckdb'需要安装duckdb (pip install duckdb)")
+    source, path = _source(crime_tract_path)
+    with tempfile.TemporaryDirectory(prefix="crime_duckdb_") as spill:
+        config = {
+            'memory_limit': memory_limit,
+            'temp_directory': temp_directory or spill,
+            # 分组结果不需要保持输入顺序, 关闭后流式聚合占用更少内存
+            'preserve_insertion_order': False,
+        }
+        if threads:
+            config['threads'] = threads
+        if temp_directory:
+            os.makedirs(temp_directory, exist_ok=True)
+        con = duckdb.connect(config=config)
+        try:
+            schema = con.execute(f"DESCRIBE SELECT * FROM {source}", [path]).df()
+            columns = dict(zip(schema['column_name'], schema['column_type']))
+            missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+            if missing:
+                raise ValueError(f"{crime_tract_path} 缺少统计所需的列: {', '.join(missing)}")
+            timestamp, time_occ = _time_expressions(columns)
+            query = f"""
+                WITH records AS (
+                    SELECT census_tract_id, crime_type, {timestamp} AS ts, {time_occ} AS time_occ
+                    FROM {source}
+                    WHERE census_tract_id IS NOT NULL AND census_tract_id <> ''
+                )
+                SELECT census_tract_id, crime_type,
+                       year(ts) AS year, month(ts) AS month, isodow(ts) - 1 AS weekday,
+                       CASE WHEN time_occ >= 0 AND time_occ < 2400 THEN time_occ // 100 END AS hour,
+                       count(*) AS count
+                FROM records
+                GROUP BY ALL
+            """
+            return con.execute(query, [path]).df()
+        finally:
+            con.close()
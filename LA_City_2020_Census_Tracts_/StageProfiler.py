@@ -0,0 +1,231 @@
+import contextlib
+import cProfile
+import csv
+import json
+import os
+import resource
+import time
+
+try:
+    import psutil
+except ImportError:
+    # 没有安装psutil时阶段峰值只采样本进程 (读取/proc), 不包含子进程
+    psutil = None
+
+REPORT_FIELDS = ['level', 'stage', 'chunk', 'rows', 'wall_s', 'cpu_s', 'children_cpu_s', 'rows_per_s',
+                 'rss_mb', 'peak_rss_mb', 'stage_peak_rss_mb', 'stage_peak_children_rss_mb']
+
+def _cpu_times():
+    """(本进程CPU秒数, 已结束子进程CPU秒数)"""
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+def _rss_mb():
+    """当前常驻内存(MB), 无/proc时返回None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+def _peak_rss_mb():
+    """进程启动以来的峰值常驻内存(MB), Linux下ru_maxrss单位为KB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _memory_mb(process):
+    """(本进程常驻内存, 子进程合计常驻内存)(MB); 没有psutil时只读取/proc, 子进程为None"""
+    if process is None:
+        return _rss_mb() or 0.0, None
+    children = 0
+    for child in process.children(recursive=True):
+        try:
+            children += child.memory_info().rss
+        except psutil.Error:
+            # 采样期间已退出的子进程
+            pass
+    return process.memory_info().rss / 2 ** 20, children / 2 ** 20
+
+class StageProfiler:
+    """
+    Wall time, CPU time, throughput and memory per pipeline stage and per chunk.
+
+    Stages are timed with the stage() context manager; chunk-level timings
+    inside a stage come from chunk() or from wrapping an iterator with
+    iterate(), which times each next() call. peak_rss_mb is the process
+    high-water mark when the record closes. Stages also get their own peak
+    of the resident memory of the process and of its child processes (pool
+    workers, with psutil). It is sampled in the caller's thread, never by a
+    background thread, so stages may fork process pools safely: when a stage
+    opens or closes, whenever a chunk record closes, and on every sample()
+    call (e.g. once per result of a pool), so a spike between two samples
+    is missed. A disabled profiler turns every call into
+    a no-op, so instrumented code needs no conditionals.
+
+    Parameters:
+    -----------
+    enabled : bool
+        Record anything at all
+    profile_stage : str, optional
+        Run cProfile for this stage and dump the stats (pstats format,
+        readable by snakeviz/gprof2dot) to {report_prefix}.{stage}.prof
+    report_prefix : str
+        Prefix of the .json/.csv run report and the .prof dump
+    """
+
+    def __init__(self, enabled=True, profile_stage=None, report_prefix='run_report'):
+        self.enabled = enabled
+        self.profile_stage = profile_stage
+        self.report_prefix = report_prefix
+        self.records = []
+        self._process = psutil.Process() if psutil is not None else None
+        # 每个未结束阶段的[本进程峰值, 子进程峰值]
+        self._stage_peaks = []
+
+    def _open(self):
+        return {'wall': time.perf_counter(), 'cpu': _cpu_times()}
+
+    def sample(self):
+        """采样当前内存, 更新所有未结束阶段的峰值"""
+        if not self._stage_peaks:
+            return
+        own, children = _memory_mb(self._process)
+        for peak in self._stage_peaks:
+            peak[0] = max(peak[0], own)
+            if children is not None:
+                peak[1] = max(peak[1] or 0.0, children)
+
+    def _close(self, level, stage, chunk, rows, start, peaks=(None, None)):
+        self.sample()
+        wall = time.perf_counter() - start['wall']
+        cpu, children = _cpu_times()
+        record = {
+            'level': level,
+            'stage': stage,
+            'chunk': chunk,
+            'rows': rows,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu - start['cpu'][0], 6),
+            'children_cpu_s': round(children - start['cpu'][1], 6),
+            'rows_per_s': round(rows / wall, 1) if rows and wall > 0 else None,
+            'rss_mb': _rss_mb(),
+            'peak_rss_mb': _peak_rss_mb(),
+            'stage_peak_rss_mb': peaks[0],
+            'stage_peak_children_rss_mb': peaks[1],
+        }
+        self.records.append(record)
+        return record
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Time one pipeline stage.
+
+        Yields a dict; set its 'rows' entry inside the block when the row
+        count is only known at the end.
+        """
+        if not self.enabled:
+            yield {}
+            return
+        info = {'rows': rows}
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        peak = [0.0, None]
+        self._stage_peaks.append(peak)
+        self.sample()
+        start = self._open()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield info
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(f"{self.report_prefix}.{name}.prof")
+            self.sample()
+            self._stage_peaks.remove(peak)
+            self._close('stage', name, None, info['rows'], start,
+                        (round(peak[0], 1), None if peak[1] is None else round(peak[1], 1)))
+
+    @contextlib.contextmanager
+    def chunk(self, stage, index=None, rows=None):
+        """Time one chunk of a stage"""
+        if not self.enabled:
+            yield
+            return
+        start = self._open()
+        try:
+            yield
+        finally:
+            self._close('chunk', stage, index, rows, start)
+
+    def iterate(self, stage, iterable, rows=None):
+        """
+        Wrap an iterator, recording the time spent producing each item.
+
+        Parameters:
+        -----------
+        rows : callable, optional
+            Row count of an item, e.g. lambda item: len(item)
+        """
+        if not self.enabled:
+            return iterable
+        return self._iterate(stage, iterable, rows)
+
+    def _iterate(self, stage, iterable, rows):
+        iterator = iter(iterable)
+        index = 0
+        while True:
+            start = self._open()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self._close('chunk', stage, index, rows(item) if rows else None, start)
+            index += 1
+            yield item
+
+    def summary(self):
+        """Chunk records summed per stage, in first-seen order"""
+        totals = {}
+        for record in self.records:
+            if record['level'] != 'chunk':
+                continue
+            total = totals.setdefault(record['stage'], {'stage': record['stage'], 'chunks': 0, 'rows': 0,
+                                                        'wall_s': 0.0, 'cpu_s': 0.0})
+            total['chunks'] += 1
+            total['rows'] += record['rows'] or 0
+            total['wall_s'] += record['wall_s']
+            total['cpu_s'] += record['cpu_s']
+        for total in totals.values():
+            total['rows_per_s'] = round(total['rows'] / total['wall_s'], 1) if total['rows'] and total['wall_s'] else None
+        return list(totals.values())
+
+    def write_report(self):
+        """Write {report_prefix}.json and {report_prefix}.csv and print a summary"""
+        if not self.enabled:
+            return
+        report = {
+            'pid': os.getpid(),
+            'stages': [r for r in self.records if r['level'] == 'stage'],
+            'chunk_totals': self.summary(),
+            'chunks': [r for r in self.records if r['level'] == 'chunk'],
+        }
+        with open(f"{self.report_prefix}.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        with open(f"{self.report_prefix}.csv", 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+        print(f"{'阶段':<24}{'墙钟(秒)':>10}{'CPU(秒)':>10}{'行/秒':>14}{'峰值内存(MB)':>14}")
+        for record in report['stages']:
+            rate = f"{record['rows_per_s']:,.0f}" if record['rows_per_s'] else '-'
+            print(f"{record['stage']:<24}{record['wall_s']:>10.2f}{record['cpu_s']:>10.2f}{rate:>14}"
+                  f"{record['stage_peak_rss_mb']:>14.0f}")
+        for total in report['chunk_totals']:
+            rate = f"{total['rows_per_s']:,.0f}" if total['rows_per_s'] else '-'
+            print(f"  {total['stage']:<22}{total['wall_s']:>10.2f}{total['cpu_s']:>10.2f}{rate:>14}"
+                  f"{'':>14}  ({total['chunks']} 块)")
+        print(f"运行报告已保存至 {self.report_prefix}.json / {self.report_prefix}.csv")
+
+# 未开启profile时使用的空实现
+NULL_PROFILER = StageProfiler(enabled=False)
@@ -0,0 +1,296 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.colors import LogNorm, Normalize, to_rgba
+from matplotlib.figure import Figure
+
+from CensusTractLoader import load_tracts, shapefile_hash
+from TractRenderer import geometry_path
+
+# Web Mercator (EPSG:3857) 世界范围的半边长, 单位米
+WORLD_HALF_SIZE = 20037508.342789244
+TILE_PIXELS = 256
+MANIFEST_NAME = 'manifest.json'
+
+def tile_bounds(z, x, y):
+    """(min x, min y, max x, max y) of XYZ tile z/x/y in EPSG:3857"""
+    size = 2 * WORLD_HALF_SIZE / (1 << z)
+    min_x = -WORLD_HALF_SIZE + x * size
+    max_y = WORLD_HALF_SIZE - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+def tile_range(bounds, z):
+    """Inclusive XYZ column and row ranges covering an EPSG:3857 bounding box"""
+    size = 2 * WORLD_HALF_SIZE / (1 << z)
+    min_x, min_y, max_x, max_y = bounds
+    x0 = int((min_x + WORLD_HALF_SIZE) // size)
+    x1 = int((max_x + WORLD_HALF_SIZE) // size)
+    y0 = int((WORLD_HALF_SIZE - max_y) // size)
+    y1 = int((WORLD_HALF_SIZE - min_y) // size)
+    return x0, x1, y0, y1
+
+def _nice_ceiling(value):
+    """向上取整到1/2/5×10^n, 统计量小幅变化时色阶保持不变"""
+    if value <= 0:
+        return 1.0
+    exponent = 10 ** math.floor(math.log10(value))
+    for step in (1, 2, 5, 10):
+        if value <= step * exponent:
+            return float(step * exponent)
+
+class TileBuilder:
+    """
+    Raster XYZ tile pyramid for one per-tract metric.
+
+    Tract polygons are simplified once per zoom level (tolerance of half a
+    pixel) and converted to matplotlib paths; each 256x256 PNG tile only
+    draws the tracts whose polygons intersect it, coloured from a colour
+    scale shared by the whole pyramid. A manifest next to the tiles records
+    the metric value of every tract, so a rebuild only redraws the tiles
+    that touch tracts whose value changed.
+
+    Parameters:
+    -----------
+    tracts : geopandas.GeoDataFrame
+        Census tract polygons with a CT20 column (reprojected to EPSG:3857)
+    values : numpy.ndarray
+        Metric value per tract (tract order), NaN for tracts without data
+    zooms : sequence of int
+        Zoom levels to build
+    cmap : str
+        Colour map name
+    vmax : float, optional
+        Top of the colour scale, defaults to the maximum rounded up to 1/2/5×10^n
+    log_scale : bool
+        Use a logarithmic colour scale (as the static heatmap does)
+    """
+
+    def __init__(self, tracts, values, zooms=range(8, 14), cmap='OrRd', vmax=None, log_scale=True):
+        if tracts.crs is not None and tracts.crs != "EPSG:3857":
+            tracts = tracts.to_crs("EPSG:3857")
+        self.tract_ids = np.asarray(tracts['CT20'], dtype=str)
+        self.geometries = shapely.orient_polygons(tracts.geometry.to_numpy())
+        self.tree = shapely.STRtree(self.geometries)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.zooms = list(zooms)
+        self.cmap = cmap
+
+        present = self.values[~np.isnan(self.values)]
+        self.vmax = float(vmax) if vmax is not None else _nice_ceiling(present.max() if len(present) else 1.0)
+        self.log_scale = log_scale
+        norm = LogNorm(vmin=1, vmax=max(self.vmax, 10)) if log_scale else Normalize(vmin=0, vmax=self.vmax)
+        scaled = np.where(np.isnan(self.values), 1, self.values)
+        if log_scale:
+            # 对数色阶下0 (该类型没有犯罪) 会被LogNorm屏蔽成无数据色, 按最低一档着色
+            scaled = np.maximum(scaled, 1)
+        self.facecolors = colormaps[cmap](norm(scaled), alpha=0.8)
+        # 无数据的tract用半透明灰色, 叠加在底图上仍可辨认
+        self.facecolors[np.isnan(self.values)] = to_rgba('lightgrey', alpha=0.5)
+
+        self._paths = {}
+
+    @classmethod
+    def from_statistics(cls, tracts, stats_df, metric='total_crimes', **kwargs):
+        """Builder for one column of the crime_by_census_tract table"""
+        values = pd.Series(stats_df[metric].to_numpy(dtype=np.float64),
+                           index=stats_df['census_tract_id'].astype(str))
+        values = values.reindex(np.asarray(tracts['CT20'], dtype=str)).to_numpy()
+        return cls(tracts, values, **kwargs)
+
+    def style(self):
+        """Settings that affect every tile; a change invalidates the whole pyramid"""
+        return {'cmap': self.cmap, 'vmax': self.vmax, 'log_scale': self.log_scale, 'tile_pixels': TILE_PIXELS}
+
+    def tile_tracts(self, z):
+        """
+        Tiles at zoom z that intersect at least one tract.
+
+        Returns:
+        --------
+        dict
+            (x, y) -> numpy.ndarray of tract row positions
+        """
+        x0, x1, y0, y1 = tile_range(shapely.total_bounds(self.geometries), z)
+        xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+        xs, ys = xs.ravel(), ys.ravel()
+        boxes = shapely.box(*np.array([tile_bounds(z, x, y) for x, y in zip(xs, ys)]).T)
+        tile_idx, tract_idx = self.tree.query(boxes, predicate='intersects')
+        order = np.argsort(tile_idx, kind='stable')
+        tile_idx, tract_idx = tile_idx[order], tract_idx[order]
+        unique_tiles, starts = np.unique(tile_idx, return_index=True)
+        groups = np.split(tract_idx, starts[1:])
+        return {(int(xs[t]), int(ys[t])): group for t, group in zip(unique_tiles, groups)}
+
+    def paths(self, z):
+        """Tract paths simplified to half a pixel at zoom z, built once per zoom"""
+        if z not in self._paths:
+            pixel = 2 * WORLD_HALF_SIZE / (1 << z) / TILE_PIXELS
+            simplified = shapely.simplify(self.geometries, pixel / 2, preserve_topology=True)
+            self._paths[z] = [geometry_path(geometry) for geometry in simplified]
+        return self._paths[z]
+
+    def render_tile(self, z, x, y, tract_idx, output_dir):
+        """Draw one tile and write it to output_dir/z/x/y.png"""
+        paths = self.paths(z)
+        fig = Figure(figsize=(1, 1), dpi=TILE_PIXELS)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        collection = PathCollection([paths[i] for i in tract_idx], facecolors=self.facecolors[tract_idx],
+                                    edgecolors='black', linewidths=0.1 if z < 12 else 0.3)
+        ax.add_collection(collection)
+        min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+        ax.set_xlim(min_x, max_x)
+        ax.set_ylim(min_y, max_y)
+
+        tile_path = os.path.join(output_dir, str(z), str(x), f"{y}.png")
+        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+        fig.savefig(tile_path, dpi=TILE_PIXELS, transparent=True)
+        return tile_path
+
+# 并行生成时由fork继承的构建器
+_worker_builder = None
+
+def _render_tiles(args):
+    """工作进程: 生成一批瓦片, 返回生成数量"""
+    tiles, output_dir = args
+    for z, x, y, tract_idx in tiles:
+        _worker_builder.render_tile(z, x, y, tract_idx, output_dir)
+    return len(tiles)
+
+def _load_manifest(output_dir):
+    """读取上次生成的清单, 不存在时返回None"""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def build_tiles(builder, output_dir='tiles', workers=1, source_hash=None, batch_size=64):
+    """
+    Build or incrementally update an XYZ tile pyramid.
+
+    A tile is redrawn when it is new or touches a tract whose value differs
+    from the manifest. Any change of style, zoom levels or source shapefile
+    rebuilds every tile. Tiles listed in the previous manifest that are no
+    longer produced are deleted.
+
+    Parameters:
+    -----------
+    builder : TileBuilder
+        Tract geometry and metric values
+    output_dir : str
+        Root of the {z}/{x}/{y}.png tree
+    workers : int
+        Number of processes used to draw tiles
+    source_hash : str, optional
+        Hash of the tract shapefile, stored in the manifest
+    batch_size : int
+        Tiles sent to a worker per task
+
+    Returns:
+    --------
+    int
+        Number of tiles written
+    """
+    global _worker_builder
+    tract_values = {tract_id: (None if np.isnan(value) else float(value))
+                    for tract_id, value in zip(builder.tract_ids, builder.values)}
+    previous = _load_manifest(output_dir)
+    full_rebuild = (previous is None or previous.get('style') != builder.style()
+                    or previous.get('zooms') != builder.zooms or previous.get('source_hash') != source_hash)
+    # 上次生成的全部瓦片, 不再生成的需要删除 (全量重建时同样适用)
+    previous_tiles = set(previous['tiles']) if previous is not None else set()
+    if full_rebuild:
+        changed = np.ones(len(builder.tract_ids), dtype=bool)
+        existing = set()
+    else:
+        old_values = previous['values']
+        changed = np.array([old_values.get(tract_id, 'missing') != tract_values[tract_id]
+                            for tract_id in builder.tract_ids])
+        existing = previous_tiles
+
+    tiles = []
+    tile_keys = []
+    for z in builder.zooms:
+        for (x, y), tract_idx in builder.tile_tracts(z).items():
+            key = f"{z}/{x}/{y}"
+            tile_keys.append(key)
+            if key not in existing or changed[tract_idx].any():
+                tiles.append((z, x, y, tract_idx))
+    print(f"{int(changed.sum())} 个tract的数值有变化, 需生成 {len(tiles)} / {len(tile_keys)} 个瓦片")
+
+    # 瓦片按缩放级别顺序分批, 每个工作进程只需为少数级别构建简化路径
+    batches = [(tiles[i:i + batch_size], output_dir) for i in range(0, len(tiles), batch_size)]
+    if workers <= 1 or len(batches) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for tile in tiles:
+            builder.render_tile(*tile, output_dir)
+    else:
+        _worker_builder = builder
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                for _ in pool.imap_unordered(_render_tiles, batches):
+                    pass
+        finally:
+            _worker_builder = None
+
+    # 删除已不与任何tract相交(或不在当前缩放级别中)的旧瓦片
+    for key in previous_tiles.difference(tile_keys):
+        stale = os.path.join(output_dir, key + '.png')
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    manifest = {
+        'source_hash': source_hash,
+        'style': builder.style(),
+        'zooms': builder.zooms,
+        'bounds': shapely.total_bounds(builder.geometries).tolist(),
+        'tiles': sorted(tile_keys),
+        'values': tract_values,
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_path = os.path.join(output_dir, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST_NAME))
+    return len(tiles)
+
+def main(metric='total_crimes', zooms=range(8, 14), output_dir=None, workers=1, vmax=None):
+    """Build the tile pyramid for one column of crime_by_census_tract"""
+    start_time = time.time()
+    shapefile_path = 'LA_City_2020_Census_Tracts_.shp'
+    tracts = load_tracts(shapefile_path, crs="EPSG:3857")
+
+    parquet_path, csv_path = 'crime_by_census_tract.parquet', 'crime_by_census_tract.csv'
+    if os.path.exists(parquet_path) and (not os.path.exists(csv_path)
+                                         or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)):
+        stats_df = pd.read_parquet(parquet_path)
+    else:
+        stats_df = pd.read_csv(csv_path, dtype={'census_tract_id': str, 'census_tract_label': str})
+
+    builder = TileBuilder.from_statistics(tracts, stats_df, metric=metric, zooms=zooms, vmax=vmax)
+    output_dir = output_dir or os.path.join('tiles', metric)
+    written = build_tiles(builder, output_dir, workers=workers, source_hash=shapefile_hash(shapefile_path))
+    print(f"瓦片已写入 {output_dir} ({written} 个), 耗时 {time.time() - start_time:.2f}秒")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build XYZ raster tiles of a per-tract crime metric")
+    parser.add_argument('--metric', default='total_crimes', help="column of crime_by_census_tract to map")
+    parser.add_argument('--min-zoom', type=int, default=8)
+    parser.add_argument('--max-zoom', type=int, default=13)
+    parser.add_argument('--output-dir', default=None, help="defaults to tiles/<metric>")
+    parser.add_argument('--workers', type=int, default=1, help="number of processes used to draw tiles")
+    parser.add_argument('--vmax', type=float, default=None, help="fixed top of the colour scale")
+    args = parser.parse_args()
+    main(metric=args.metric, zooms=range(args.min_zoom, args.max_zoom + 1), output_dir=args.output_dir,
+         workers=args.workers, vmax=args.vmax)
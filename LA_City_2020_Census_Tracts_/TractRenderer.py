@@ -0,0 +1,157 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import PathCollection
+from matplotlib.colors import Normalize, to_rgba
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+
+def geometry_path(geometry):
+    """Compound matplotlib Path for one (multi)polygon, holes included"""
+    vertices = []
+    codes = []
+    for polygon in getattr(geometry, 'geoms', [geometry]):
+        for ring in [polygon.exterior, *polygon.interiors]:
+            ring_coords = np.asarray(ring.coords)[:, :2]
+            ring_codes = np.full(len(ring_coords), Path.LINETO, dtype=Path.code_type)
+            ring_codes[0] = Path.MOVETO
+            ring_codes[-1] = Path.CLOSEPOLY
+            vertices.append(ring_coords)
+            codes.append(ring_codes)
+    return Path(np.concatenate(vertices), np.concatenate(codes))
+
+class TractRenderer:
+    """
+    Reusable choropleth renderer for the census tract polygons.
+
+    The tract geometries are converted to matplotlib paths once; each map
+    only recolours a PathCollection built from those cached paths. Figures
+    are created with the object-oriented Agg API, so nothing is registered
+    with pyplot and every figure is released after saving.
+
+    Parameters:
+    -----------
+    tracts : geopandas.GeoDataFrame
+        Census tract polygons with a CT20 column (any CRS)
+    """
+
+    def __init__(self, tracts):
+        self.tract_ids = np.asarray(tracts['CT20'], dtype=str)
+        self._tract_index = pd.Index(self.tract_ids)
+        # 外环逆时针、内环顺时针, 按nonzero规则填充时洞不会被涂色
+        geometries = shapely.orient_polygons(tracts.geometry.to_numpy())
+        self.paths = [geometry_path(geometry) for geometry in geometries]
+        self.bounds = shapely.total_bounds(geometries)
+
+    def align(self, stats_df, column, id_column='census_tract_id'):
+        """Values of stats_df[column] aligned with the tract order, NaN where a tract has no row"""
+        values = np.full(len(self.tract_ids), np.nan)
+        positions = self._tract_index.get_indexer(stats_df[id_column].astype(str))
+        found = positions >= 0
+        values[positions[found]] = stats_df[column].to_numpy(dtype=np.float64)[found]
+        return values
+
+    def render(self, values, output_path, cmap='OrRd', norm=None, title=None, colorbar_label=None,
+               legend_handles=None, legend_title=None, missing_color='lightgrey', figsize=(15, 10), dpi=300):
+        """
+        Draw one choropleth and save it.
+
+        Parameters:
+        -----------
+        values : numpy.ndarray
+            One value per tract (tract order), NaN for missing
+        output_path : str
+            Image path
+        cmap : str or Colormap
+            Colour map for the values
+        norm : matplotlib.colors.Normalize, optional
+            Value normalisation, defaults to a linear min-max norm
+        colorbar_label : str, optional
+            Adds a colour bar with this label
+        legend_handles : list, optional
+            Legend entries (e.g. Patch objects) drawn in the lower right corner
+
+        Returns:
+        --------
+        matplotlib.figure.Figure
+            The saved figure (not registered with pyplot)
+        """
+        cmap = colormaps[cmap] if isinstance(cmap, str) else cmap
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        if norm is None:
+            if missing.all():
+                norm = Normalize(vmin=0, vmax=1)
+            else:
+                norm = Normalize(vmin=np.nanmin(values), vmax=np.nanmax(values))
+
+        facecolors = cmap(norm(np.where(missing, 0, values)))
+        facecolors[missing] = to_rgba(missing_color)
+
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        collection = PathCollection(self.paths, facecolors=facecolors, edgecolors='black', linewidths=0.3)
+        ax.add_collection(collection)
+        min_x, min_y, max_x, max_y = self.bounds
+        ax.set_xlim(min_x, max_x)
+        ax.set_ylim(min_y, max_y)
+        ax.set_aspect('equal')
+        ax.set_axis_off()
+
+        if colorbar_label is not None:
+            sm = ScalarMappable(cmap=cmap, norm=norm)
+            sm.set_array([])
+            cbar = fig.colorbar(sm, ax=ax, shrink=0.7)
+            cbar.set_label(colorbar_label, fontsize=12)
+        if legend_handles is not None:
+            ax.legend(handles=legend_handles, title=legend_title, loc="lower right", fontsize=10)
+        if title is not None:
+            ax.set_title(title, fontsize=16)
+
+        fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
+        return fig
+
+# 并行渲染时由fork继承的渲染器
+_worker_renderer = None
+
+def _render_job(job):
+    """工作进程: 渲染一张地图, 只返回文件路径"""
+    _worker_renderer.render(**job)
+    return job['output_path']
+
+def render_many(renderer, jobs, workers=1):
+    """
+    Render several maps, optionally in parallel worker processes.
+
+    Parameters:
+    -----------
+    renderer : TractRenderer
+        Renderer shared with the workers (inherited through fork)
+    jobs : list of dict
+        Keyword arguments for TractRenderer.render, one dict per map
+    workers : int
+        Number of processes; 1 renders in the current process
+
+    Returns:
+    --------
+    list of str
+        Output paths in job order
+    """
+    global _worker_renderer
+    if workers <= 1 or len(jobs) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for job in jobs:
+            renderer.render(**job)
+        return [job['output_path'] for job in jobs]
+
+    _worker_renderer = renderer
+    try:
+        with multiprocessing.get_context('fork').Pool(min(workers, len(jobs))) as pool:
+            return pool.map(_render_job, jobs)
+    finally:
+        _worker_renderer = None
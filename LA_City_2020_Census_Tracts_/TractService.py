@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import traceback
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from CensusTractGrid import load_tract_grid
+from CrimeStatistics import CrimeStatistics
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+# 请求参数或JSON内容不合法时dispatch抛出的异常 (例如请求体为[1]时是TypeError)
+BAD_REQUEST_ERRORS = (KeyError, ValueError, TypeError, IndexError)
+SERIES = ['by_month', 'by_hour', 'by_weekday']
+
+class TractService:
+    """
+    Point → census tract lookups and per-tract crime statistics over HTTP.
+
+    The tract lookup grid and the statistics are loaded once and kept in
+    memory. Concurrent single-point requests are queued for at most
+    batch_window seconds and resolved together with one vectorized
+    locate_indices call; tract and statistics responses are cached as
+    encoded JSON in LRU caches.
+
+    Endpoints:
+        GET  /tract?lat=..&lon=..          one point
+        POST /tracts                       {"latitudes": [...], "longitudes": [...]}
+        GET  /stats/<CT20>                 total and per-type counts
+        GET  /timeseries/<CT20>?by=month   by=month | hour | weekday
+        GET  /health
+
+    Parameters:
+    -----------
+    locator : TractGrid or TractLocator
+        Anything with locate_indices and ct20/labels arrays
+    stats : CrimeStatistics, optional
+        Statistics served by /stats and /timeseries
+    batch_window : float
+        Seconds a single-point lookup may wait for others to join its batch
+    max_batch : int
+        Flush the batch as soon as it holds this many points
+    cache_size : int
+        Entries per LRU response cache
+    """
+
+    def __init__(self, locator, stats=None, batch_window=0.001, max_batch=4096, cache_size=4096):
+        self.locator = locator
+        self.stats = stats
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._pending = []
+        self._flush_handle = None
+        self.batches = 0
+        self.batched_points = 0
+        self._tract_body = functools.lru_cache(maxsize=cache_size)(self._encode_tract)
+        self._stats_body = functools.lru_cache(maxsize=cache_size)(self._encode_stats)
+
+    async def locate(self, latitude, longitude):
+        """Tract row position of one point (-1 if outside), resolved in a micro-batch"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((latitude, longitude, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        """一次向量化查询处理所有排队的点"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self.batches += 1
+        self.batched_points += len(pending)
+        try:
+            latitudes = np.array([p[0] for p in pending], dtype=np.float64)
+            longitudes = np.array([p[1] for p in pending], dtype=np.float64)
+            indices = self.locator.locate_indices(latitudes, longitudes)
+        except Exception as exc:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, _, future), index in zip(pending, indices):
+            if not future.done():
+                future.set_result(int(index))
+
+    def _encode_tract(self, index):
+        """单个tract的响应内容"""
+        return json.dumps({
+            'census_tract_id': str(self.locator.ct20[index]),
+            'census_tract_label': str(self.locator.labels[index]),
+        }).encode()
+
+    def _encode_stats(self, tract_id, series=None):
+        """tract统计或时间序列的响应内容, tract不存在时返回None"""
+        profile = self.stats.tract_profile(tract_id)
+        if profile is None:
+            return None
+        keys = ['census_tract_id', 'census_tract_label', 'total_crimes']
+        keys += ['by_type'] if series is None else [series]
+        return json.dumps({key: profile[key] for key in keys}).encode()
+
+    def locate_batch(self, body):
+        """POST /tracts: 直接对整批坐标做向量化查询"""
+        request = json.loads(body)
+        latitudes = np.asarray(request['latitudes'], dtype=np.float64)
+        longitudes = np.asarray(request['longitudes'], dtype=np.float64)
+        if latitudes.shape != longitudes.shape or latitudes.ndim != 1:
+            raise ValueError("latitudes and longitudes must be lists of equal length")
+        indices = self.locator.locate_indices(latitudes, longitudes)
+        found = indices >= 0
+        ids = np.where(found, self.locator.ct20[np.maximum(indices, 0)], None)
+        labels = np.where(found, self.locator.labels[np.maximum(indices, 0)], None)
+        return json.dumps({'census_tract_id': ids.tolist(), 'census_tract_label': labels.tolist()}).encode()
+
+    async def dispatch(self, method, target, body):
+        """路由一个请求, 返回(状态码, JSON内容)"""
+        url = urlsplit(target)
+        parts = [p for p in url.path.split('/') if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if parts == ['tract']:
+            if method != 'GET':
+                return 405, b'{"error": "use GET"}'
+            index = await self.locate(float(query['lat']), float(query['lon']))
+            if index < 0:
+                return 404, b'{"error": "point is not inside a census tract"}'
+            return 200, self._tract_body(index)
+
+        if parts == ['tracts']:
+            if method != 'POST':
+                return 405, b'{"error": "use POST"}'
+            return 200, self.locate_batch(body)
+
+        if len(parts) == 2 and parts[0] in ('stats', 'timeseries'):
+            if self.stats is None:
+                return 503, b'{"error": "crime statistics are not loaded"}'
+            series = None
+            if parts[0] == 'timeseries':
+                series = f"by_{query.get('by', 'month')}"
+                if series not in SERIES:
+                    return 400, b'{"error": "by must be month, hour or weekday"}'
+            content = self._stats_body(parts[1], series)
+            if content is None:
+                return 404, b'{"error": "unknown census tract"}'
+            return 200, content
+
+        if parts == ['health']:
+            return 200, json.dumps({
+                'tracts': len(self.locator.ct20),
+                'stats_loaded': self.stats is not None,
+                'batches': self.batches,
+                'mean_batch_size': self.batched_points / self.batches if self.batches else 0,
+                'tract_cache': self._tract_body.cache_info()._asdict(),
+                'stats_cache': self._stats_body.cache_info()._asdict(),
+            }).encode()
+
+        return 404, b'{"error": "unknown endpoint"}'
+
+    async def handle(self, reader, writer):
+        """处理一个连接上的HTTP/1.1请求 (支持keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, content = await self.dispatch(method, target, body)
+                except BAD_REQUEST_ERRORS as exc:
+                    status, content = 400, json.dumps({'error': f"bad request: {exc}"}).encode()
+                except Exception:
+                    # 其他错误返回500, 连接保持可用
+                    traceback.print_exc()
+                    status, content = 500, b'{"error": "internal server error"}'
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(service, host='127.0.0.1', port=8000):
+    """Run the HTTP server until cancelled"""
+    server = await asyncio.start_server(service.handle, host, port, backlog=1024)
+    print(f"服务已启动: http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main(host='127.0.0.1', port=8000, stats_path='crime_statistics.npz',
+         grid_path='LA_City_2020_Census_Tracts_grid.npy', batch_window=0.001):
+    """Load the lookup grid and statistics once, then serve requests"""
+    locator = load_tract_grid(grid_path)
+    stats = None
+    if os.path.exists(stats_path):
+        stats = CrimeStatistics.load(stats_path)
+    else:
+        print(f"未找到 {stats_path}, /stats 与 /timeseries 不可用")
+    service = TractService(locator, stats, batch_window=batch_window)
+    try:
+        asyncio.run(serve(service, host, port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API for census tract lookups and crime statistics")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--stats', default='crime_statistics.npz', help="statistics saved by CrimeCensusTract")
+    parser.add_argument('--grid', default='LA_City_2020_Census_Tracts_grid.npy', help="tract lookup grid")
+    parser.add_argument('--batch-window', type=float, default=0.001, help="seconds to collect single-point lookups")
+    args = parser.parse_args()
+    main(host=args.host, port=args.port, stats_path=args.stats, grid_path=args.grid, batch_window=args.batch_window)
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from CensusTractLoader import load_tracts
+
+# 洛杉矶市范围 (WGS84), 用于生成随机查询点
+LAT_RANGE = (33.70, 34.34)
+LON_RANGE = (-118.67, -118.15)
+
+def _build_requests(mode, count, batch_size, seed=0):
+    """预先生成全部请求, 计时只包含网络与服务端处理"""
+    rng = np.random.default_rng(seed)
+    if mode == 'tract':
+        lats = rng.uniform(*LAT_RANGE, count)
+        lons = rng.uniform(*LON_RANGE, count)
+        return [f"GET /tract?lat={lat:.6f}&lon={lon:.6f} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+                for lat, lon in zip(lats, lons)]
+    if mode == 'batch':
+        requests = []
+        for _ in range(count):
+            body = json.dumps({
+                'latitudes': rng.uniform(*LAT_RANGE, batch_size).round(6).tolist(),
+                'longitudes': rng.uniform(*LON_RANGE, batch_size).round(6).tolist(),
+            }).encode()
+            requests.append(f"POST /tracts HTTP/1.1\r\nHost: localhost\r\n"
+                            f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        return requests
+    tract_ids = np.asarray(load_tracts(crs=None)['CT20'], dtype=str)
+    # 少量热点tract占大部分请求, 模拟缓存命中的场景
+    picks = tract_ids[np.minimum(rng.zipf(1.3, count) - 1, len(tract_ids) - 1)]
+    path = 'stats' if mode == 'stats' else 'timeseries'
+    return [f"GET /{path}/{tract_id} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode() for tract_id in picks]
+
+async def _client(host, port, requests, latencies, statuses):
+    """一个keep-alive连接, 依次发送分到的请求"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for request in requests:
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            status = int(status_line.split()[1])
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+async def run_load_test(host='127.0.0.1', port=8000, mode='tract', requests=20000, concurrency=64, batch_size=100):
+    """
+    Drive a running TractService and report latency percentiles and throughput.
+
+    Parameters:
+    -----------
+    mode : str
+        'tract' (single points), 'batch' (POST of batch_size points), 'stats' or 'timeseries'
+    requests : int
+        Total number of requests
+    concurrency : int
+        Number of concurrent keep-alive connections
+
+    Returns:
+    --------
+    dict
+        requests, seconds, rps, p50_ms, p90_ms, p99_ms, max_ms and status counts
+    """
+    all_requests = _build_requests(mode, requests, batch_size)
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, all_requests[i::concurrency], latencies, statuses)
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(latencies_ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+        'statuses': statuses,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a local TractService instance")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--mode', choices=['tract', 'batch', 'stats', 'timeseries'], default='tract')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=100, help="points per request in batch mode")
+    args = parser.parse_args()
+    result = asyncio.run(run_load_test(args.host, args.port, args.mode, args.requests,
+                                       args.concurrency, args.batch_size))
+    print(f"{result['mode']}: {result['requests']} 个请求, 耗时 {result['seconds']}秒, {result['rps']} 请求/秒")
+    print(f"延迟 p50 {result['p50_ms']}ms, p90 {result['p90_ms']}ms, p99 {result['p99_ms']}ms, 最大 {result['max_ms']}ms")
+    print(f"状态码: {result['statuses']}")
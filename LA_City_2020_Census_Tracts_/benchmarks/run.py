@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from CoordinatetoCensusTract import get_census_tract
+from CrimeCensusTract import load_census_tracts, process_crime_data, generate_statistics, visualize_crime_data
+from CrimeCensusTractGraph import create_choropleth, create_crime_hotspots_map
+from DuckDBStatistics import duckdb
+from benchmarks.synthetic import synthetic_csv
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+# get_census_tract 是逐点接口, 每个规模最多计时这么多个点
+POINT_QUERIES = 2000
+
+def _best_of(function, repeat):
+    """运行repeat次, 返回最短耗时(秒)和最后一次的返回值"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def _git_commit():
+    """当前git提交号, 不在git仓库中时返回None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _environment():
+    """记录影响结果可比性的运行环境"""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+def run_benchmarks(sizes=DEFAULT_SIZES, data_dir='benchmark_data', workers=1, repeat=3, seed=0,
+                   shapefile_path='LA_City_2020_Census_Tracts_.shp', maps=True):
+    """
+    Time the pipeline entry points on synthetic data at several scales.
+
+    For every size a synthetic crime CSV is generated (or reused) and the
+    following are timed, keeping the best of `repeat` runs:
+    get_census_tract (per point, on at most POINT_QUERIES points),
+    process_crime_data, generate_statistics (also with backend="duckdb"
+    when duckdb is installed) and, with maps=True,
+    visualize_crime_data, create_choropleth and create_crime_hotspots_map.
+
+    Parameters:
+    -----------
+    sizes : list of int
+        Row counts of the synthetic CSVs
+    workers : int
+        Worker processes passed to process_crime_data
+
+    Returns:
+    --------
+    dict
+        {'environment': ..., 'config': ..., 'results': [{'benchmark', 'rows', 'seconds', 'throughput', 'unit'}]}
+    """
+    tracts_gdf = load_census_tracts(shapefile_path)
+    results = []
+
+    def record(benchmark, rows, seconds, throughput, unit):
+        results.append({'benchmark': benchmark, 'rows': rows, 'seconds': round(seconds, 6),
+                        'throughput': round(throughput, 3), 'unit': unit})
+        print(f"[{benchmark} @ {rows}] {seconds:.3f}秒, {throughput:,.1f} {unit}")
+
+    for rows in sizes:
+        crime_csv = synthetic_csv(rows, data_dir, seed=seed, shapefile_path=shapefile_path)
+        geocoded_csv = os.path.join(data_dir, f"bench_geocoded_{rows}.csv")
+        stats_csv = os.path.join(data_dir, f"bench_stats_{rows}.csv")
+
+        points = pd.read_csv(crime_csv, usecols=['LAT', 'LON'], nrows=min(rows, POINT_QUERIES))
+        # 预热: 第一次调用会建立共享的TractLocator
+        get_census_tract(points['LAT'].iloc[0], points['LON'].iloc[0], shapefile_path)
+        seconds, _ = _best_of(lambda: [get_census_tract(lat, lon, shapefile_path)
+                                       for lat, lon in zip(points['LAT'], points['LON'])], repeat)
+        record('get_census_tract', rows, seconds, len(points) / seconds, 'points/s')
+
+        seconds, _ = _best_of(lambda: process_crime_data(crime_csv, tracts_gdf, output_csv=geocoded_csv,
+                                                         workers=workers), repeat)
+        record('process_crime_data', rows, seconds, rows / seconds, 'rows/s')
+
+        seconds, stats_df = _best_of(lambda: generate_statistics(geocoded_csv, stats_csv,
+                                                                 shapefile_path=shapefile_path), repeat)
+        record('generate_statistics', rows, seconds, rows / seconds, 'rows/s')
+
+        if duckdb is not None:
+            seconds, _ = _best_of(lambda: generate_statistics(geocoded_csv, stats_csv, shapefile_path=shapefile_path,
+                                                              backend="duckdb"), repeat)
+            record('generate_statistics_duckdb', rows, seconds, rows / seconds, 'rows/s')
+
+        if maps:
+            # 地图的耗时只取决于tract数量, 吞吐量记为每秒生成的地图数
+            for name, function in [('visualize_crime_data', lambda path: visualize_crime_data(stats_df, tracts_gdf, path)),
+                                   ('create_choropleth', lambda path: create_choropleth(tracts_gdf, stats_df, path)),
+                                   ('create_crime_hotspots_map', lambda path: create_crime_hotspots_map(tracts_gdf, stats_df, path))]:
+                path = os.path.join(data_dir, f"bench_{name}_{rows}.png")
+                seconds, _ = _best_of(lambda: function(path), repeat)
+                record(name, rows, seconds, 1 / seconds, 'maps/s')
+
+    return {
+        'environment': _environment(),
+        'config': {'sizes': list(sizes), 'workers': workers, 'repeat': repeat, 'seed': seed},
+        'results': results,
+    }
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compare throughput against a baseline run.
+
+    A benchmark regresses when its throughput drops below
+    (1 - threshold) times the baseline throughput at the same size.
+    Benchmarks missing from either run are skipped.
+
+    Returns:
+    --------
+    list of dict
+        One entry per compared benchmark with baseline, current, change and regressed
+    """
+    previous = {(r['benchmark'], r['rows']): r['throughput'] for r in baseline['results']}
+    comparison = []
+    for result in results['results']:
+        key = (result['benchmark'], result['rows'])
+        if key not in previous or previous[key] <= 0:
+            continue
+        change = result['throughput'] / previous[key] - 1
+        comparison.append({
+            'benchmark': result['benchmark'],
+            'rows': result['rows'],
+            'baseline': previous[key],
+            'current': result['throughput'],
+            'change': round(change, 4),
+            'regressed': change < -threshold,
+        })
+    return comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the crime pipeline on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="synthetic CSV row counts")
+    parser.add_argument('--data-dir', default='benchmark_data', help="synthetic CSVs and benchmark outputs")
+    parser.add_argument('--workers', type=int, default=1, help="processes used by process_crime_data")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, the fastest is kept")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-maps', action='store_true', help="skip the map benchmarks")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None, help="earlier results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="fail when throughput drops by more than this fraction of the baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.data_dir, workers=args.workers, repeat=args.repeat,
+                             seed=args.seed, maps=not args.no_maps)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        results['baseline'] = {'path': args.baseline, 'threshold': args.threshold,
+                               'comparison': compare(results, baseline, args.threshold)}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"基准测试结果已保存至 {args.output}")
+
+    if args.baseline:
+        regressions = [c for c in results['baseline']['comparison'] if c['regressed']]
+        for c in results['baseline']['comparison']:
+            flag = "退化" if c['regressed'] else "正常"
+            print(f"{flag} {c['benchmark']} @ {c['rows']}: {c['baseline']:,.1f} -> {c['current']:,.1f} ({c['change']:+.1%})")
+        if regressions:
+            print(f"{len(regressions)} 项吞吐量下降超过 {args.threshold:.0%}")
+            sys.exit(1)
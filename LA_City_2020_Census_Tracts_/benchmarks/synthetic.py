@@ -0,0 +1,257 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from CoordinatetoCensusTract import TractLocator
+from CensusTractLoader import load_tracts
+from CrimeStatistics import SOURCE_DATE_FORMAT
+
+# 与Crime_Data_from_2020_to_Present.csv相同的列顺序
+SOURCE_COLUMNS = ['DR_NO', 'Date Rptd', 'DATE OCC', 'TIME OCC', 'AREA', 'AREA NAME', 'Rpt Dist No', 'Part 1-2',
+                  'Crm Cd', 'Crm Cd Desc', 'Mocodes', 'Vict Age', 'Vict Sex', 'Vict Descent', 'Premis Cd',
+                  'Premis Desc', 'Weapon Used Cd', 'Weapon Desc', 'Status', 'Status Desc', 'Crm Cd 1', 'Crm Cd 2',
+                  'Crm Cd 3', 'Crm Cd 4', 'LOCATION', 'Cross Street', 'LAT', 'LON']
+
+# (Crm Cd, Crm Cd Desc, Part 1-2), 按真实数据中的频率从高到低排列
+CRIME_TYPES = [
+    (510, 'VEHICLE - STOLEN', 1),
+    (624, 'BATTERY - SIMPLE ASSAULT', 2),
+    (330, 'BURGLARY FROM VEHICLE', 1),
+    (354, 'THEFT OF IDENTITY', 2),
+    (740, 'VANDALISM - FELONY ($400 & OVER, ALL CHURCH VANDALISMS)', 1),
+    (310, 'BURGLARY', 1),
+    (230, 'ASSAULT WITH DEADLY WEAPON, AGGRAVATED ASSAULT', 1),
+    (440, 'THEFT PLAIN - PETTY ($950 & UNDER)', 1),
+    (626, 'INTIMATE PARTNER - SIMPLE ASSAULT', 2),
+    (420, 'THEFT FROM MOTOR VEHICLE - PETTY ($950 & UNDER)', 1),
+    (341, 'THEFT-GRAND ($950.01 & OVER)EXCPT,GUNS,FOWL,LIVESTK,PROD', 1),
+    (210, 'ROBBERY', 1),
+    (442, 'SHOPLIFTING - PETTY THEFT ($950 & UNDER)', 1),
+    (930, 'CRIMINAL THREATS - NO WEAPON DISPLAYED', 2),
+    (900, 'VIOLATION OF COURT ORDER', 2),
+]
+
+AREA_NAMES = ['Central', 'Rampart', 'Southwest', 'Hollenbeck', 'Harbor', 'Hollywood', 'Wilshire', 'West LA',
+              'Van Nuys', 'West Valley', 'Northeast', '77th Street', 'Newton', 'Pacific', 'N Hollywood',
+              'Foothill', 'Devonshire', 'Southeast', 'Mission', 'Olympic', 'Topanga']
+
+PREMISES = [(101, 'STREET'), (501, 'SINGLE FAMILY DWELLING'), (502, 'MULTI-UNIT DWELLING (APARTMENT, DUPLEX, ETC)'),
+            (108, 'PARKING LOT'), (203, 'OTHER BUSINESS'), (122, 'VEHICLE, PASSENGER/TRUCK')]
+
+WEAPONS = [(400, 'STRONG-ARM (HANDS, FIST, FEET OR BODILY FORCE)'), (500, 'UNKNOWN WEAPON/OTHER WEAPON'),
+           (511, 'VERBAL THREAT'), (102, 'HAND GUN')]
+
+STATUSES = [('IC', 'Invest Cont'), ('AO', 'Adult Other'), ('AA', 'Adult Arrest'), ('JA', 'Juv Arrest')]
+
+STREETS = ['MAIN ST', 'BROADWAY', 'FIGUEROA ST', 'VERMONT AV', 'WESTERN AV', 'SUNSET BL', 'WILSHIRE BL',
+           'VAN NUYS BL', 'SEPULVEDA BL', 'PICO BL']
+
+# 发生日期范围 (与源数据集一致, 从2020-01-01开始)
+FIRST_DAY = np.datetime64('2020-01-01')
+N_DAYS = 5 * 365
+
+def _zipf_weights(n, s=1.0):
+    """前面的类别更常见的概率分布"""
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+def _day_strings(n_days):
+    """每一天对应的源数据日期字符串, 生成时按下标取值而不逐行格式化"""
+    days = pd.date_range(pd.Timestamp(FIRST_DAY), periods=n_days, freq='D')
+    return np.asarray(days.strftime(SOURCE_DATE_FORMAT), dtype=object)
+
+def _hour_weights():
+    """发生时间的小时分布: 凌晨少, 中午和傍晚多"""
+    weights = np.array([4, 3, 2, 2, 1, 1, 2, 3, 4, 4, 4, 4, 6, 4, 4, 5, 5, 5, 6, 5, 5, 5, 5, 4], dtype=np.float64)
+    return weights / weights.sum()
+
+class SyntheticCrimeGenerator:
+    """
+    Synthetic crime records in the layout of Crime_Data_from_2020_to_Present.csv.
+
+    Column types and value formats follow the source CSV (9-digit DR_NO,
+    '%m/%d/%Y %I:%M:%S %p' dates, HHMM TIME OCC, LAPD area codes, optional
+    weapon and secondary crime codes). Coordinates are rounded to 4 decimals
+    like the source and come in three kinds: points inside a census tract,
+    points inside the padded tract bounding box but outside every tract, and
+    (0, 0) placeholders for records without a location. Inside/outside is
+    decided with TractLocator, so the expected hit rate is exact.
+
+    Every chunk uses its own seed derived from (seed, chunk index), so the
+    output only depends on seed, rows and chunk_size.
+
+    Parameters:
+    -----------
+    tracts : geopandas.GeoDataFrame
+        Census tract polygons
+    seed : int
+        Random seed
+    outside_share : float
+        Share of records placed outside every tract
+    missing_share : float
+        Share of records with LAT = LON = 0
+    """
+
+    def __init__(self, tracts, seed=0, outside_share=0.04, missing_share=0.01):
+        self.locator = TractLocator(tracts)
+        self.seed = seed
+        self.outside_share = outside_share
+        self.missing_share = missing_share
+        minx, miny, maxx, maxy = tracts.to_crs("EPSG:4326").total_bounds
+        pad = 0.05
+        self.bounds = (minx - pad, miny - pad, maxx + pad, maxy + pad)
+        self.day_strings = _day_strings(N_DAYS + 31)
+        self.type_weights = _zipf_weights(len(CRIME_TYPES), 0.8)
+        self.area_weights = _zipf_weights(len(AREA_NAMES), 0.3)
+
+    @classmethod
+    def from_shapefile(cls, shapefile_path='LA_City_2020_Census_Tracts_.shp', **kwargs):
+        """Build a generator from the tract shapefile"""
+        return cls(load_tracts(shapefile_path, crs=None), **kwargs)
+
+    def _points(self, rng, n_inside, n_outside):
+        """拒绝采样: 在外包矩形内均匀撒点, 按是否落入tract分为内/外两组"""
+        minx, miny, maxx, maxy = self.bounds
+        inside_lat, inside_lon, outside_lat, outside_lon = [], [], [], []
+        have_inside = have_outside = 0
+        while have_inside < n_inside or have_outside < n_outside:
+            count = max(n_inside + n_outside, 1024)
+            lat = np.round(rng.uniform(miny, maxy, count), 4)
+            lon = np.round(rng.uniform(minx, maxx, count), 4)
+            hit = self.locator.locate_indices(lat, lon) >= 0
+            inside_lat.append(lat[hit])
+            inside_lon.append(lon[hit])
+            outside_lat.append(lat[~hit])
+            outside_lon.append(lon[~hit])
+            have_inside += int(hit.sum())
+            have_outside += int((~hit).sum())
+        return (np.concatenate(inside_lat)[:n_inside], np.concatenate(inside_lon)[:n_inside],
+                np.concatenate(outside_lat)[:n_outside], np.concatenate(outside_lon)[:n_outside])
+
+    def chunk(self, index, start, rows):
+        """
+        Generate one chunk of records.
+
+        Parameters:
+        -----------
+        index : int
+            Chunk number, part of the chunk's seed
+        start : int
+            Global row number of the first record (keeps DR_NO unique)
+        rows : int
+            Number of records
+
+        Returns:
+        --------
+        pandas.DataFrame
+            Records with SOURCE_COLUMNS
+        """
+        rng = np.random.default_rng([self.seed, index])
+
+        kind = rng.choice(3, rows, p=[1 - self.outside_share - self.missing_share,
+                                      self.outside_share, self.missing_share])
+        lat = np.zeros(rows)
+        lon = np.zeros(rows)
+        in_lat, in_lon, out_lat, out_lon = self._points(rng, int((kind == 0).sum()), int((kind == 1).sum()))
+        lat[kind == 0], lon[kind == 0] = in_lat, in_lon
+        lat[kind == 1], lon[kind == 1] = out_lat, out_lon
+
+        occ_day = rng.integers(0, N_DAYS, rows)
+        rpt_day = occ_day + np.minimum(rng.geometric(0.3, rows) - 1, 30)
+        hour = rng.choice(24, rows, p=_hour_weights())
+        time_occ = hour * 100 + rng.integers(0, 60, rows)
+
+        crime = rng.choice(len(CRIME_TYPES), rows, p=self.type_weights)
+        codes = np.array([c[0] for c in CRIME_TYPES])[crime]
+        area = rng.choice(len(AREA_NAMES), rows, p=self.area_weights)
+        premis = rng.integers(0, len(PREMISES), rows)
+        armed = rng.random(rows) < 0.3
+        weapon = rng.integers(0, len(WEAPONS), rows)
+        status = rng.choice(len(STATUSES), rows, p=[0.78, 0.12, 0.09, 0.01])
+        secondary = rng.random(rows) < 0.07
+
+        return pd.DataFrame({
+            'DR_NO': 200000000 + start + np.arange(rows, dtype=np.int64),
+            'Date Rptd': self.day_strings[rpt_day],
+            'DATE OCC': self.day_strings[occ_day],
+            'TIME OCC': time_occ,
+            'AREA': area + 1,
+            'AREA NAME': np.array(AREA_NAMES, dtype=object)[area],
+            'Rpt Dist No': (area + 1) * 100 + rng.integers(0, 100, rows),
+            'Part 1-2': np.array([c[2] for c in CRIME_TYPES])[crime],
+            'Crm Cd': codes,
+            'Crm Cd Desc': np.array([c[1] for c in CRIME_TYPES], dtype=object)[crime],
+            'Mocodes': np.where(rng.random(rows) < 0.85, '0344 1822', None),
+            'Vict Age': np.where(rng.random(rows) < 0.2, 0, rng.integers(16, 90, rows)),
+            'Vict Sex': rng.choice(np.array(['M', 'F', 'X', None], dtype=object), rows, p=[0.4, 0.38, 0.1, 0.12]),
+            'Vict Descent': rng.choice(np.array(['H', 'W', 'B', 'O', 'X', 'A'], dtype=object), rows),
+            'Premis Cd': np.array([p[0] for p in PREMISES], dtype=np.float64)[premis],
+            'Premis Desc': np.array([p[1] for p in PREMISES], dtype=object)[premis],
+            'Weapon Used Cd': np.where(armed, np.array([w[0] for w in WEAPONS])[weapon], np.nan),
+            'Weapon Desc': np.where(armed, np.array([w[1] for w in WEAPONS], dtype=object)[weapon], None),
+            'Status': np.array([s[0] for s in STATUSES], dtype=object)[status],
+            'Status Desc': np.array([s[1] for s in STATUSES], dtype=object)[status],
+            'Crm Cd 1': codes.astype(np.float64),
+            'Crm Cd 2': np.where(secondary, 998.0, np.nan),
+            'Crm Cd 3': np.nan,
+            'Crm Cd 4': np.nan,
+            'LOCATION': [f"{n}00 {s}" for n, s in zip(rng.integers(1, 200, rows), rng.choice(STREETS, rows))],
+            'Cross Street': None,
+            'LAT': lat,
+            'LON': lon,
+        }, columns=SOURCE_COLUMNS)
+
+    def write(self, path, rows, chunk_size=500000):
+        """
+        Write `rows` records to a CSV, chunk by chunk (memory is bounded by chunk_size).
+
+        Returns:
+        --------
+        str
+            path
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f, tqdm(total=rows, desc="生成合成数据") as pbar:
+            for index, start in enumerate(range(0, rows, chunk_size)):
+                chunk = self.chunk(index, start, min(chunk_size, rows - start))
+                chunk.to_csv(f, header=index == 0, index=False)
+                pbar.update(len(chunk))
+        os.replace(tmp_path, path)
+        return path
+
+def synthetic_csv(rows, output_dir='benchmark_data', seed=0, shapefile_path='LA_City_2020_Census_Tracts_.shp',
+                  chunk_size=500000):
+    """
+    Path of a synthetic crime CSV with `rows` records, generated on first use.
+
+    Files are named by row count and seed, so repeated benchmark runs reuse them.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"synthetic_crime_{rows}_seed{seed}.csv")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        SyntheticCrimeGenerator.from_shapefile(shapefile_path, seed=seed).write(path, rows, chunk_size)
+        print(f"合成数据已保存至 {path} ({rows} 行, 耗时 {time.perf_counter() - start:.2f}秒)")
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic crime CSV in the source data layout")
+    parser.add_argument('rows', type=int, help="number of records (e.g. 10000 to 50000000)")
+    parser.add_argument('--output', default=None, help="output CSV (default: benchmark_data/synthetic_crime_<rows>_seed<seed>.csv)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--outside-share', type=float, default=0.04, help="share of points outside every tract")
+    parser.add_argument('--missing-share', type=float, default=0.01, help="share of records with LAT = LON = 0")
+    parser.add_argument('--chunk-size', type=int, default=500000)
+    parser.add_argument('--shapefile', default='LA_City_2020_Census_Tracts_.shp')
+    args = parser.parse_args()
+    if args.output is None:
+        print(synthetic_csv(args.rows, seed=args.seed, shapefile_path=args.shapefile, chunk_size=args.chunk_size))
+    else:
+        generator = SyntheticCrimeGenerator.from_shapefile(args.shapefile, seed=args.seed,
+                                                           outside_share=args.outside_share,
+                                                           missing_share=args.missing_share)
+        print(generator.write(args.output, args.rows, args.chunk_size))
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# 脚本按目录平铺, 不是安装包; 测试直接从上一级目录导入
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+SHAPEFILE = os.path.join(PACKAGE_DIR, 'LA_City_2020_Census_Tracts_.shp')
+
+SOURCE_HEADER = ['DR_NO', 'Date Rptd', 'DATE OCC', 'TIME OCC', 'AREA', 'AREA NAME', 'Rpt Dist No', 'Part 1-2',
+                 'Crm Cd', 'Crm Cd Desc', 'Mocodes', 'Vict Age', 'Vict Sex', 'Vict Descent', 'Premis Cd',
+                 'Premis Desc', 'Weapon Used Cd', 'Weapon Desc', 'Status', 'Status Desc', 'Crm Cd 1', 'Crm Cd 2',
+                 'Crm Cd 3', 'Crm Cd 4', 'LOCATION', 'Cross Street', 'LAT', 'LON']
+
+def source_row(dr_no, date_occ='03/01/2020 12:00:00 AM', time_occ='1200', lat='34.0522', lon='-118.2437',
+               crime_type='BURGLARY'):
+    """一行源数据CSV文本, 其余列取固定值"""
+    values = dict.fromkeys(SOURCE_HEADER, '')
+    values.update({
+        'DR_NO': str(dr_no), 'Date Rptd': '03/02/2020 12:00:00 AM', 'DATE OCC': date_occ, 'TIME OCC': time_occ,
+        'AREA': '1', 'AREA NAME': 'Central', 'Rpt Dist No': '111', 'Part 1-2': '1', 'Crm Cd': '310',
+        'Crm Cd Desc': crime_type, 'Premis Cd': '101.0', 'LAT': lat, 'LON': lon,
+    })
+    return ','.join(values[c] for c in SOURCE_HEADER)
+
+@pytest.fixture
+def write_source(tmp_path):
+    """把若干行写成源数据CSV, 返回路径"""
+    def write(rows, name='crime.csv'):
+        path = tmp_path / name
+        path.write_text('\n'.join([','.join(SOURCE_HEADER)] + rows) + '\n')
+        return str(path)
+    return write
+
+@pytest.fixture(scope='session')
+def tracts():
+    from CrimeCensusTract import load_census_tracts
+    return load_census_tracts(SHAPEFILE)
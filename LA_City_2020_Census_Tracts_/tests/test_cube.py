@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CrimeCube import CrimeCube, CrimeCubeBuilder, OTHER_TYPE
+
+TRACT_IDS = ['101100', '101200', '101300', '101400']
+
+@pytest.fixture(scope='module')
+def records():
+    rng = np.random.default_rng(1)
+    n = 800
+    dates = pd.Timestamp('2021-03-01') + pd.to_timedelta(rng.integers(0, 120, n), unit='D')
+    frame = pd.DataFrame({
+        'census_tract_id': rng.choice(TRACT_IDS + ['999999'], n),
+        'crime_type': rng.choice(['BURGLARY', 'ROBBERY', 'THEFT', 'VANDALISM', None], n, p=[.4, .3, .1, .1, .1]),
+        'date': dates.strftime('%Y-%m-%d').to_numpy(dtype=object),
+    })
+    frame.loc[::37, 'date'] = ''
+    return frame
+
+@pytest.fixture(scope='module')
+def builder(records):
+    builder = CrimeCubeBuilder(TRACT_IDS)
+    builder.add_frame(records[:300])
+    partial = CrimeCubeBuilder(TRACT_IDS)
+    partial.add_frame(records[300:])
+    builder.merge(partial)
+    return builder
+
+def _known(records, cube):
+    """按立方体的类型槽位整理的记录 (不在前几名的类型和未知类型归入OTHER)"""
+    frame = records[records['census_tract_id'].isin(TRACT_IDS)].copy()
+    frame['date'] = pd.to_datetime(frame['date'], format='%Y-%m-%d', errors='coerce')
+    frame = frame[frame['date'].notna()]
+    frame['crime_type'] = frame['crime_type'].where(frame['crime_type'].isin(cube.crime_types[:-1]), OTHER_TYPE)
+    return frame
+
+def test_builder_counts_undated_records(records, builder):
+    undated = records['census_tract_id'].isin(TRACT_IDS) & (records['date'] == '')
+    assert builder.undated == int(undated.sum())
+    assert int(builder.counts.sum()) == int(records['census_tract_id'].isin(TRACT_IDS).sum()) - builder.undated
+
+@pytest.mark.parametrize('bin_days', [1, 7])
+def test_queries_match_brute_force(records, builder, tmp_path, bin_days):
+    cube = builder.build(str(tmp_path / 'cube.npy'), max_types=2, bin_days=bin_days)
+    assert cube.crime_types == ['BURGLARY', 'ROBBERY', OTHER_TYPE]
+    assert isinstance(CrimeCube.load(str(tmp_path / 'cube.npy')).cube, np.memmap)
+    frame = _known(records, cube)
+    # 窗口边界按时间段向下取整
+    day = (frame['date'] - pd.Timestamp(cube.start_date)).dt.days.to_numpy()
+    frame['bin'] = day // bin_days
+
+    def bin_of(date):
+        return (pd.Timestamp(date) - pd.Timestamp(cube.start_date)).days // bin_days
+
+    assert cube.count() == len(frame)
+    rng = np.random.default_rng(2)
+    for _ in range(20):
+        start, end = sorted(pd.Timestamp('2021-03-01') + pd.to_timedelta(rng.integers(0, 120, 2), unit='D'))
+        tracts = list(rng.choice(TRACT_IDS, 2, replace=False))
+        types = list(rng.choice(cube.crime_types, 2, replace=False))
+        window = frame[(frame['bin'] >= bin_of(start)) & (frame['bin'] < bin_of(end))]
+        selected = window[window['census_tract_id'].isin(tracts) & window['crime_type'].isin(types)]
+        assert cube.count(start, end, tracts, types) == len(selected)
+        by_tract = window.groupby('census_tract_id').size().reindex(TRACT_IDS, fill_value=0)
+        np.testing.assert_array_equal(cube.by_tract(start, end).to_numpy(), by_tract.to_numpy())
+        by_type = window.groupby('crime_type').size().reindex(cube.crime_types, fill_value=0)
+        np.testing.assert_array_equal(cube.by_type(start, end).to_numpy(), by_type.to_numpy())
+
+    series = cube.series(tracts='101200', types='BURGLARY', step=2)
+    selected = frame[(frame['census_tract_id'] == '101200') & (frame['crime_type'] == 'BURGLARY')]
+    expected = selected.groupby(selected['bin'] // 2).size()
+    expected = expected.reindex(np.arange(len(series)), fill_value=0)
+    np.testing.assert_array_equal(series.to_numpy(), expected.to_numpy())
+    assert series.index[1] - series.index[0] == pd.Timedelta(days=2 * bin_days)
+
+def test_unknown_names_raise(builder, tmp_path):
+    cube = builder.build(str(tmp_path / 'cube.npy'))
+    with pytest.raises(KeyError):
+        cube.count(tracts='999999')
+    with pytest.raises(KeyError):
+        cube.count(types='ARSON')
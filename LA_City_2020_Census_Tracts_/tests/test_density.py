@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CrimeDensity import DensityGrid, density_surfaces, gaussian_smooth, point_histograms
+
+@pytest.fixture(scope='module')
+def grid():
+    # 洛杉矶市中心附近 6km x 8km, 100米单元
+    x, y = DensityGrid((0, 0), 1, (1, 1)).transformer.transform(-118.30, 34.00)
+    return DensityGrid((x, y), 100.0, (60, 80))
+
+def test_gaussian_smooth_preserves_point_count():
+    histogram = np.zeros((50, 60), dtype=np.uint32)
+    histogram[20, 30] = 7
+    histogram[25:28, 22:25] = 3
+    smoothed = gaussian_smooth(histogram, sigma_cells=2.5)
+    assert smoothed.shape == histogram.shape and (smoothed >= 0).all()
+    assert smoothed.sum() == pytest.approx(histogram.sum(), rel=1e-9)
+    # 对称核: 单个点的密度面以该点为中心对称
+    single = gaussian_smooth(np.where(np.arange(3000).reshape(50, 60) == 20 * 60 + 30, 7, 0), sigma_cells=2.5)
+    assert single[20, 30] == single.max()
+    np.testing.assert_allclose(single[10:20, 30], single[21:31, 30][::-1], atol=1e-9)
+    np.testing.assert_allclose(single[20, 20:30], single[20, 31:41][::-1], atol=1e-9)
+
+    # 靠近边界的点有一部分质量落到网格外, 不会绕回到对边
+    corner = np.zeros((50, 60))
+    corner[0, 0] = 10
+    smoothed = gaussian_smooth(corner, sigma_cells=2.5)
+    assert 2.5 < smoothed.sum() < 4.0
+    assert smoothed[-10:, :].max() < 1e-9 and smoothed[:, -10:].max() < 1e-9
+
+def test_surfaces_keep_counts_per_square_km(grid):
+    rng = np.random.default_rng(5)
+    histograms = {name: np.zeros(grid.shape, dtype=np.uint32) for name in ('all', 'BURGLARY')}
+    for histogram in histograms.values():
+        np.add.at(histogram, (rng.integers(15, 45, 200), rng.integers(15, 65, 200)), 1)
+    surfaces = density_surfaces(histograms, grid, bandwidth=300.0)
+    cell_km2 = (grid.cell_size / 1000) ** 2
+    for name, surface in surfaces.items():
+        assert surface.dtype == np.float32
+        assert surface.sum(dtype=np.float64) * cell_km2 == pytest.approx(200, rel=1e-5)
+    parallel = density_surfaces(histograms, grid, bandwidth=300.0, workers=2)
+    for name in surfaces:
+        np.testing.assert_array_equal(parallel[name], surfaces[name])
+
+def test_point_histograms_by_group(grid, tmp_path):
+    rng = np.random.default_rng(6)
+    n = 500
+    records = pd.DataFrame({
+        'latitude': rng.uniform(33.99, 34.07, n),
+        'longitude': rng.uniform(-118.31, -118.20, n),
+        'crime_type': rng.choice(['BURGLARY', 'ROBBERY', 'THEFT'], n),
+        'date': rng.choice(['2021-05-01', '2022-07-04', ''], n),
+    })
+    records.loc[::50, 'latitude'] = np.nan
+    path = str(tmp_path / 'geocoded.csv')
+    records.to_csv(path, index=False)
+    cells = grid.cell_indices(records['latitude'], records['longitude'])
+    inside = cells >= 0
+    assert 0 < inside.sum() < n
+
+    by_type = point_histograms(path, grid, by='type', chunk_size=120)
+    assert list(by_type) == ['all', 'BURGLARY', 'ROBBERY', 'THEFT']
+    np.testing.assert_array_equal(by_type['all'].ravel(), np.bincount(cells[inside], minlength=grid.cells))
+    for name in ('BURGLARY', 'ROBBERY', 'THEFT'):
+        selected = cells[inside & (records['crime_type'] == name).to_numpy()]
+        assert by_type[name].dtype == np.uint32
+        np.testing.assert_array_equal(by_type[name].ravel(), np.bincount(selected, minlength=grid.cells))
+
+    # 日期缺失的点只计入'all'
+    by_year = point_histograms(path, grid, by='year', chunk_size=120)
+    assert list(by_year) == ['all', '2021', '2022']
+    dated = inside & (records['date'] != '').to_numpy()
+    assert by_year['2021'].sum() + by_year['2022'].sum() == dated.sum()
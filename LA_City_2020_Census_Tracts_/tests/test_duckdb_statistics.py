@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CrimeCensusTract import generate_statistics, ingest_incremental, iter_crime_tracts, process_crime_data
+from CrimeStatistics import CrimeStatistics
+from DuckDBStatistics import grouped_counts
+from conftest import SHAPEFILE, source_row
+
+pytest.importorskip('duckdb')
+
+@pytest.fixture(scope='module')
+def source_rows(tracts):
+    rng = np.random.default_rng(3)
+    points = tracts.geometry.iloc[rng.choice(len(tracts), 8, replace=False)].representative_point()
+    rows = []
+    for i in range(300):
+        point = points.iloc[i % len(points)]
+        rows.append(source_row(
+            i + 1,
+            date_occ=f"{rng.integers(1, 13):02d}/{rng.integers(1, 29):02d}/{rng.integers(2020, 2024)} 12:00:00 AM",
+            time_occ='' if i % 29 == 0 else str(rng.integers(0, 24) * 100 + rng.integers(0, 60)),
+            lat=f"{point.y:.6f}", lon=f"{point.x:.6f}",
+            crime_type=['BURGLARY', 'ROBBERY', 'VANDALISM - FELONY', 'THEFT'][i % 4]))
+    return rows
+
+def _both_backends(path, tmp_path, tracts):
+    # 完整的组合键(含年月、星期和小时)一致, 而不只是统计表
+    engines = [CrimeStatistics(tracts['CT20'], tracts['LABEL']) for _ in range(2)]
+    for chunk in iter_crime_tracts(path, columns=['census_tract_id', 'crime_type', 'date', 'time_occ']):
+        engines[0].add_frame(chunk)
+    engines[1].add_groups(grouped_counts(path))
+    np.testing.assert_array_equal(engines[1].keys, engines[0].keys)
+    np.testing.assert_array_equal(engines[1].counts, engines[0].counts)
+
+    numpy_df = generate_statistics(path, str(tmp_path / 'numpy.csv'), top_k=None, shapefile_path=SHAPEFILE)
+    duckdb_df = generate_statistics(path, str(tmp_path / 'duckdb.csv'), top_k=None, shapefile_path=SHAPEFILE,
+                                    backend='duckdb', memory_limit='256MB', temp_directory=str(tmp_path / 'spill'))
+    assert numpy_df['total_crimes'].sum() > 0
+    pd.testing.assert_frame_equal(duckdb_df, numpy_df)
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_backends_match_on_geocoded_output(tracts, write_source, tmp_path, source_rows, output_format):
+    output = str(tmp_path / 'out.csv')
+    process_crime_data(write_source(source_rows), tracts, output, chunk_size=100, output_format=output_format)
+    _both_backends(output.replace('.csv', '.parquet') if output_format == 'parquet' else output, tmp_path, tracts)
+
+def test_backends_match_on_incremental_parquet_directory(tracts, write_source, tmp_path, source_rows):
+    output = str(tmp_path / 'out.parquet')
+    kwargs = dict(output_stats_csv=str(tmp_path / 'stats.csv'), state_path=str(tmp_path / 'state.json'),
+                  stats_path=str(tmp_path / 'stats.npz'), output_format='parquet', cube_counts_path=None)
+    ingest_incremental(write_source(source_rows[:200]), tracts, output, **kwargs)
+    ingest_incremental(write_source(source_rows), tracts, output, **kwargs)
+    _both_backends(output, tmp_path, tracts)
+
+def test_backends_match_without_time_columns(tracts, write_source, tmp_path, source_rows):
+    output = str(tmp_path / 'out.csv')
+    process_crime_data(write_source(source_rows), tracts, output, chunk_size=100)
+    older = str(tmp_path / 'older.csv')
+    pd.read_csv(output, dtype=str).drop(columns=['date', 'time_occ']).to_csv(older, index=False)
+    _both_backends(older, tmp_path, tracts)
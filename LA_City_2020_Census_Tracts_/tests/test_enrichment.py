@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from CensusEnrichment import ENRICHMENT_COLUMNS, TractEnrichment, normalize_tract_ids
+
+TRACT_IDS = ['101110', '101200', '101300', '101400']
+
+def test_normalize_tract_ids():
+    keys = ['101110', 101110, '1011.10', '1011.1', '1012', '06037101110', 6037101110, '101110.0', 'x', None]
+    assert normalize_tract_ids(keys).tolist() == ['101110'] * 4 + ['101200'] + ['101110'] * 3 + ['', '']
+    assert normalize_tract_ids(['6037101110.0']).tolist() == ['101110']
+
+def test_enrich_aligns_on_tract_ids_with_missing_tracts():
+    enrichment = TractEnrichment(TRACT_IDS)
+    # 101110分为两行 (不同的编号写法), 101300没有人口数据, 999999不在当前tract中
+    population = pd.DataFrame({
+        'CT20': ['1011.10', '06037101110', '101200', '999999'],
+        'POP23_TOTAL': [1000, 3000, 2000, 500],
+        'POV23_TOTAL': [100, 500, 1000, 50],
+        'AREA_SQMil': [0.5, 1.5, 0.0, 1.0],
+    })
+    assert enrichment.add_population(population) == 2
+    education = pd.DataFrame({'tract': ['1012', '101300', '101300'], 'bachelors': [40.0, 20.0, 30.0]})
+    assert enrichment.add_education(education) == 2
+
+    # 统计表的顺序和索引与tract索引无关, 包含未知tract
+    stats = pd.DataFrame({
+        'census_tract_id': ['101300', '555555', '101110', '101200', '101400'],
+        'total_crimes': [10, 5, 40, 20, 0],
+    }, index=[7, 3, 9, 1, 4])
+    enriched = enrichment.enrich(stats)
+
+    assert enriched.columns.tolist() == stats.columns.tolist() + ENRICHMENT_COLUMNS
+    pd.testing.assert_frame_equal(enriched[stats.columns], stats)
+    np.testing.assert_array_equal(enriched['population'], [np.nan, np.nan, 4000, 2000, np.nan])
+    np.testing.assert_array_equal(enriched['area_sq_miles'], [np.nan, np.nan, 2.0, 0.0, np.nan])
+    np.testing.assert_array_equal(enriched['population_density'], [np.nan, np.nan, 2000, np.nan, np.nan])
+    np.testing.assert_array_equal(enriched['poverty_percent'], [np.nan, np.nan, 15.0, 50.0, np.nan])
+    np.testing.assert_array_equal(enriched['bachelors_percent'], [25.0, np.nan, np.nan, 40.0, np.nan])
+    np.testing.assert_array_equal(enriched['rate_per_1000'], [np.nan, np.nan, 10.0, 10.0, np.nan])
+    np.testing.assert_array_equal(enriched['crimes_per_sq_mile'], [np.nan, np.nan, 20.0, np.nan, np.nan])
+    # 全市贫困率 = 1600 / 6000, 只计入表中有人口数据的tract
+    citywide = 1600 / 6000
+    np.testing.assert_allclose(enriched['poverty_adjusted_rate_per_1000'],
+                               [np.nan, np.nan, 10.0 / (0.15 / citywide), 10.0 / (0.5 / citywide), np.nan])
+
+def test_enrich_without_layers_appends_empty_columns():
+    stats = pd.DataFrame({'census_tract_id': TRACT_IDS[:2], 'total_crimes': [1, 2]})
+    enriched = TractEnrichment(TRACT_IDS).enrich(stats)
+    assert enriched[ENRICHMENT_COLUMNS].isna().all().all()
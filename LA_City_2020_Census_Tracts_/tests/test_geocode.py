@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from CrimeCensusTract import SNAP_COLUMN, _build_locator, _geocode_chunk
+
+def test_point_on_boundary_counts_as_snapped(tracts):
+    locator = _build_locator(tracts)
+    # 多边形顶点不被contains_xy包含, 以距离0吸附
+    lon, lat = shapely.get_coordinates(tracts.geometry.iloc[0])[0]
+    chunk = pd.DataFrame({
+        'crime_id': [1, 2], 'latitude': [lat, 34.0522], 'longitude': [lon, -118.2437],
+    })
+    assert locator.locate_indices(np.array([lat]), np.array([lon]))[0] == -1
+
+    chunk, snapped = _geocode_chunk(chunk, locator, snap_distance=50.0)
+    assert chunk['census_tract_id'].notna().all()
+    assert chunk[SNAP_COLUMN].tolist() == [0.0, 0.0]
+    assert snapped == 1
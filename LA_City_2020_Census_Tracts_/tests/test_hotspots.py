@@ -0,0 +1,92 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from CrimeHotspots import HotspotEngine, TractWeights
+
+SIZE = 4
+
+@pytest.fixture(scope='module')
+def lattice():
+    """4x4单位正方形网格加一个孤立的正方形, 投影坐标"""
+    squares = [shapely.box(col, row, col + 1, row + 1) for row in range(SIZE) for col in range(SIZE)]
+    squares.append(shapely.box(10, 10, 11, 11))
+    tract_ids = [f"{i:06d}" for i in range(len(squares))]
+    return gpd.GeoDataFrame({'CT20': tract_ids}, geometry=squares, crs="EPSG:32611")
+
+@pytest.fixture(scope='module')
+def weights(lattice):
+    return TractWeights.queen(lattice, tolerance=0)
+
+@pytest.fixture(scope='module')
+def values():
+    # 左下角2x2为高值, 两个变量 (第二个为第一个的线性变换, 统计量应相同)
+    grid = np.ones((SIZE, SIZE))
+    grid[:2, :2] = 10
+    x = np.append(grid.ravel(), 3.0)
+    return np.column_stack([x, 2 * x + 5])
+
+def _dense(weights):
+    n = len(weights.tract_ids)
+    w = np.zeros((n, n))
+    w[weights._rows, weights.indices] = 1
+    return w
+
+def test_queen_weights(weights):
+    k = weights.cardinalities.reshape(-1)
+    assert k[:SIZE * SIZE].reshape(SIZE, SIZE).tolist() == [[3, 5, 5, 3], [5, 8, 8, 5], [5, 8, 8, 5], [3, 5, 5, 3]]
+    assert weights.islands().tolist() == [SIZE * SIZE]
+    w = _dense(weights)
+    assert (w == w.T).all() and not w.diagonal().any()
+    assert weights.lag(np.arange(17.0), standardized=False).tolist() == (w @ np.arange(17.0)).tolist()
+
+def test_statistics_match_dense_formulas(weights, values):
+    engine = HotspotEngine(weights, permutations=99, seed=0)
+    result = engine.analyze(values)
+    w = _dense(weights)
+    n = len(values)
+    x = values[:, 0]
+    mean, std = x.mean(), x.std()
+
+    # Gi*: 包含自身的二值权重
+    w_star = w + np.eye(n)
+    k_star = w_star.sum(axis=1)
+    gi = (w_star @ x - mean * k_star) / (std * np.sqrt((n * k_star - k_star ** 2) / (n - 1)))
+    # Local Moran's I: 行标准化权重, m2 = sum(z^2) / (n - 1)
+    z = x - mean
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moran = z * ((w / w.sum(axis=1, keepdims=True)) @ z) / ((z ** 2).sum() / (n - 1))
+
+    island = SIZE * SIZE
+    np.testing.assert_allclose(result['gi_z'][:island, 0], gi[:island])
+    np.testing.assert_allclose(result['moran_i'][:island, 0], moran[:island])
+    for name in ('gi_z', 'moran_i', 'p_value'):
+        assert np.isnan(result[name][island]).all()
+        # 线性变换不改变标准化的统计量和置换检验
+        np.testing.assert_allclose(result[name][:, 1], result[name][:, 0], equal_nan=True)
+    assert result['quadrant'][island].tolist() == [0, 0]
+
+    # 高值角落: Gi*为正, Moran's I为HH; 与之相邻的低值tract为LH
+    assert (result['gi_z'][0, 0] > 0) and result['quadrant'][0, 0] == 1
+    assert result['quadrant'][2, 0] == 2
+    assert result['quadrant'][SIZE * SIZE - 1, 0] == 3
+
+def test_permutation_p_values(weights, values):
+    engine = HotspotEngine(weights, permutations=199, seed=4)
+    result = engine.analyze(values)
+    x = values[:, 0]
+    k = weights.cardinalities
+    observed = weights.lag(x, standardized=False)
+    for i in range(SIZE * SIZE):
+        # 条件置换: i的值固定, 邻居从其余tract中不放回抽取
+        draws = engine.draws[:, :k[i]]
+        sums = x[draws + (draws >= i)].sum(axis=1)
+        greater = (sums >= observed[i] - 1e-9).sum()
+        less = (sums <= observed[i] + 1e-9).sum()
+        assert result['p_value'][i, 0] == pytest.approx((min(greater, less) + 1) / 200)
+    assert result['p_value'][0, 0] <= 0.05
+
+    parallel = HotspotEngine(weights, permutations=199, seed=4, workers=2).analyze(values)
+    for name, array in result.items():
+        np.testing.assert_array_equal(parallel[name], array)
@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+import pytest
+
+from CrimeCensusTract import ingest_incremental, iter_crime_tracts
+from conftest import source_row
+
+ROWS = [
+    source_row(1),
+    source_row(2, crime_type='ROBBERY'),
+    source_row(3, date_occ='03/05/2020 12:00:00 AM'),
+    source_row(4, lat='0', lon='0'),
+]
+
+def _snapshot(paths):
+    """每个文件(或目录中每个文件)的内容和修改时间"""
+    files = {}
+    for path in paths:
+        names = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for name in names:
+            with open(name, 'rb') as f:
+                files[name] = (f.read(), os.stat(name).st_mtime_ns)
+    return files
+
+@pytest.fixture
+def ingest(tracts, tmp_path):
+    def run(source, output_format):
+        output = str(tmp_path / ('out.parquet' if output_format == 'parquet' else 'out.csv'))
+        stats_df = ingest_incremental(
+            source, tracts, output, str(tmp_path / 'stats.csv'), str(tmp_path / 'state.json'),
+            str(tmp_path / 'stats.npz'), chunk_size=2, output_format=output_format,
+            cube_counts_path=str(tmp_path / 'cube_counts.npz'), cube_path=str(tmp_path / 'cube.npy'))
+        return output, stats_df
+    return run
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_rerun_without_new_records_changes_nothing(ingest, write_source, tmp_path, output_format):
+    source = write_source(ROWS)
+    output, first = ingest(source, output_format)
+    kept = [output] + [str(tmp_path / name) for name in
+                       ('state.json', 'stats.npz', 'cube_counts.npz', 'cube.npy', 'cube.npy.json')]
+    before = _snapshot(kept)
+
+    _, second = ingest(source, output_format)
+    assert _snapshot(kept) == before
+    pd.testing.assert_frame_equal(second, first)
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_appended_records_are_added_once(ingest, write_source, output_format):
+    output, _ = ingest(write_source(ROWS), output_format)
+    ingest(write_source(ROWS), output_format)
+    _, stats_df = ingest(write_source(ROWS + [source_row(5), source_row(6, crime_type='ROBBERY')]), output_format)
+
+    records = pd.concat(iter_crime_tracts(output), ignore_index=True)
+    # 坐标为0的记录在关联时被丢弃
+    assert records['crime_id'].tolist() == [1, 2, 3, 5, 6]
+    counts = records.dropna(subset=['census_tract_id']).groupby('census_tract_id').size()
+    assert stats_df.set_index('census_tract_id')['total_crimes'].to_dict() == counts.to_dict()
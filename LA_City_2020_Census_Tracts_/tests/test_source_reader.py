@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import CrimeSourceReader
+from CrimeCensusTract import COLUMN_MAP, process_crime_data
+from CrimeSourceReader import iter_source_chunks, read_source_text
+from conftest import source_row
+
+COLUMNS = list(COLUMN_MAP)
+
+@pytest.fixture(params=['pyarrow', 'pandas'])
+def backend(request, monkeypatch):
+    if request.param == 'pandas':
+        monkeypatch.setattr(CrimeSourceReader, 'pa', None)
+    elif CrimeSourceReader.pa is None:
+        pytest.skip("pyarrow is not installed")
+    return request.param
+
+@pytest.fixture
+def malformed_csv(write_source):
+    return write_source([
+        source_row(1),
+        source_row(2, date_occ='2020-13-45', time_occ='abc'),
+        source_row(3, time_occ='2359'),
+    ])
+
+def test_iter_source_chunks_coerces_malformed_cells(backend, malformed_csv):
+    chunk = pd.concat(list(iter_source_chunks(malformed_csv, COLUMNS)), ignore_index=True)
+    assert chunk['DR_NO'].tolist() == [1, 2, 3]
+    assert chunk['DATE OCC'].isna().tolist() == [False, True, False]
+    assert chunk['DATE OCC'][0] == pd.Timestamp('2020-03-01')
+    # 含无法解析的值时整数列保留为float64
+    assert chunk['TIME OCC'].dtype == np.float64
+    assert chunk['TIME OCC'].isna().tolist() == [False, True, False]
+    assert chunk['TIME OCC'][2] == 2359
+
+def test_read_source_text_coerces_malformed_cells(backend, malformed_csv):
+    with open(malformed_csv) as f:
+        chunk = read_source_text(f.read(), COLUMNS)
+    assert chunk['DATE OCC'].isna().tolist() == [False, True, False]
+    assert chunk['TIME OCC'].isna().tolist() == [False, True, False]
+
+def test_clean_integer_codes_keep_narrow_dtypes(backend, write_source):
+    chunk = next(iter_source_chunks(write_source([source_row(1), source_row(2)]), ['TIME OCC', 'Premis Cd']))
+    assert chunk['TIME OCC'].dtype == np.int16
+    # 源数据中部分编码写成101.0
+    assert chunk['Premis Cd'].dtype == np.int16
+    assert chunk['Premis Cd'].tolist() == [101, 101]
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('validate', [False, True])
+def test_process_crime_data_keeps_going_past_malformed_row(tracts, malformed_csv, tmp_path, workers, validate):
+    output = str(tmp_path / 'out.csv')
+    process_crime_data(malformed_csv, tracts, output, chunk_size=2, workers=workers, validate=validate,
+                       reject_csv=str(tmp_path / 'rejected.csv'))
+    result = pd.read_csv(output)
+    expected = [1, 3] if validate else [1, 2, 3]
+    assert result['crime_id'].tolist() == expected
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CrimeStatistics import CrimeStatistics
+
+TRACT_IDS = ['101100', '101200', '101300', '101400']
+
+@pytest.fixture(scope='module')
+def records():
+    rng = np.random.default_rng(0)
+    n = 600
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 4 * 365, n), unit='D')
+    frame = pd.DataFrame({
+        # 不在tract索引中的编号和缺失编号不计入
+        'census_tract_id': rng.choice(TRACT_IDS + ['999999', None], n),
+        'crime_type': rng.choice(['BURGLARY', 'ROBBERY', 'VANDALISM', None], n),
+        'date': dates.strftime('%Y-%m-%d').to_numpy(dtype=object),
+        'time_occ': rng.integers(0, 2400, n),
+    })
+    frame.loc[::17, 'date'] = ''
+    frame.loc[::23, 'time_occ'] = 9999
+    return frame
+
+def _engine(frames):
+    stats = CrimeStatistics(TRACT_IDS, [f"tract {i}" for i in TRACT_IDS])
+    for frame in frames:
+        stats.add_frame(frame)
+    return stats
+
+def _brute_force(records):
+    frame = records[records['census_tract_id'].isin(TRACT_IDS)].copy()
+    dates = pd.to_datetime(frame['date'], format='%Y-%m-%d', errors='coerce')
+    frame['year'] = dates.dt.year
+    frame['weekday'] = dates.dt.dayofweek
+    frame['hour'] = np.where(frame['time_occ'] < 2400, frame['time_occ'] // 100, np.nan)
+    return frame
+
+def test_counts_match_brute_force(records):
+    stats = _engine([records])
+    frame = _brute_force(records)
+
+    typed = frame[frame['crime_type'].notna()]
+    matrix = pd.crosstab(typed['census_tract_id'], typed['crime_type'])
+    expected = matrix.reindex(index=TRACT_IDS, columns=stats.crime_types, fill_value=0).to_numpy()
+    np.testing.assert_array_equal(stats.matrix(), expected)
+    np.testing.assert_array_equal(
+        stats.totals(), frame['census_tract_id'].value_counts().reindex(TRACT_IDS, fill_value=0).to_numpy())
+
+    in_2021 = typed[typed['year'] == 2021]
+    expected = pd.crosstab(in_2021['census_tract_id'], in_2021['crime_type'])
+    np.testing.assert_array_equal(
+        stats.matrix(years=2021), expected.reindex(index=TRACT_IDS, columns=stats.crime_types, fill_value=0).to_numpy())
+
+    for by, bins in [('hour', range(24)), ('weekday', range(7))]:
+        known = frame[frame[by].notna()]
+        expected = pd.crosstab(known['census_tract_id'], known[by].astype(int))
+        histogram = stats.histogram(by)
+        assert histogram.index.tolist() == TRACT_IDS
+        np.testing.assert_array_equal(
+            histogram.to_numpy(), expected.reindex(index=TRACT_IDS, columns=list(bins), fill_value=0).to_numpy())
+
+def test_chunks_and_merge_match_single_pass(records):
+    single = _engine([records])
+    chunked = _engine([records[:250], records[250:]])
+    merged = _engine([records[:100]])
+    merged.merge(_engine([records[100:]]))
+    for stats in (chunked, merged):
+        np.testing.assert_array_equal(stats.keys, single.keys)
+        np.testing.assert_array_equal(stats.counts, single.counts)
+        pd.testing.assert_frame_equal(stats.to_frame(top_k=None), single.to_frame(top_k=None))
+
+def test_save_load_round_trip(records, tmp_path):
+    stats = _engine([records])
+    path = str(tmp_path / 'stats.npz')
+    stats.save(path)
+    loaded = CrimeStatistics.load(path)
+
+    np.testing.assert_array_equal(loaded.keys, stats.keys)
+    np.testing.assert_array_equal(loaded.counts, stats.counts)
+    assert loaded.crime_types == stats.crime_types
+    pd.testing.assert_frame_equal(loaded.to_frame(top_k=2), stats.to_frame(top_k=2))
+    pd.testing.assert_frame_equal(loaded.histogram('month'), stats.histogram('month'))
+    # 载入后新出现的类型追加到词表末尾, 不覆盖已有编码
+    loaded.add_frame(records.assign(crime_type='ARSON'))
+    assert loaded.crime_types == stats.crime_types + ['ARSON']
+
+    with np.load(path) as data:
+        arrays = dict(data)
+    arrays['layout'] = arrays['layout'] + 1
+    np.savez(path, **arrays)
+    with pytest.raises(ValueError):
+        CrimeStatistics.load(path)
@@ -0,0 +1,40 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+
+from CoordinatetoCensusTract import MISSING_TRACT, TractLocator
+from CensusTractLoader import load_tracts
+from conftest import SHAPEFILE
+
+@pytest.fixture(scope='module')
+def sample_points(tracts):
+    min_lon, min_lat, max_lon, max_lat = tracts.total_bounds
+    rng = np.random.default_rng(0)
+    lats = np.append(rng.uniform(min_lat, max_lat, 2000), np.nan)
+    lons = np.append(rng.uniform(min_lon, max_lon, 2000), -118.2437)
+    return lats, lons
+
+def _sjoin_indices(tracts, lats, lons):
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lons, lats), crs="EPSG:4326")
+    joined = gpd.sjoin(points, tracts, how="left", predicate="within")
+    # 与TractLocator一致: 多个匹配时取第一个tract
+    joined = joined.sort_values('index_right')
+    joined = joined[~joined.index.duplicated()].sort_index()
+    return joined['index_right'].fillna(-1).to_numpy(dtype=np.int32)
+
+@pytest.mark.parametrize('crs', ['EPSG:4326', None])
+def test_locate_indices_matches_sjoin(tracts, sample_points, crs):
+    lats, lons = sample_points
+    locator = TractLocator(tracts if crs else load_tracts(SHAPEFILE, crs=None))
+    expected = _sjoin_indices(tracts.reset_index(drop=True), lats, lons)
+
+    indices = locator.locate_indices(lats, lons)
+    assert (expected >= 0).sum() > 500
+    np.testing.assert_array_equal(indices, expected)
+
+    ct20, _ = locator.locate_many(lats, lons)
+    hit = expected >= 0
+    assert ct20[hit].tolist() == tracts['CT20'].to_numpy()[expected[hit]].tolist()
+    assert (ct20[~hit] == MISSING_TRACT).all()
+    assert [locator.locate(lats[i], lons[i]) for i in range(20)] == [
+        None if i < 0 else int(i) for i in expected[:20]]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CrimeCensusTract import process_crime_data
+from CrimeValidation import DuplicateFilter, REASON_COLUMN, validate_records
+from conftest import source_row
+
+BOUNDS = (-119.0, 33.5, -117.5, 34.5)
+
+def test_validate_records_parses_raw_date_and_time():
+    chunk = pd.DataFrame({
+        'crime_id': [1, 2, 3],
+        'date': ['03/01/2020 12:00:00 AM', '2020-13-45', '03/01/2020 12:00:00 AM'],
+        'time_occ': ['1200', '0930', 'abc'],
+        'latitude': [34.05, 34.05, 34.05],
+        'longitude': [-118.24, -118.24, -118.24],
+    })
+    accepted, rejected, _ = validate_records(chunk, BOUNDS, today='2024-01-01')
+    assert accepted['crime_id'].tolist() == [1]
+    assert accepted['date'].dtype == 'datetime64[s]'
+    assert accepted['date'].tolist() == [pd.Timestamp('2020-03-01')]
+    assert accepted['time_occ'].dtype == np.int16
+    assert rejected[REASON_COLUMN].tolist() == ['invalid_date', 'invalid_time']
+    # 被拒绝的记录保留原始文本
+    assert rejected['date'].tolist() == ['2020-13-45', '03/01/2020 12:00:00 AM']
+    assert rejected['time_occ'].tolist() == ['0930', 'abc']
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_malformed_date_and_time_are_rejected(tracts, write_source, tmp_path, workers):
+    source = write_source([
+        source_row(1),
+        source_row(2, date_occ='2020-13-45'),
+        source_row(3, time_occ='abc'),
+        source_row(4, time_occ='2399'),
+    ])
+    output = str(tmp_path / 'out.csv')
+    reject_csv = str(tmp_path / 'crime_data_rejected.csv')
+    process_crime_data(source, tracts, output, chunk_size=2, workers=workers, validate=True, reject_csv=reject_csv)
+
+    assert pd.read_csv(output)['crime_id'].tolist() == [1]
+    rejected = pd.read_csv(reject_csv, dtype=str)
+    assert rejected['crime_id'].tolist() == ['2', '3', '4']
+    assert rejected[REASON_COLUMN].tolist() == ['invalid_date', 'invalid_time', 'invalid_time']
+    assert rejected['date'][0] == '2020-13-45'
+    assert rejected['time_occ'][1] == 'abc'
+
+def test_duplicate_filter_merges_runs():
+    dedup = DuplicateFilter()
+    rng = np.random.default_rng(0)
+    ids = rng.permutation(5000)
+    for start in range(0, 5000, 300):
+        assert not dedup.mark(ids[start:start + 300]).any()
+    assert len(dedup) == 5000
+    assert len(dedup.runs) <= 5
+    assert all((np.diff(run) > 0).all() for run in dedup.runs)
+    assert dedup.mark(np.array([ids[0], 5000.0, 5000.0, np.nan])).tolist() == [True, False, True, False]
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_rejected_record_does_not_make_later_copy_duplicate(tracts, write_source, tmp_path, workers):
+    source = write_source([
+        source_row(1, date_occ='2020-13-45'),
+        source_row(2),
+        source_row(1),
+        source_row(2),
+    ])
+    output = str(tmp_path / 'out.csv')
+    reject_csv = str(tmp_path / 'crime_data_rejected.csv')
+    process_crime_data(source, tracts, output, chunk_size=2, workers=workers, validate=True, reject_csv=reject_csv)
+
+    assert pd.read_csv(output)['crime_id'].tolist() == [2, 1]
+    rejected = pd.read_csv(reject_csv, dtype=str)
+    assert rejected['crime_id'].tolist() == ['1', '2']
+    assert rejected[REASON_COLUMN].tolist() == ['invalid_date', 'duplicate_id']